@@ -1,27 +1,43 @@
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from config import settings
 from models.user import TokenData, UserInDB
-from database import get_database
+from repositories import Repositories, get_repositories
+from passwords import pwd_context, password_hasher
+from cache import TTLCache
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
+# Authenticated users keyed by token subject (email)
+principal_cache = TTLCache(
+    max_size=settings.principal_cache_max_size,
+    ttl=settings.principal_cache_ttl_seconds,
+)
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a password against a hash"""
+    """Verify a password against a hash (blocking, use averify_password in handlers)"""
     return pwd_context.verify(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
-    """Hash a password"""
+    """Hash a password (blocking, use aget_password_hash in handlers)"""
     return pwd_context.hash(password)
 
 
+async def averify_password(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password in the hashing worker pool"""
+    return await password_hasher.verify(plain_password, hashed_password)
+
+
+async def aget_password_hash(password: str) -> str:
+    """Hash a password in the hashing worker pool"""
+    return await password_hasher.hash(password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create JWT access token"""
     to_encode = data.copy()
@@ -34,7 +50,39 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db = Depends(get_database)) -> UserInDB:
+def user_token_claims(user: dict) -> dict:
+    """JWT claims for a user document; uid/role/name let claims mode skip the lookup"""
+    return {
+        "sub": user["email"],
+        "uid": user.get("id"),
+        "role": user.get("role", "client"),
+        "name": user.get("full_name"),
+    }
+
+
+def invalidate_principal(email: str):
+    """Drop a cached user; call whenever a user document changes"""
+    principal_cache.delete(email)
+
+
+def _principal_from_claims(payload: dict) -> Optional[UserInDB]:
+    """Build the current user straight from signed token claims"""
+    if payload.get("uid") is None or payload.get("role") is None:
+        return None
+    # Claims are signed by us, so skip validation; there is no password hash here
+    return UserInDB.model_construct(
+        id=payload["uid"],
+        email=payload["sub"],
+        full_name=payload.get("name") or "",
+        role=payload["role"],
+        hashed_password="",
+    )
+
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    repos: Repositories = Depends(get_repositories)
+) -> UserInDB:
     """Get current authenticated user"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -50,7 +98,16 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db = Depends(get
     except JWTError:
         raise credentials_exception
     
-    user = await db.users.find_one({"email": token_data.email})
+    if settings.auth_trust_token_claims:
+        principal = _principal_from_claims(payload)
+        if principal is not None:
+            return principal
+    
+    cached_user = principal_cache.get(token_data.email)
+    if cached_user is not None:
+        return cached_user
+    
+    user = await repos.users.by_email(token_data.email)
     if user is None:
         raise credentials_exception
     
@@ -58,7 +115,9 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db = Depends(get
     from utils import serialize_doc
     user = serialize_doc(user)
     
-    return UserInDB(**user)
+    current_user = UserInDB(**user)
+    principal_cache.set(token_data.email, current_user)
+    return current_user
 
 
 async def get_current_active_user(current_user: UserInDB = Depends(get_current_user)) -> UserInDB:
@@ -0,0 +1,290 @@
+"""
+Benchmark: latency and throughput of the main endpoints through the whole
+app (routing, auth, validation, serialization and the database).
+
+--backend memory runs the app on the in-process database (memory_db.py), so
+no mongod is needed and the numbers show the cost of the Python side alone;
+--backend mongo runs the same requests against <database_name>_bench.
+Every scenario sends --requests requests from --concurrency concurrent
+clients; on the memory backend nothing waits on I/O, so they take turns
+rather than overlap. --no-cache turns the response cache off, --profile prints the
+functions that took the most time. Requires httpx.
+
+    python benchmarks/bench_asgi.py --backend memory --requests 2000 --concurrency 16
+    python benchmarks/bench_asgi.py --backend memory --scenarios search,near --profile
+"""
+import argparse
+import asyncio
+import cProfile
+import io
+import pstats
+import random
+import time
+from datetime import datetime
+
+from common import Timer, asgi_client, print_results, summarize, use_benchmark_database
+
+from config import settings
+
+CATEGORIES = ["Restaurant", "Hotel", "Tour", "Museum", "Bar", "Shop"]
+CITIES = [("Cusco", -13.53, -71.97), ("Lima", -12.05, -77.04), ("Arequipa", -16.41, -71.54)]
+WORDS = ["coffee", "andean", "alpaca", "sunset", "market", "trek", "ceviche", "pisco", "colonial", "garden"]
+
+
+def business_doc(business_id: int, owner_id: int, rng: random.Random, now: datetime) -> dict:
+    from models.business import derived_fields
+
+    city, lat, lng = rng.choice(CITIES)
+    words = rng.sample(WORDS, 3)
+    business = {
+        "id": business_id,
+        "name": f"{words[0].title()} {words[1].title()} {business_id}",
+        "description": f"A {words[2]} place in {city}",
+        "category": rng.choice(CATEGORIES),
+        "location": {
+            "address": f"{business_id} Main St", "city": city, "state": city, "country": "PE",
+            "latitude": lat + rng.uniform(-0.1, 0.1), "longitude": lng + rng.uniform(-0.1, 0.1),
+        },
+        "price_level": rng.randint(1, 4),
+        "images": [f"/images/{business_id}-{n}.jpg" for n in range(3)],
+        "tags": words,
+        "owner_id": str(owner_id),
+        "rating": 0.0,
+        "review_count": 0,
+        "views": 0,
+        "created_at": now,
+        "updated_at": now,
+        "is_active": True,
+    }
+    business.update(derived_fields(business))
+    return business
+
+
+async def seed(db, args) -> dict:
+    """Fill the database; returns what the scenarios pick their ids from"""
+    from repositories import Repositories
+    from routes.reviews import update_business_rating
+
+    rng = random.Random(7)
+    now = datetime.utcnow()
+    repos = Repositories(db)
+    for name in ("users", "businesses", "reviews", "trips", "counters", "owner_stats"):
+        await db.drop_collection(name)
+    await repos.ensure_indexes()
+
+    owners = max(1, args.users // 10)
+    users = [
+        {
+            "id": i, "email": f"user{i}@example.com", "full_name": f"User {i}",
+            "role": "business" if i <= owners else "client",
+            "hashed_password": "x", "is_active": True, "created_at": now,
+        }
+        for i in range(1, args.users + 1)
+    ]
+    await db.users.insert_many(users)
+    businesses = [business_doc(i, rng.randint(1, owners), rng, now) for i in range(1, args.businesses + 1)]
+    await db.businesses.insert_many(businesses)
+
+    reviews = []
+    for business_id in range(1, args.businesses + 1):
+        for user_id in rng.sample(range(1, args.users + 1), min(args.reviews, args.users)):
+            reviews.append({
+                "id": len(reviews) + 1, "business_id": business_id, "user_id": str(user_id),
+                "user_name": f"User {user_id}", "rating": rng.randint(1, 5), "title": "Visit",
+                "text": "Benchmark review", "images": [], "helpful_count": 0,
+                "created_at": now, "updated_at": now,
+            })
+    if reviews:
+        await db.reviews.insert_many(reviews)
+    for business_id in range(1, args.businesses + 1):
+        await update_business_rating(business_id, repos)
+
+    trips = []
+    for user_id in range(1, args.users + 1):
+        for _ in range(args.trips):
+            trips.append({
+                "id": len(trips) + 1, "user_id": str(user_id), "name": f"Trip {len(trips) + 1}",
+                "destination": "Cusco", "start_date": "2024-06-01", "end_date": "2024-06-10",
+                "activities": [
+                    {"business_id": str(business_id), "business_name": businesses[business_id - 1]["name"]}
+                    for business_id in rng.sample(range(1, args.businesses + 1), args.activities)
+                ],
+                "created_at": now, "updated_at": now,
+            })
+    if trips:
+        await db.trips.insert_many(trips)
+    for name, last_id in (("users", len(users)), ("businesses", len(businesses)),
+                          ("reviews", len(reviews)), ("trips", len(trips))):
+        await db.counters.insert_one({"collection_name": name, "sequence_value": last_id})
+    return {"users": users, "reviews": reviews, "trips": trips}
+
+
+class Workload:
+    """One method per scenario; each sends a single request"""
+
+    def __init__(self, client, data, args):
+        from auth import create_access_token, user_token_claims
+
+        self.client = client
+        self.args = args
+        self.reviews = data["reviews"]
+        self.trips = data["trips"]
+        self.tokens = {
+            user["id"]: {"Authorization": f"Bearer {create_access_token(data=user_token_claims(user))}"}
+            for user in data["users"]
+        }
+
+    def business_id(self, rng) -> int:
+        return rng.randint(1, self.args.businesses)
+
+    def user_headers(self, user_id) -> dict:
+        return self.tokens[int(user_id)]
+
+    async def list(self, rng):
+        return await self.client.get("/api/businesses/", params={"category": rng.choice(CATEGORIES)})
+
+    async def list_summary(self, rng):
+        return await self.client.get("/api/businesses/", params={"view": "summary", "limit": 50})
+
+    async def search(self, rng):
+        return await self.client.get("/api/businesses/", params={"search": rng.choice(WORDS), "search_mode": "text"})
+
+    async def near(self, rng):
+        _, lat, lng = rng.choice(CITIES)
+        return await self.client.get("/api/businesses/", params={"lat": lat, "lng": lng, "max_distance_km": 5})
+
+    async def business(self, rng):
+        return await self.client.get(f"/api/businesses/{self.business_id(rng)}")
+
+    async def batch(self, rng):
+        ids = ",".join(str(self.business_id(rng)) for _ in range(20))
+        return await self.client.get("/api/businesses/batch", params={"ids": ids})
+
+    async def reviews_of_business(self, rng):
+        return await self.client.get(f"/api/reviews/business/{self.business_id(rng)}")
+
+    async def my_trips(self, rng):
+        trip = rng.choice(self.trips)
+        return await self.client.get("/api/trips/", params={"expand": "businesses"},
+                                     headers=self.user_headers(trip["user_id"]))
+
+    async def view(self, rng):
+        return await self.client.post(f"/api/businesses/{self.business_id(rng)}/view")
+
+    async def update_trip(self, rng):
+        trip = rng.choice(self.trips)
+        body = {"name": f"Trip {rng.randint(1, 1000)}", "destination": "Cusco",
+                "start_date": "2024-06-01", "end_date": "2024-06-10"}
+        return await self.client.put(f"/api/trips/{trip['id']}", json=body, headers=self.user_headers(trip["user_id"]))
+
+    async def update_review(self, rng):
+        review = rng.choice(self.reviews)
+        body = {"business_id": str(review["business_id"]), "rating": rng.randint(1, 5),
+                "title": "Visit", "text": "Updated benchmark review", "images": []}
+        return await self.client.put(f"/api/reviews/{review['id']}", json=body,
+                                     headers=self.user_headers(review["user_id"]))
+
+
+SCENARIOS = {
+    "list": Workload.list,
+    "list summary": Workload.list_summary,
+    "search": Workload.search,
+    "near": Workload.near,
+    "business": Workload.business,
+    "batch": Workload.batch,
+    "reviews": Workload.reviews_of_business,
+    "trips expand": Workload.my_trips,
+    "view": Workload.view,
+    "update trip": Workload.update_trip,
+    "update review": Workload.update_review,
+}
+
+
+async def run(workload, scenario, requests: int, concurrency: int) -> dict:
+    latencies = []
+
+    async def client_loop(seed: int, count: int):
+        rng = random.Random(seed)
+        for _ in range(count):
+            with Timer() as timer:
+                response = await scenario(workload, rng)
+            latencies.append(timer.elapsed)
+            if response.status_code >= 400:
+                raise RuntimeError(f"{response.request.method} {response.request.url}: "
+                                   f"{response.status_code} {response.text}")
+
+    counts = [requests // concurrency + (1 if n < requests % concurrency else 0) for n in range(concurrency)]
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop(n, count) for n, count in enumerate(counts) if count))
+    elapsed = time.perf_counter() - start
+    return {"rps": round(len(latencies) / elapsed, 1), **summarize(latencies)}
+
+
+async def main(args):
+    settings.database_backend = args.backend
+    if args.no_cache:
+        settings.response_cache_ttl_seconds = 0
+    use_benchmark_database()
+
+    # Imported after the settings are final; the singletons read them at import
+    from database import Database
+    from events import event_recorder
+    from main import app
+    from view_counter import view_counter
+
+    await Database.connect_db()
+    db = Database.get_db()
+    view_counter.start()
+    await event_recorder.start()
+    try:
+        start = time.perf_counter()
+        data = await seed(db, args)
+        print(f"Seeded {args.businesses} businesses, {len(data['reviews'])} reviews and "
+              f"{len(data['trips'])} trips ({args.backend}) in {time.perf_counter() - start:.1f}s")
+
+        names = [name.strip() for name in args.scenarios.split(",")] if args.scenarios else list(SCENARIOS)
+        unknown = [name for name in names if name not in SCENARIOS]
+        if unknown:
+            raise SystemExit(f"Unknown scenarios: {', '.join(unknown)} (choose from {', '.join(SCENARIOS)})")
+
+        profiler = cProfile.Profile() if args.profile else None
+        results = {}
+        async with asgi_client(app) as client:
+            workload = Workload(client, data, args)
+            for name in names:
+                if profiler:
+                    profiler.enable()
+                results[name] = await run(workload, SCENARIOS[name], args.requests, args.concurrency)
+                if profiler:
+                    profiler.disable()
+        print_results(
+            f"{args.requests} requests per scenario, concurrency {args.concurrency}, {args.backend} backend"
+            + (", no response cache" if args.no_cache else ""),
+            results,
+        )
+        if profiler:
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats("tottime").print_stats(args.profile_top)
+            print(out.getvalue())
+    finally:
+        await event_recorder.stop()
+        await view_counter.stop()
+        await Database.client.drop_database(db.name)
+        await Database.close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["memory", "mongo"], default="memory")
+    parser.add_argument("--businesses", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--reviews", type=int, default=5, help="reviews per business")
+    parser.add_argument("--trips", type=int, default=2, help="trips per user")
+    parser.add_argument("--activities", type=int, default=8, help="activities per trip")
+    parser.add_argument("--requests", type=int, default=1000, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--scenarios", help="comma separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--no-cache", action="store_true", help="turn the response cache off")
+    parser.add_argument("--profile", action="store_true", help="profile the requests with cProfile")
+    parser.add_argument("--profile-top", type=int, default=30, help="functions to show with --profile")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,129 @@
+"""
+Benchmark: activity events at volume. Appends --events events (10M by
+default) spread over --businesses businesses and the last --days days,
+rolls them up, then compares reading a business's series from the rollups
+with counting its raw events for the same range.
+
+Uses <database_name>_bench; --store log writes the raw events to a
+temporary directory instead of a time-series collection. Requires MongoDB.
+
+    python benchmarks/bench_events.py --events 10000000 --businesses 1000 --days 30
+"""
+import argparse
+import asyncio
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from common import Timer, print_results, summarize, use_benchmark_database
+
+from database import Database
+from events import LogEventStore, MongoEventStore
+from indexes import IndexManager
+from models.event import EVENT_TYPES
+from rollups import INDEXES, EventRollup, read_rollups
+
+
+async def ingest(store, args, now):
+    """Append events in batches; returns events per second"""
+    rng = random.Random(42)
+    span = args.days * 86400
+    # Mostly views, like production traffic
+    weights = [0.9, 0.04, 0.06]
+    start = time.perf_counter()
+    for offset in range(0, args.events, args.batch):
+        size = min(args.batch, args.events - offset)
+        await store.append([
+            {
+                "ts": now - timedelta(seconds=rng.random() * span),
+                "type": rng.choices(EVENT_TYPES, weights)[0],
+                "business_id": rng.randint(1, args.businesses),
+            }
+            for _ in range(size)
+        ])
+    return args.events / (time.perf_counter() - start)
+
+
+async def raw_counts(db, business_id, start, end):
+    """What answering the query without rollups costs"""
+    pipeline = [
+        {"$match": {"meta.business_id": business_id, "ts": {"$gte": start, "$lt": end}}},
+        {"$group": {"_id": "$meta.type", "count": {"$sum": 1}}},
+    ]
+    return await db.events.aggregate(pipeline).to_list(length=None)
+
+
+async def time_reads(func, args, repeat):
+    rng = random.Random(7)
+    latencies = []
+    for _ in range(repeat):
+        with Timer() as timer:
+            await func(rng.randint(1, args.businesses))
+        latencies.append(timer.elapsed)
+    return summarize(latencies)
+
+
+async def main(args):
+    use_benchmark_database()
+    await Database.connect_db()
+    db = Database.get_db()
+    log_dir = tempfile.mkdtemp(prefix="events-bench-") if args.store == "log" else None
+    store = LogEventStore(log_dir) if log_dir else MongoEventStore(retention_days=args.days + 1, db=db)
+    rollup = EventRollup(store, lag=0, event_retention_days=args.days + 1, db=db)
+    now = datetime.utcnow()
+    try:
+        if not args.reuse:
+            for name in ("events", "event_rollups_hourly", "event_rollups_daily", "event_rollup_state"):
+                await db.drop_collection(name)
+            await store.setup()
+            await IndexManager().build(db, INDEXES)
+            if args.store == "mongo":
+                await db.events.create_index([("meta.business_id", 1), ("ts", 1)])
+
+            rate = await ingest(store, args, now)
+            print(f"Appended {args.events} events at {rate:,.0f} events/s")
+
+            with Timer() as timer:
+                hourly = await rollup.run_once(now)
+            print(f"Rolled up into {hourly} hourly buckets in {timer.elapsed:.1f}s")
+
+            # Steady state: one more run only recounts the current hour
+            with Timer() as timer:
+                await rollup.run_once(now + timedelta(minutes=1))
+            print(f"Incremental rollup run in {timer.elapsed * 1000:.1f}ms")
+
+        week = (now - timedelta(days=7), now)
+        month = (now - timedelta(days=args.days), now)
+        results = {
+            "7d hourly rollups": await time_reads(
+                lambda business_id: read_rollups(db, business_id, *week, "hour"), args, args.repeat),
+            f"{args.days}d daily rollups": await time_reads(
+                lambda business_id: read_rollups(db, business_id, *month, "day"), args, args.repeat),
+        }
+        if args.store == "mongo":
+            results["7d raw events"] = await time_reads(
+                lambda business_id: raw_counts(db, business_id, *week), args, args.repeat)
+            results[f"{args.days}d raw events"] = await time_reads(
+                lambda business_id: raw_counts(db, business_id, *month), args, args.repeat)
+        print_results(f"Series for one business ({args.events} events)", results)
+    finally:
+        if log_dir:
+            shutil.rmtree(log_dir, ignore_errors=True)
+        if not args.keep:
+            await Database.client.drop_database(db.name)
+        await Database.close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=10_000_000)
+    parser.add_argument("--businesses", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--batch", type=int, default=10_000)
+    parser.add_argument("--store", choices=["mongo", "log"], default="mongo")
+    parser.add_argument("--repeat", type=int, default=100)
+    parser.add_argument("--keep", action="store_true", help="keep the seeded database")
+    parser.add_argument("--reuse", action="store_true", help="reuse a database kept with --keep")
+    asyncio.run(main(parser.parse_args()))
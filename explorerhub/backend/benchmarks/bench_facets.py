@@ -0,0 +1,133 @@
+"""
+Benchmark: sidebar facet counts (category, city, price level, rating band)
+plus the first page, computed with one query per facet value versus the
+single $facet aggregation of GET /api/businesses/facets, and that endpoint
+served from its cache.
+
+Seeds --businesses datagen businesses (with random ratings) into
+<database_name>_bench with the declared indexes. Requires MongoDB (or
+DATABASE_BACKEND=memory for small runs) and httpx.
+
+    python benchmarks/bench_facets.py --businesses 1000000
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime
+
+from common import Timer, asgi_client, print_results, summarize, use_benchmark_database
+
+import datagen
+from database import Database
+from main import app
+from repositories import Repositories
+from response_cache import response_cache
+from routes.businesses import (
+    BUSINESS_FACETS, BUSINESS_LIST_SORT, RATING_BANDS, business_facets, business_filter, business_shape,
+)
+
+SCENARIOS = {
+    "no filters": {},
+    "category": {"category": "Restaurant"},
+    "city + price": {"city": "lima", "city_mode": "prefix", "max_price": 2},
+    "rating + category": {"min_rating": 4.0, "category": "Activity"},
+    "text search": {"search": "coffee", "search_mode": "text"},
+}
+
+
+async def seed(db, total: int, batch_size: int, workers: int):
+    await db.businesses.drop()
+    rng = random.Random(7)
+    now = datetime.utcnow()
+
+    def businesses():
+        for business_id in range(1, total + 1):
+            business = datagen.business_doc(business_id, 1 + business_id % 50, rng, now)
+            business["rating"] = round(min(5.0, max(1.0, rng.gauss(3.9, 0.7))), 1)
+            business["review_count"] = rng.randint(1, 200)
+            yield business
+
+    progress = datagen.Progress({"businesses": total}, 10.0)
+    await datagen.bulk_insert(
+        db, (("businesses", batch) for batch in datagen.batched(businesses(), batch_size)), workers, progress
+    )
+    await Repositories(db).ensure_indexes()
+
+
+async def per_facet(repos: Repositories, params: dict) -> int:
+    """The facets with one count per facet value (after a distinct for the values); returns the queries made"""
+    collection = repos.businesses.collection
+    query = business_filter(search=params.get("search"), search_mode=params.get("search_mode", "regex"))
+    filters = business_filter(params.get("category"), params.get("city"), params.get("min_rating"),
+                              params.get("max_price"), city_mode=params.get("city_mode", "regex"))
+    del filters["is_active"]
+    _, _, projection = business_shape("summary", None)
+    await collection.count_documents({**query, **filters})
+    await repos.businesses.find({**query, **filters}, {**projection, "images": 1}, BUSINESS_LIST_SORT, 0, 20)
+    queries = 2
+    for name, (fields, value) in BUSINESS_FACETS.items():
+        other = {**query, **{key: condition for key, condition in filters.items() if key not in fields}}
+        if value is None:
+            conditions = [{"rating": {"$gte": band}} for band in RATING_BANDS]
+        else:
+            conditions = [{value[1:]: item} for item in await collection.distinct(value[1:], other)]
+            queries += 1
+        for condition in conditions:
+            await collection.count_documents({**other, **condition})
+        queries += len(conditions)
+    return queries
+
+
+async def main(args):
+    use_benchmark_database()
+    await Database.connect_db()
+    db = Database.get_db()
+    repos = Repositories(db)
+    try:
+        if not args.no_seed:
+            start = time.perf_counter()
+            await seed(db, args.businesses, args.batch_size, args.workers)
+            print(f"Seeded {args.businesses} businesses in {time.perf_counter() - start:.1f}s")
+
+        results = {}
+        async with asgi_client(app) as client:
+            for scenario, params in SCENARIOS.items():
+                latencies, queries = [], 0
+                for _ in range(args.repeat):
+                    with Timer() as timer:
+                        queries = await per_facet(repos, params)
+                    latencies.append(timer.elapsed)
+                results[f"{scenario}, per facet"] = {**summarize(latencies), "queries": queries}
+
+                latencies = []
+                for _ in range(args.repeat):
+                    with Timer() as timer:
+                        await business_facets(repos, **params)
+                    latencies.append(timer.elapsed)
+                results[f"{scenario}, $facet"] = {**summarize(latencies), "queries": 1}
+
+                await response_cache.invalidate("businesses")
+                latencies = []
+                for _ in range(args.repeat):
+                    with Timer() as timer:
+                        response = await client.get("/api/businesses/facets", params=params)
+                        response.raise_for_status()
+                    latencies.append(timer.elapsed)
+                results[f"{scenario}, cached"] = {**summarize(latencies), "queries": round(1 / args.repeat, 2)}
+        print_results(f"Facet counts and first page over {args.businesses} businesses", results)
+    finally:
+        if not args.keep:
+            await Database.client.drop_database(db.name)
+        await Database.close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--businesses", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--keep", action="store_true", help="keep the benchmark database for another run")
+    parser.add_argument("--no-seed", action="store_true", help="reuse the data of a --keep run")
+    asyncio.run(main(parser.parse_args()))
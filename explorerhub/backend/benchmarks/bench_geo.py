@@ -0,0 +1,126 @@
+"""
+Benchmark: "near me" search with $geoNear on the 2dsphere index versus
+downloading every business and filtering by distance client-side.
+
+Seeds --businesses random points around Lima into <database_name>_bench.
+Requires MongoDB and httpx.
+
+    python benchmarks/bench_geo.py --businesses 500000 --radius-km 5
+"""
+import argparse
+import asyncio
+import math
+import random
+import time
+from datetime import datetime
+
+from common import Timer, asgi_client, print_results, summarize, use_benchmark_database
+
+from database import Database
+from main import app
+from models.business import derived_fields
+
+BATCH_SIZE = 10000
+CENTER = (-12.0464, -77.0428)  # lat, lng
+SPREAD_DEGREES = 1.5
+CATEGORIES = ["Restaurant", "Nature", "Hotel", "Museum"]
+
+
+def haversine_m(lat1, lng1, lat2, lng2) -> float:
+    radius = 6371008.8
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * radius * math.asin(math.sqrt(a))
+
+
+async def seed(db, total: int):
+    await db.businesses.drop()
+    now = datetime.utcnow()
+    rng = random.Random(3)
+    for start in range(1, total + 1, BATCH_SIZE):
+        batch = []
+        for i in range(start, min(start + BATCH_SIZE, total + 1)):
+            business = {
+                "id": i,
+                "name": f"Business {i}",
+                "description": "Benchmark business",
+                "category": rng.choice(CATEGORIES),
+                "location": {
+                    "address": "1 Main St", "city": "Lima", "state": "Lima", "country": "PE",
+                    "latitude": CENTER[0] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES),
+                    "longitude": CENTER[1] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES),
+                },
+                "price_level": rng.randint(1, 4),
+                "images": [],
+                "tags": [],
+                "owner_id": "1",
+                "rating": round(rng.uniform(0, 5), 1),
+                "review_count": 0,
+                "views": 0,
+                "created_at": now,
+                "is_active": True,
+            }
+            business.update(derived_fields(business))
+            batch.append(business)
+        await db.businesses.insert_many(batch, ordered=False)
+    await db.businesses.create_index([("geo", "2dsphere"), ("category", 1)])
+
+
+async def client_side_near(db, lat, lng, radius_m, category, limit):
+    """What clients had to do before: fetch everything and filter locally"""
+    query = {"is_active": True}
+    if category:
+        query["category"] = category
+    matches = []
+    async for business in db.businesses.find(query, {"id": 1, "location": 1}):
+        location = business["location"]
+        distance = haversine_m(lat, lng, location["latitude"], location["longitude"])
+        if distance <= radius_m:
+            matches.append((distance, business["id"]))
+    matches.sort()
+    return matches[:limit]
+
+
+async def main(args):
+    use_benchmark_database()
+    await Database.connect_db()
+    db = Database.get_db()
+    try:
+        start = time.perf_counter()
+        await seed(db, args.businesses)
+        print(f"Seeded {args.businesses} businesses in {time.perf_counter() - start:.1f}s")
+
+        lat, lng = CENTER
+        params = {"lat": lat, "lng": lng, "max_distance_km": args.radius_km, "limit": args.limit}
+        results = {}
+        async with asgi_client(app) as client:
+            for name, extra in (("$geoNear", {}), ("$geoNear + category", {"category": "Hotel"})):
+                latencies = []
+                for _ in range(args.repeat):
+                    with Timer() as timer:
+                        response = await client.get("/api/businesses/", params={**params, **extra})
+                        response.raise_for_status()
+                    latencies.append(timer.elapsed)
+                results[name] = summarize(latencies)
+
+        latencies = []
+        for _ in range(max(1, args.repeat // 10)):
+            with Timer() as timer:
+                await client_side_near(db, lat, lng, args.radius_km * 1000, None, args.limit)
+            latencies.append(timer.elapsed)
+        results["client-side filter"] = summarize(latencies)
+
+        print_results(f"near search within {args.radius_km} km over {args.businesses} businesses", results)
+    finally:
+        await Database.client.drop_database(db.name)
+        await Database.close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--businesses", type=int, default=500_000)
+    parser.add_argument("--radius-km", type=float, default=5.0)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=30)
+    asyncio.run(main(parser.parse_args()))
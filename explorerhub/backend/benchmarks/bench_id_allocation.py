@@ -0,0 +1,135 @@
+"""
+Concurrency check and benchmark for block-allocated sequential IDs.
+
+Several processes each create documents in parallel coroutines through
+models.counter.get_next_sequence_value; the script fails if any ID is handed
+out twice and reports how many counter updates were needed.
+
+    # in-memory counters shared between processes
+    python benchmarks/bench_id_allocation.py --backend memory --processes 4 --documents 5000
+
+    # local mongod (<database_name>_bench, dropped afterwards)
+    python benchmarks/bench_id_allocation.py --backend mongo --block-size 100
+"""
+import argparse
+import asyncio
+import multiprocessing
+import sys
+import time
+
+from common import use_benchmark_database
+
+COLLECTION = "businesses"
+
+
+class SharedCounters:
+    """Stand-in for db.counters backed by a multiprocessing manager"""
+
+    def __init__(self, store, lock):
+        self.store = store
+        self.lock = lock
+
+    async def find_one_and_update(self, filter, update, upsert=False, return_document=None):
+        name = filter["collection_name"]
+        with self.lock:
+            value = self.store.get(name, 0) + update["$inc"]["sequence_value"]
+            self.store[name] = value
+        return {"collection_name": name, "sequence_value": value}
+
+
+class SharedDatabase:
+    name = "shared-memory"
+
+    def __init__(self, store, lock):
+        self.counters = SharedCounters(store, lock)
+
+
+async def create_documents(db, documents: int, concurrency: int, insert: bool):
+    from models.counter import get_next_sequence_value
+
+    ids = []
+    queue = iter(range(documents))
+
+    async def worker():
+        for _ in queue:
+            next_id = await get_next_sequence_value(COLLECTION, db)
+            if insert:
+                await db[COLLECTION].insert_one({"id": next_id})
+            ids.append(next_id)
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return ids
+
+
+def run_worker(args):
+    backend, documents, concurrency, block_size, store, lock = args
+    from models.counter import sequence_allocator
+    sequence_allocator.block_size = block_size
+
+    async def run():
+        if backend == "memory":
+            return await create_documents(SharedDatabase(store, lock), documents, concurrency, insert=False)
+        from database import Database
+        use_benchmark_database()
+        await Database.connect_db()
+        try:
+            return await create_documents(Database.get_db(), documents, concurrency, insert=True)
+        finally:
+            await Database.close_db()
+
+    ids = asyncio.run(run())
+    return ids, sequence_allocator.reservations
+
+
+async def prepare_mongo(drop: bool):
+    from database import Database
+    use_benchmark_database()
+    await Database.connect_db()
+    db = Database.get_db()
+    try:
+        await Database.client.drop_database(db.name)
+        if not drop:
+            await db[COLLECTION].create_index("id", unique=True)
+    finally:
+        await Database.close_db()
+
+
+def main(args):
+    if args.backend == "mongo":
+        asyncio.run(prepare_mongo(drop=False))
+
+    with multiprocessing.Manager() as manager:
+        store, lock = manager.dict(), manager.Lock()
+        jobs = [
+            (args.backend, args.documents, args.concurrency, args.block_size, store, lock)
+            for _ in range(args.processes)
+        ]
+        start = time.perf_counter()
+        with multiprocessing.Pool(args.processes) as pool:
+            results = pool.map(run_worker, jobs)
+        elapsed = time.perf_counter() - start
+
+    if args.backend == "mongo":
+        asyncio.run(prepare_mongo(drop=True))
+
+    all_ids = [i for ids, _ in results for i in ids]
+    reservations = sum(r for _, r in results)
+    duplicates = len(all_ids) - len(set(all_ids))
+    print(f"\nCreated {len(all_ids)} documents from {args.processes} processes in {elapsed:.2f}s")
+    print(f"  block size: {args.block_size}  counter updates: {reservations}  "
+          f"ids/update: {len(all_ids) / max(reservations, 1):.1f}")
+    print(f"  highest id: {max(all_ids)}  gaps: {max(all_ids) - len(set(all_ids))}  duplicates: {duplicates}")
+    if duplicates:
+        print("FAILED: duplicate IDs were allocated")
+        sys.exit(1)
+    print("OK: all IDs unique")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["memory", "mongo"], default="memory")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--documents", type=int, default=2500, help="documents per process")
+    parser.add_argument("--concurrency", type=int, default=50, help="coroutines per process")
+    parser.add_argument("--block-size", type=int, default=100)
+    main(parser.parse_args())
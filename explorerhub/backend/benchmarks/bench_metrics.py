@@ -0,0 +1,113 @@
+"""
+Benchmark: per-request cost of MetricsMiddleware.
+
+Calls ASGI apps directly (no HTTP client, no server) so the measurement is
+not drowned out by transport overhead:
+
+- "bare app": a minimal ASGI app with and without the middleware, which is
+  the middleware's own cost
+- "GET /": the real app's root route with and without the middleware
+
+Also times one database command through the command listener (including
+building the driver events). --check exits with status 1 when the
+middleware costs more than --budget-us microseconds. Needs no database.
+
+    python benchmarks/bench_metrics.py --requests 50000 --check
+"""
+import argparse
+import asyncio
+import sys
+import time
+from datetime import timedelta
+
+from common import print_results
+
+from pymongo import monitoring
+
+from config import settings
+from metrics import CommandMetrics, Metrics, MetricsMiddleware
+
+
+class FakeRoute:
+    path = "/bench/{item_id}"
+
+
+async def bare_app(scope, receive, send):
+    scope["route"] = FakeRoute
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain")]})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def http_scope(path: str) -> dict:
+    return {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"benchmark")], "client": ("127.0.0.1", 1), "server": ("benchmark", 80),
+    }
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+async def per_request_us(app, path: str, requests: int) -> float:
+    """Mean microseconds per call, best of three runs"""
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(requests):
+            await app(http_scope(path), receive, send)
+        best = min(best, (time.perf_counter() - start) / requests * 1e6)
+    return best
+
+
+def command_us(commands: int) -> float:
+    listener = CommandMetrics(Metrics())
+    address = ("benchmark", 27017)
+    reply = {"cursor": {"firstBatch": [{}] * 20, "id": 0}, "ok": 1}
+    duration = timedelta(microseconds=800)
+    start = time.perf_counter()
+    for request_id in range(commands):
+        listener.started(monitoring.CommandStartedEvent(
+            {"find": "businesses", "filter": {}}, "benchmark", request_id, address, request_id
+        ))
+        listener.succeeded(monitoring.CommandSucceededEvent(duration, reply, "find", request_id, address, request_id))
+    return (time.perf_counter() - start) / commands * 1e6
+
+
+async def main(args):
+    # The app is built without its own MetricsMiddleware so it can be compared with and without
+    settings.metrics_enabled = False
+    from main import app
+
+    results = {}
+    for name, inner, path in (("bare app", bare_app, "/bench/1"), ("GET /", app, "/")):
+        without = await per_request_us(inner, path, args.requests)
+        with_metrics = await per_request_us(MetricsMiddleware(inner, Metrics()), path, args.requests)
+        results[name] = {
+            "without_us": round(without, 2),
+            "with_us": round(with_metrics, 2),
+            "overhead_us": round(with_metrics - without, 2),
+        }
+    results["command listener"] = {"per_command_us": round(command_us(args.requests), 2)}
+    print_results(f"{args.requests} calls per measurement", results)
+
+    overhead = results["bare app"]["overhead_us"]
+    if overhead > args.budget_us:
+        print(f"\nMiddleware overhead {overhead}us exceeds the {args.budget_us}us budget")
+        if args.check:
+            sys.exit(1)
+    else:
+        print(f"\nMiddleware overhead {overhead}us is within the {args.budget_us}us budget")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--budget-us", type=float, default=50.0)
+    parser.add_argument("--check", action="store_true", help="exit with status 1 over budget")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,103 @@
+"""
+Benchmark: GET /api/businesses/ page 1 vs a deep page, using skip and using
+the X-Next-Cursor keyset cursor.
+
+Seeds --businesses documents (1M by default) into <database_name>_bench with
+the listing index, then times each request. Requires MongoDB and httpx.
+
+    python benchmarks/bench_pagination.py --businesses 1000000 --page 500
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime
+
+from common import Timer, asgi_client, print_results, summarize, use_benchmark_database
+
+from database import Database
+from main import app
+from routes.businesses import BUSINESS_LIST_SORT
+from utils import encode_cursor
+
+BATCH_SIZE = 10000
+
+
+async def seed(db, total: int):
+    await db.businesses.drop()
+    now = datetime.utcnow()
+    rng = random.Random(42)
+    for start in range(1, total + 1, BATCH_SIZE):
+        await db.businesses.insert_many([
+            {
+                "id": i,
+                "name": f"Business {i}",
+                "description": "Benchmark business",
+                "category": rng.choice(["Restaurant", "Nature", "Hotel", "Museum"]),
+                "location": {"address": "1 Main St", "city": "Lima", "state": "Lima", "country": "PE"},
+                "price_level": rng.randint(1, 4),
+                "images": [],
+                "tags": [],
+                "owner_id": "1",
+                "rating": round(rng.uniform(0, 5), 1),
+                "review_count": 0,
+                "views": 0,
+                "created_at": now,
+                "is_active": True,
+            }
+            for i in range(start, min(start + BATCH_SIZE, total + 1))
+        ], ordered=False)
+    await db.businesses.create_index([("is_active", 1), ("rating", -1), ("id", -1)])
+
+
+async def time_requests(client, params: dict, repeat: int):
+    latencies = []
+    for _ in range(repeat):
+        with Timer() as timer:
+            response = await client.get("/api/businesses/", params=params)
+            response.raise_for_status()
+        latencies.append(timer.elapsed)
+    return summarize(latencies)
+
+
+async def main(args):
+    use_benchmark_database()
+    await Database.connect_db()
+    db = Database.get_db()
+    try:
+        if not args.reuse:
+            start = time.perf_counter()
+            await seed(db, args.businesses)
+            print(f"Seeded {args.businesses} businesses in {time.perf_counter() - start:.1f}s")
+
+        skip = (args.page - 1) * args.limit
+        # Cursor pointing at the end of the page before the target page
+        previous = await db.businesses.find({"is_active": True}).sort(BUSINESS_LIST_SORT) \
+            .skip(skip - 1).limit(1).to_list(length=1)
+        cursor = encode_cursor({field: previous[0][field] for field, _ in BUSINESS_LIST_SORT})
+
+        results = {}
+        async with asgi_client(app) as client:
+            results["page 1"] = await time_requests(client, {"limit": args.limit}, args.repeat)
+            results[f"page {args.page}, skip"] = await time_requests(
+                client, {"limit": args.limit, "skip": skip}, args.repeat
+            )
+            results[f"page {args.page}, cursor"] = await time_requests(
+                client, {"limit": args.limit, "cursor": cursor}, args.repeat
+            )
+        print_results(f"GET /api/businesses/ over {args.businesses} businesses", results)
+    finally:
+        if not args.keep:
+            await Database.client.drop_database(db.name)
+        await Database.close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--businesses", type=int, default=1_000_000)
+    parser.add_argument("--page", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--keep", action="store_true", help="keep the seeded database")
+    parser.add_argument("--reuse", action="store_true", help="reuse a database kept with --keep")
+    asyncio.run(main(parser.parse_args()))
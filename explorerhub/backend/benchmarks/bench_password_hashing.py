@@ -0,0 +1,116 @@
+"""
+Benchmark: p99 latency of GET /api/businesses/ while logins run concurrently.
+Compares bcrypt on the event loop ("inline") against the hashing worker pool.
+
+Requires a reachable MongoDB (MONGODB_URL) and httpx. Uses the
+<database_name>_bench database and drops it afterwards.
+
+    python benchmarks/bench_password_hashing.py --duration 10 --login-workers 8
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+from common import asgi_client, print_results, summarize, use_benchmark_database
+
+from database import Database
+from passwords import password_hasher, _hash
+from main import app
+
+EMAIL = "bench-login@example.com"
+PASSWORD = "benchmark-password"
+
+
+async def seed(db, businesses: int):
+    await db.users.delete_many({})
+    await db.businesses.delete_many({})
+    await db.users.insert_one({
+        "id": 1,
+        "email": EMAIL,
+        "full_name": "Bench User",
+        "role": "client",
+        "hashed_password": _hash(PASSWORD),
+    })
+    now = datetime.utcnow()
+    await db.businesses.insert_many([
+        {
+            "id": i,
+            "name": f"Business {i}",
+            "description": "Benchmark business",
+            "category": "Restaurant",
+            "location": {"address": "1 Main St", "city": "Lima", "state": "Lima", "country": "PE"},
+            "price_level": 1 + i % 4,
+            "images": [],
+            "tags": [],
+            "owner_id": "1",
+            "rating": (i % 50) / 10,
+            "review_count": 0,
+            "views": 0,
+            "created_at": now,
+            "is_active": True,
+        }
+        for i in range(1, businesses + 1)
+    ])
+
+
+async def run_scenario(client, duration: float, login_workers: int, readers: int):
+    deadline = time.perf_counter() + duration
+    read_latencies = []
+    logins = 0
+
+    async def login_loop():
+        nonlocal logins
+        while time.perf_counter() < deadline:
+            response = await client.post("/api/auth/login", json={"email": EMAIL, "password": PASSWORD})
+            response.raise_for_status()
+            logins += 1
+
+    async def read_loop():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = await client.get("/api/businesses/")
+            response.raise_for_status()
+            read_latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(
+        *[login_loop() for _ in range(login_workers)],
+        *[read_loop() for _ in range(readers)],
+    )
+    stats = summarize(read_latencies)
+    stats["logins_per_s"] = round(logins / duration, 1)
+    return stats
+
+
+async def main(args):
+    use_benchmark_database()
+    await Database.connect_db()
+    db = Database.get_db()
+    try:
+        await seed(db, args.businesses)
+        results = {}
+        async with asgi_client(app) as client:
+            results["idle (no logins)"] = await run_scenario(client, args.duration, 0, args.readers)
+            for kind in ("inline", args.executor):
+                password_hasher.shutdown()
+                password_hasher.executor_kind = kind
+                results[f"logins, {kind}"] = await run_scenario(
+                    client, args.duration, args.login_workers, args.readers
+                )
+        print_results("GET /api/businesses/ latency under concurrent logins", results)
+        print(f"  hasher: {password_hasher.stats()}")
+    finally:
+        password_hasher.shutdown()
+        await Database.client.drop_database(db.name)
+        await Database.close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per scenario")
+    parser.add_argument("--login-workers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--businesses", type=int, default=200)
+    parser.add_argument("--executor", choices=["thread", "process"], default="thread")
+    asyncio.run(main(parser.parse_args()))
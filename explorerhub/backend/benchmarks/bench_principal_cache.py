@@ -0,0 +1,76 @@
+"""
+Benchmark: authenticated request throughput (GET /api/auth/me) with the
+principal cache disabled, enabled, and with identity taken from token claims.
+
+Requires a reachable MongoDB (MONGODB_URL) and httpx. Uses the
+<database_name>_bench database and drops it afterwards.
+
+    python benchmarks/bench_principal_cache.py --duration 5 --concurrency 16
+"""
+import argparse
+import asyncio
+import time
+
+from common import asgi_client, print_results, summarize, use_benchmark_database
+
+from config import settings
+from database import Database
+from auth import principal_cache, create_access_token, user_token_claims
+from main import app
+
+USER = {"id": 1, "email": "bench-principal@example.com", "full_name": "Bench User", "role": "client"}
+
+
+async def run_scenario(client, token: str, duration: float, concurrency: int):
+    headers = {"Authorization": f"Bearer {token}"}
+    deadline = time.perf_counter() + duration
+    latencies = []
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = await client.get("/api/auth/me", headers=headers)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    stats = summarize(latencies)
+    stats["req_per_s"] = round(len(latencies) / duration, 1)
+    return stats
+
+
+async def main(args):
+    use_benchmark_database()
+    await Database.connect_db()
+    db = Database.get_db()
+    try:
+        await db.users.delete_many({})
+        await db.users.insert_one({**USER, "hashed_password": "unused"})
+        token = create_access_token(user_token_claims(USER))
+
+        results = {}
+        max_size = principal_cache.max_size
+        async with asgi_client(app) as client:
+            principal_cache.max_size = 0
+            principal_cache.clear()
+            results["no cache"] = await run_scenario(client, token, args.duration, args.concurrency)
+
+            principal_cache.max_size = max_size
+            results["principal cache"] = await run_scenario(client, token, args.duration, args.concurrency)
+
+            settings.auth_trust_token_claims = True
+            results["token claims"] = await run_scenario(client, token, args.duration, args.concurrency)
+            settings.auth_trust_token_claims = False
+
+        print_results("GET /api/auth/me throughput", results)
+        print(f"  principal cache: {principal_cache.stats()}")
+    finally:
+        await Database.client.drop_database(db.name)
+        await Database.close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,170 @@
+"""
+Benchmark: bytes read from MongoDB and response body size for the list
+endpoints in the full (detail) shape, view=summary and a fields= sparse
+fieldset. The public list is served from the response cache after the
+first request, so its latency mostly shows the cache.
+
+Seeds one owner with --businesses businesses, --reviews reviews and
+--trips trips (each with --activities activities) into
+<database_name>_bench. Requires MongoDB and httpx.
+
+    python benchmarks/bench_projections.py --businesses 200 --reviews 200 --trips 50
+"""
+import argparse
+import asyncio
+import random
+from datetime import datetime, timedelta
+
+import bson
+
+from common import Timer, asgi_client, print_results, summarize, use_benchmark_database
+
+from auth import get_current_active_user
+from database import Database
+from main import app
+from models.user import UserInDB
+from routes.businesses import business_shape
+from routes.trips import TRIP_SUMMARY_PROJECTION
+from models.review import Review, ReviewSummary
+from models.trip import Trip, TripSummary
+from serialization import response_shape
+
+OWNER_ID = "1"
+# The "my" endpoints return up to 100 documents; the public list is asked for as many
+PAGE_SIZE = 100
+LONG_TEXT = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 8
+
+
+
+async def seed(db, args):
+    for name in ("businesses", "reviews", "trips"):
+        await db[name].drop()
+    rng = random.Random(42)
+    now = datetime.utcnow()
+
+    await db.businesses.insert_many([
+        {
+            "id": i,
+            "name": f"Business {i}",
+            "description": LONG_TEXT,
+            "category": rng.choice(["Restaurant", "Nature", "Hotel", "Museum"]),
+            "location": {"address": f"{i} Main St", "city": "Lima", "state": "Lima", "country": "PE"},
+            "phone": "+51 1 555 0101",
+            "website": "https://example.com",
+            "price_level": rng.randint(1, 4),
+            "images": [f"/images/{i}-{n}.jpg" for n in range(6)],
+            "tags": ["Peruvian", "Seafood", "Family", "Outdoor"],
+            "owner_id": OWNER_ID,
+            "rating": round(rng.uniform(0, 5), 1),
+            "review_count": 0,
+            "views": 0,
+            "created_at": now,
+            "is_active": True,
+        }
+        for i in range(1, args.businesses + 1)
+    ])
+    await db.reviews.insert_many([
+        {
+            "id": i,
+            "business_id": str(rng.randint(1, args.businesses)),
+            "user_id": OWNER_ID,
+            "user_name": "Benchmark User",
+            "rating": rng.randint(1, 5),
+            "title": f"Review {i}",
+            "text": LONG_TEXT,
+            "images": [f"/images/review-{i}-{n}.jpg" for n in range(3)],
+            "helpful_count": 0,
+            "created_at": now - timedelta(minutes=i),
+        }
+        for i in range(1, args.reviews + 1)
+    ])
+    await db.trips.insert_many([
+        {
+            "id": str(i),
+            "user_id": OWNER_ID,
+            "name": f"Trip {i}",
+            "destination": "Cusco",
+            "description": LONG_TEXT,
+            "start_date": "2024-06-01",
+            "end_date": "2024-06-10",
+            "activities": [
+                {
+                    "business_id": str(rng.randint(1, args.businesses)),
+                    "business_name": "Some business",
+                    "scheduled_date": "2024-06-02",
+                    "notes": "Book in advance, bring cash",
+                }
+                for _ in range(args.activities)
+            ],
+            "created_at": now,
+        }
+        for i in range(1, args.trips + 1)
+    ])
+
+
+async def mongo_bytes(collection, query, projection, sort) -> int:
+    """BSON bytes of the documents a find() returns with this projection"""
+    docs = await collection.find(query, projection).sort(sort).limit(PAGE_SIZE).to_list(length=None)
+    return sum(len(bson.encode(doc)) for doc in docs)
+
+
+async def measure_endpoint(client, db, path, collection, query, sort, shape, fields, repeat):
+    rows = {}
+    shapes = [("detail", {}), ("summary", {"view": "summary"}), (f"fields={fields}", {"fields": fields})]
+    for label, params in shapes:
+        _, _, projection = shape(params.get("view", "detail"), params.get("fields"))
+        latencies = []
+        for _ in range(repeat):
+            with Timer() as timer:
+                response = await client.get(path, params={"limit": PAGE_SIZE, **params})
+                response.raise_for_status()
+            latencies.append(timer.elapsed)
+        rows[label] = {
+            "mongo_bytes": await mongo_bytes(db[collection], query, projection, sort),
+            "response_bytes": len(response.content),
+            "p50_ms": summarize(latencies)["p50_ms"],
+        }
+    return rows
+
+
+async def main(args):
+    use_benchmark_database()
+    await Database.connect_db()
+    db = Database.get_db()
+    owner = UserInDB(id=int(OWNER_ID), email="owner@example.com", full_name="Owner", role="business", hashed_password="x")
+    app.dependency_overrides[get_current_active_user] = lambda: owner
+    try:
+        if not args.reuse:
+            await seed(db, args)
+
+        endpoints = [
+            ("/api/businesses/", "businesses", {"is_active": True}, [("rating", -1), ("id", -1)],
+             business_shape, "name,rating"),
+            ("/api/businesses/owner/my-businesses", "businesses", {"owner_id": OWNER_ID}, [("id", 1)],
+             business_shape, "name,views"),
+            ("/api/reviews/user/my-reviews", "reviews", {"user_id": OWNER_ID}, [("created_at", -1)],
+             lambda view, fields: response_shape(view, fields, Review, ReviewSummary), "business_id,rating"),
+            ("/api/trips/", "trips", {"user_id": OWNER_ID}, [("start_date", -1)],
+             lambda view, fields: response_shape(view, fields, Trip, TripSummary, TRIP_SUMMARY_PROJECTION), "name,start_date"),
+        ]
+        async with asgi_client(app) as client:
+            for path, collection, query, sort, shape, fields in endpoints:
+                rows = await measure_endpoint(client, db, path, collection, query, sort, shape, fields, args.repeat)
+                print_results(f"GET {path}", rows)
+    finally:
+        app.dependency_overrides.pop(get_current_active_user, None)
+        if not args.keep:
+            await Database.client.drop_database(db.name)
+        await Database.close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--businesses", type=int, default=200)
+    parser.add_argument("--reviews", type=int, default=200)
+    parser.add_argument("--trips", type=int, default=50)
+    parser.add_argument("--activities", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--keep", action="store_true", help="keep the seeded database")
+    parser.add_argument("--reuse", action="store_true", help="reuse a database kept with --keep")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,87 @@
+"""
+Benchmark: cost of keeping a business rating current after a review change,
+full $group re-aggregation (update_business_rating) versus the incremental
+update pipeline (apply_rating_change), at --reviews reviews per business.
+
+Requires MongoDB; uses <database_name>_bench.
+
+    python benchmarks/bench_ratings.py --reviews 10000 --businesses 20
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime
+
+from common import Timer, print_results, summarize, use_benchmark_database
+
+from database import Database
+from repositories import Repositories
+from routes.reviews import apply_rating_change, update_business_rating
+
+BATCH_SIZE = 10000
+
+
+async def seed(db, businesses: int, reviews_per_business: int):
+    await db.businesses.drop()
+    await db.reviews.drop()
+    await db.businesses.insert_many([{"id": i, "rating": 0.0, "review_count": 0} for i in range(1, businesses + 1)])
+    await db.businesses.create_index("id", unique=True)
+    rng = random.Random(5)
+    now = datetime.utcnow()
+    review_id = 0
+    for business_id in range(1, businesses + 1):
+        for start in range(0, reviews_per_business, BATCH_SIZE):
+            batch = []
+            for _ in range(min(BATCH_SIZE, reviews_per_business - start)):
+                review_id += 1
+                batch.append({
+                    "id": review_id,
+                    "business_id": business_id,
+                    "user_id": str(review_id),
+                    "rating": rng.randint(1, 5),
+                    "created_at": now,
+                })
+            await db.reviews.insert_many(batch, ordered=False)
+    await db.reviews.create_index([("business_id", 1), ("created_at", -1)])
+    repos = Repositories(db)
+    for business_id in range(1, businesses + 1):
+        await update_business_rating(business_id, repos)
+
+
+async def main(args):
+    use_benchmark_database()
+    await Database.connect_db()
+    db = Database.get_db()
+    repos = Repositories(db)
+    try:
+        start = time.perf_counter()
+        await seed(db, args.businesses, args.reviews)
+        print(f"Seeded {args.businesses * args.reviews} reviews in {time.perf_counter() - start:.1f}s")
+
+        rng = random.Random(9)
+        full, incremental = [], []
+        for _ in range(args.repeat):
+            business_id = rng.randint(1, args.businesses)
+            with Timer() as timer:
+                await update_business_rating(business_id, repos)
+            full.append(timer.elapsed)
+            with Timer() as timer:
+                await apply_rating_change(business_id, repos, added=5, removed=4)
+            incremental.append(timer.elapsed)
+
+        print_results(
+            f"rating update after one review change ({args.reviews} reviews/business)",
+            {"full re-aggregation": summarize(full), "incremental $inc": summarize(incremental)},
+        )
+    finally:
+        await Database.client.drop_database(db.name)
+        await Database.close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reviews", type=int, default=10_000, help="reviews per business")
+    parser.add_argument("--businesses", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
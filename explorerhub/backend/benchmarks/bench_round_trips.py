@@ -0,0 +1,158 @@
+"""
+Round trips and latency per mutating endpoint, against a real mongod.
+
+Every command the driver sends is recorded with a pymongo CommandListener,
+so the output shows how many round trips each request costs and which
+commands they were. A write followed by a find on the same collection
+within one request is reported as a read-back; --check exits with status 1
+when there is any.
+
+Uses <database_name>_bench. Requires MongoDB and httpx.
+
+    python benchmarks/bench_round_trips.py --repeat 20 --check
+"""
+import argparse
+import asyncio
+import sys
+from typing import List, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
+from common import Timer, asgi_client, print_results, summarize, use_benchmark_database
+
+from auth import get_current_active_user
+from config import settings
+from database import Database
+from main import app
+from models.user import UserInDB
+
+WRITE_COMMANDS = {"insert", "update", "delete", "findAndModify"}
+# Connection housekeeping, not part of the request
+IGNORED_COMMANDS = {"hello", "isMaster", "ismaster", "ping", "endSessions", "saslStart", "saslContinue"}
+
+
+class CommandRecorder(monitoring.CommandListener):
+    def __init__(self):
+        self.commands: List[Tuple[str, str]] = []
+
+    def started(self, event):
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        collection = event.command.get(event.command_name)
+        self.commands.append((event.command_name, collection if isinstance(collection, str) else ""))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def read_backs(commands: List[Tuple[str, str]]) -> List[str]:
+    """Collections read with find after being written in the same request"""
+    written = set()
+    found = []
+    for name, collection in commands:
+        if name in WRITE_COMMANDS:
+            written.add(collection)
+        elif name == "find" and collection in written:
+            found.append(collection)
+    return found
+
+
+class Scenario:
+    def __init__(self, client, recorder, repeat):
+        self.client = client
+        self.recorder = recorder
+        self.repeat = repeat
+        self.results = {}
+        self.problems = []
+
+    async def measure(self, label, method, path, json=None, status=None):
+        """Call an endpoint `repeat` times; returns the last response body"""
+        latencies = []
+        body = None
+        for _ in range(self.repeat):
+            self.recorder.commands.clear()
+            with Timer() as timer:
+                response = await self.client.request(method, path, json=json)
+            latencies.append(timer.elapsed)
+            if response.status_code >= 400 or (status and response.status_code != status):
+                raise RuntimeError(f"{label}: {response.status_code} {response.text}")
+            body = response.json() if response.content else None
+        commands = list(self.recorder.commands)
+        back = read_backs(commands)
+        if back:
+            self.problems.append(f"{label} reads back {', '.join(back)}")
+        self.results[label] = {
+            "round_trips": len(commands),
+            "p50_ms": summarize(latencies)["p50_ms"],
+            "commands": ",".join(f"{name}:{collection}" for name, collection in commands),
+        }
+        return body
+
+
+async def main(args):
+    use_benchmark_database()
+    recorder = CommandRecorder()
+    Database.client = AsyncIOMotorClient(settings.mongodb_url, event_listeners=[recorder])
+    db = Database.get_db()
+    owner = UserInDB(id=1, email="owner@example.com", full_name="Owner", role="business", hashed_password="x")
+    app.dependency_overrides[get_current_active_user] = lambda: owner
+    try:
+        await Database.client.drop_database(db.name)
+        async with asgi_client(app) as client:
+            run = Scenario(client, recorder, args.repeat)
+            business = {
+                "name": "Benchmark Cafe", "description": "Coffee", "category": "Restaurant",
+                "location": {"address": "1 Main St", "city": "Lima", "state": "Lima", "country": "PE"},
+                "price_level": 2, "images": [], "tags": [],
+            }
+            created = await run.measure("POST /businesses", "POST", "/api/businesses/", business, 201)
+            business_id = created["id"]
+            await run.measure("PUT /businesses/{id}", "PUT", f"/api/businesses/{business_id}",
+                              {**business, "name": "Benchmark Cafe 2"})
+
+            review = {"business_id": str(business_id), "rating": 4, "title": "Nice", "text": "Good coffee", "images": []}
+            # Only one review per user and business, so create it once
+            run.repeat, repeat = 1, run.repeat
+            created_review = await run.measure("POST /reviews", "POST", "/api/reviews/", review, 201)
+            run.repeat = repeat
+            await run.measure("PUT /reviews/{id}", "PUT", f"/api/reviews/{created_review['id']}",
+                              {**review, "rating": 5})
+
+            trip = {"name": "Trip", "destination": "Lima", "start_date": "2024-06-01", "end_date": "2024-06-05"}
+            created_trip = await run.measure("POST /trips", "POST", "/api/trips/", trip, 201)
+            trip_id = created_trip["id"]
+            await run.measure("PUT /trips/{id}", "PUT", f"/api/trips/{trip_id}", {**trip, "name": "Trip 2"})
+            activity = {"business_id": str(business_id), "business_name": "Benchmark Cafe 2"}
+            await run.measure("POST /trips/{id}/activities", "POST", f"/api/trips/{trip_id}/activities", activity)
+            await run.measure("DELETE /trips/{id}/activities", "DELETE",
+                              f"/api/trips/{trip_id}/activities/{business_id}")
+
+            run.repeat = 1
+            await run.measure("DELETE /reviews/{id}", "DELETE", f"/api/reviews/{created_review['id']}")
+            await run.measure("DELETE /trips/{id}", "DELETE", f"/api/trips/{trip_id}")
+            await run.measure("DELETE /businesses/{id}", "DELETE", f"/api/businesses/{business_id}")
+
+        print_results("Round trips per request", run.results)
+        if run.problems:
+            print("\nRead-backs:\n  " + "\n  ".join(run.problems))
+            if args.check:
+                sys.exit(1)
+        else:
+            print("\nNo endpoint reads back what it wrote.")
+    finally:
+        app.dependency_overrides.pop(get_current_active_user, None)
+        if not args.keep:
+            await Database.client.drop_database(db.name)
+        await Database.close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--check", action="store_true", help="exit with status 1 on read-backs")
+    parser.add_argument("--keep", action="store_true", help="keep the database afterwards")
+    asyncio.run(main(parser.parse_args()))
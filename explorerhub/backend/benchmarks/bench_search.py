@@ -0,0 +1,110 @@
+"""
+Benchmark: GET /api/businesses/ search latency for the old regex path versus
+the text index and the normalized-name prefix search, plus the city filter.
+
+Seeds --businesses documents into <database_name>_bench with the search
+indexes. Requires MongoDB and httpx.
+
+    python benchmarks/bench_search.py --businesses 200000
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime
+
+from common import Timer, asgi_client, print_results, summarize, use_benchmark_database
+
+from database import Database
+from main import app
+from models.business import search_fields
+
+BATCH_SIZE = 10000
+WORDS = [
+    "coffee", "mountain", "beach", "museum", "tour", "bistro", "garden", "sunset",
+    "surf", "hiking", "ceviche", "market", "gallery", "lodge", "kayak", "wine",
+]
+CITIES = ["Lima", "Cusco", "Arequipa", "Trujillo", "Piura", "Iquitos", "Puno", "Chiclayo"]
+
+
+def make_business(i: int, rng: random.Random, now: datetime) -> dict:
+    name = f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {i}"
+    business = {
+        "id": i,
+        "name": name,
+        "description": " ".join(rng.choice(WORDS) for _ in range(30)),
+        "category": "Restaurant",
+        "location": {"address": "1 Main St", "city": rng.choice(CITIES), "state": "-", "country": "PE"},
+        "price_level": rng.randint(1, 4),
+        "images": [],
+        "tags": rng.sample(WORDS, 3),
+        "owner_id": "1",
+        "rating": round(rng.uniform(0, 5), 1),
+        "review_count": 0,
+        "views": 0,
+        "created_at": now,
+        "is_active": True,
+    }
+    business.update(search_fields(business))
+    return business
+
+
+async def seed(db, total: int):
+    await db.businesses.drop()
+    now = datetime.utcnow()
+    rng = random.Random(7)
+    for start in range(1, total + 1, BATCH_SIZE):
+        await db.businesses.insert_many(
+            [make_business(i, rng, now) for i in range(start, min(start + BATCH_SIZE, total + 1))],
+            ordered=False,
+        )
+    await db.businesses.create_index([("is_active", 1), ("rating", -1), ("id", -1)])
+    await db.businesses.create_index(
+        [("name", "text"), ("tags", "text"), ("description", "text")],
+        weights={"name": 10, "tags": 5, "description": 1},
+    )
+    await db.businesses.create_index("name_normalized")
+    await db.businesses.create_index("city_normalized")
+
+
+async def time_requests(client, params: dict, repeat: int):
+    latencies = []
+    for _ in range(repeat):
+        with Timer() as timer:
+            response = await client.get("/api/businesses/", params=params)
+            response.raise_for_status()
+        latencies.append(timer.elapsed)
+    return summarize(latencies)
+
+
+async def main(args):
+    use_benchmark_database()
+    await Database.connect_db()
+    db = Database.get_db()
+    try:
+        start = time.perf_counter()
+        await seed(db, args.businesses)
+        print(f"Seeded {args.businesses} businesses in {time.perf_counter() - start:.1f}s")
+
+        scenarios = {
+            "search, regex": {"search": "sunset", "search_mode": "regex"},
+            "search, text index": {"search": "sunset", "search_mode": "text"},
+            "name prefix": {"search": "sun", "search_mode": "prefix"},
+            "city, regex": {"city": "cus"},
+            "city prefix": {"city": "cus", "city_mode": "prefix"},
+        }
+        results = {}
+        async with asgi_client(app) as client:
+            for name, params in scenarios.items():
+                results[name] = await time_requests(client, params, args.repeat)
+        print_results(f"GET /api/businesses/ search over {args.businesses} businesses", results)
+    finally:
+        await Database.client.drop_database(db.name)
+        await Database.close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--businesses", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=30)
+    asyncio.run(main(parser.parse_args()))
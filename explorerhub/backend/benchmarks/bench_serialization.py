@@ -0,0 +1,112 @@
+"""
+Micro-benchmark: encoding a 100-item business list the old way
+(serialize_docs + setdefault + Business(**b) + FastAPI response_model
+validation + json) versus the fast path (projected documents +
+as_response_docs + orjson). No database needed.
+
+    python benchmarks/bench_serialization.py --items 100 --repeat 2000
+"""
+import argparse
+import asyncio
+import copy
+import time
+from datetime import datetime
+
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+
+from common import print_results
+
+from main import app
+from models.business import Business, derived_fields, empty_rating_histogram
+from routes.businesses import BUSINESS_DEFAULTS, BUSINESS_PROJECTION
+from serialization import as_response_docs, dumps
+from utils import serialize_docs
+
+
+def make_documents(items: int):
+    docs = []
+    for i in range(1, items + 1):
+        doc = {
+            "_id": ObjectId(),
+            "id": i,
+            "name": f"Business {i}",
+            "description": "A fairly long description of the business " * 5,
+            "category": "Restaurant",
+            "location": {
+                "address": f"{i} Main St", "city": "Lima", "state": "Lima", "country": "PE",
+                "latitude": -12.04, "longitude": -77.04,
+            },
+            "phone": "+51 1 555 0101",
+            "website": "https://example.com",
+            "price_level": 2,
+            "images": [f"/images/{i}-{n}.jpg" for n in range(4)],
+            "tags": ["Peruvian", "Seafood", "Family"],
+            "owner_id": "1",
+            "rating": 4.5,
+            "review_count": 120,
+            "rating_sum": 540,
+            "rating_histogram": empty_rating_histogram(),
+            "views": 3400,
+            "created_at": datetime.utcnow(),
+            "updated_at": datetime.utcnow(),
+            "is_active": True,
+        }
+        doc.update(derived_fields(doc))
+        docs.append(doc)
+    return docs
+
+
+def project(docs):
+    """What the server returns for BUSINESS_PROJECTION"""
+    return [{key: value for key, value in doc.items() if BUSINESS_PROJECTION.get(key)} for doc in docs]
+
+
+async def old_path(docs, response_field) -> bytes:
+    businesses = serialize_docs(docs)
+    for business in businesses:
+        business.setdefault("rating", 0.0)
+        business.setdefault("views", 0)
+        business.setdefault("review_count", 0)
+        business.setdefault("created_at", datetime.utcnow())
+        business.setdefault("is_active", True)
+    models = [Business(**b) for b in businesses]
+    content = await serialize_response(field=response_field, response_content=models, is_coroutine=True)
+    return JSONResponse(content).body
+
+
+def fast_path(docs) -> bytes:
+    return dumps(as_response_docs(docs, Business, BUSINESS_DEFAULTS))
+
+
+async def main(args):
+    route = next(r for r in app.routes if getattr(r, "path", "") == "/api/businesses/owner/my-businesses")
+    docs = make_documents(args.items)
+    projected = project(docs)
+
+    # Both paths get fresh input, as from a cursor; copying is not part of the timing
+    inputs = [copy.deepcopy(docs) for _ in range(args.repeat)]
+    start = time.perf_counter()
+    for batch in inputs:
+        old_body = await old_path(batch, route.response_field)
+    old = (time.perf_counter() - start) / args.repeat
+
+    inputs = [copy.deepcopy(projected) for _ in range(args.repeat)]
+    start = time.perf_counter()
+    for batch in inputs:
+        new_body = fast_path(batch)
+    new = (time.perf_counter() - start) / args.repeat
+
+    print_results(f"encode {args.items} businesses (per request)", {
+        "model + response_model": {"us": round(old * 1e6, 1), "bytes": len(old_body)},
+        "projection + orjson": {"us": round(new * 1e6, 1), "bytes": len(new_body)},
+    })
+    print(f"  saving: {round((old - new) * 1e6, 1)} us/request ({old / new:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=2000)
+    asyncio.run(main(parser.parse_args()))
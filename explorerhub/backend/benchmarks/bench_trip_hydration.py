@@ -0,0 +1,130 @@
+"""
+Benchmark: rendering every trip of a user with business cards.
+"N+1" is what the frontend did: GET /api/trips/ and then one
+GET /api/businesses/{id} per activity. "expand" is one
+GET /api/trips/?expand=businesses. The response cache is cleared before
+every repetition so both start cold.
+
+Seeds --trips trips of --activities activities over --businesses businesses
+into <database_name>_bench. Requires MongoDB and httpx.
+
+    python benchmarks/bench_trip_hydration.py --trips 50 --activities 20
+"""
+import argparse
+import asyncio
+import random
+from datetime import datetime
+
+from common import Timer, asgi_client, print_results, summarize, use_benchmark_database
+
+from auth import get_current_active_user
+from database import Database
+from main import app
+from models.user import UserInDB
+from response_cache import response_cache
+
+USER_ID = "1"
+
+
+async def seed(db, args):
+    await db.businesses.drop()
+    await db.trips.drop()
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    await db.businesses.insert_many([
+        {
+            "id": i,
+            "name": f"Business {i}",
+            "description": "Benchmark business",
+            "category": "Restaurant",
+            "location": {"address": "1 Main St", "city": "Cusco", "state": "Cusco", "country": "PE"},
+            "price_level": rng.randint(1, 4),
+            "images": [f"/images/{i}-{n}.jpg" for n in range(4)],
+            "tags": [],
+            "owner_id": "2",
+            "rating": round(rng.uniform(0, 5), 1),
+            "review_count": 0,
+            "views": 0,
+            "created_at": now,
+            "is_active": True,
+        }
+        for i in range(1, args.businesses + 1)
+    ])
+    await db.businesses.create_index("id")
+    await db.trips.insert_many([
+        {
+            "id": str(t),
+            "user_id": USER_ID,
+            "name": f"Trip {t}",
+            "destination": "Cusco",
+            "start_date": "2024-06-01",
+            "end_date": "2024-06-10",
+            "activities": [
+                {"business_id": str(business_id), "business_name": f"Business {business_id}"}
+                for business_id in rng.sample(range(1, args.businesses + 1), args.activities)
+            ],
+            "created_at": now,
+        }
+        for t in range(1, args.trips + 1)
+    ])
+    await db.trips.create_index([("user_id", 1), ("start_date", -1)])
+
+
+async def n_plus_one(client) -> int:
+    response = await client.get("/api/trips/")
+    response.raise_for_status()
+    requests = 1
+    for trip in response.json():
+        for activity in trip["activities"]:
+            (await client.get(f"/api/businesses/{activity['business_id']}")).raise_for_status()
+            requests += 1
+    return requests
+
+
+async def expanded(client) -> int:
+    (await client.get("/api/trips/", params={"expand": "businesses"})).raise_for_status()
+    return 1
+
+
+async def run(client, scenario, repeat):
+    latencies = []
+    requests = 0
+    for _ in range(repeat):
+        await response_cache.backend.clear()
+        with Timer() as timer:
+            requests = await scenario(client)
+        latencies.append(timer.elapsed)
+    return {"requests": requests, **summarize(latencies)}
+
+
+async def main(args):
+    use_benchmark_database()
+    await Database.connect_db()
+    db = Database.get_db()
+    user = UserInDB(id=int(USER_ID), email="user@example.com", full_name="User", hashed_password="x")
+    app.dependency_overrides[get_current_active_user] = lambda: user
+    try:
+        if not args.reuse:
+            await seed(db, args)
+        async with asgi_client(app) as client:
+            results = {
+                "N+1": await run(client, n_plus_one, args.repeat),
+                "expand=businesses": await run(client, expanded, args.repeat),
+            }
+        print_results(f"{args.trips} trips x {args.activities} activities", results)
+    finally:
+        app.dependency_overrides.pop(get_current_active_user, None)
+        if not args.keep:
+            await Database.client.drop_database(db.name)
+        await Database.close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trips", type=int, default=50)
+    parser.add_argument("--activities", type=int, default=20)
+    parser.add_argument("--businesses", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--keep", action="store_true", help="keep the seeded database")
+    parser.add_argument("--reuse", action="store_true", help="reuse a database kept with --keep")
+    asyncio.run(main(parser.parse_args()))
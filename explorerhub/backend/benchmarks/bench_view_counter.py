@@ -0,0 +1,73 @@
+"""
+Load test: POST /api/businesses/{id}/view with buffered view counts.
+Sends --views requests spread over --businesses with a Zipf-like skew and
+reports how many database writes the buffer saved versus one update per view,
+then checks that the stored totals match.
+
+Requires MongoDB and httpx; uses <database_name>_bench.
+
+    python benchmarks/bench_view_counter.py --views 50000 --businesses 500
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from common import asgi_client, use_benchmark_database
+
+from database import Database
+from main import app
+from view_counter import view_counter
+
+
+async def main(args):
+    use_benchmark_database()
+    await Database.connect_db()
+    db = Database.get_db()
+    try:
+        await db.businesses.drop()
+        await db.businesses.insert_many([{"id": i, "views": 0} for i in range(1, args.businesses + 1)])
+        await db.businesses.create_index("id", unique=True)
+
+        rng = random.Random(11)
+        weights = [1 / rank ** args.zipf for rank in range(1, args.businesses + 1)]
+        targets = rng.choices(range(1, args.businesses + 1), weights=weights, k=args.views)
+
+        view_counter.flush_interval = args.flush_interval
+        view_counter.start()
+        queue = iter(targets)
+
+        async def worker(client):
+            for business_id in queue:
+                response = await client.post(f"/api/businesses/{business_id}/view")
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        async with asgi_client(app) as client:
+            await asyncio.gather(*[worker(client) for _ in range(args.concurrency)])
+        await view_counter.stop()
+        elapsed = time.perf_counter() - start
+
+        stored = await db.businesses.aggregate([{"$group": {"_id": None, "views": {"$sum": "$views"}}}]) \
+            .to_list(length=1)
+        stats = view_counter.stats()
+        print(f"\n{args.views} views over {args.businesses} businesses in {elapsed:.2f}s "
+              f"({args.views / elapsed:.0f} req/s)")
+        print(f"  writes without buffering: {args.views}")
+        print(f"  writes with buffering:    {stats['writes']} in {stats['flushes']} bulk_write calls")
+        print(f"  writes saved:             {args.views - stats['writes']} "
+              f"({100 * (1 - stats['writes'] / args.views):.1f}%)")
+        print(f"  stored views: {stored[0]['views']}  (expected {stats['recorded']})")
+    finally:
+        await Database.client.drop_database(db.name)
+        await Database.close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--views", type=int, default=50_000)
+    parser.add_argument("--businesses", type=int, default=500)
+    parser.add_argument("--zipf", type=float, default=1.1, help="skew of the popularity distribution")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--flush-interval", type=float, default=1.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,64 @@
+"""
+Shared helpers for the benchmark scripts
+"""
+import os
+import sys
+import time
+from typing import Dict, List
+
+# Add backend directory to path to import app modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    """Latency summary in milliseconds from a list of durations in seconds"""
+    return {
+        "count": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2) if latencies else 0.0,
+    }
+
+
+def print_results(title: str, rows: Dict[str, Dict[str, float]]):
+    """Print one line per scenario"""
+    print(f"\n{title}")
+    for name, stats in rows.items():
+        values = "  ".join(f"{key}={value}" for key, value in stats.items())
+        print(f"  {name:<24} {values}")
+
+
+def use_benchmark_database():
+    """Point the app at a throwaway database so benchmarks never touch real data"""
+    from config import settings
+    if not settings.database_name.endswith("_bench"):
+        settings.database_name = f"{settings.database_name}_bench"
+    return settings.database_name
+
+
+def asgi_client(app):
+    """HTTP client that calls the ASGI app in-process (requires httpx)"""
+    import httpx
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark")
+
+
+class Timer:
+    """Context manager that records elapsed seconds"""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        return False
@@ -0,0 +1,528 @@
+"""
+Load test: a mix of API requests from many concurrent sessions, against the
+app in-process or a running server, with results as JSON.
+
+Data comes from datagen.py at the scale given (--users, --businesses,
+--reviews, ...): businesses spread over real cities with category tags,
+review counts per business following Zipf's law, trips with activities.
+It is written to <database_name>_bench, or kept in memory with --backend
+memory. With --url the requests go to that server instead; it must use the
+same database (DATABASE_NAME=<name>_bench) and, with --no-seed, data seeded
+by an earlier run with the same scale arguments.
+
+Mixes (--mix) weight the operations of a kind of traffic:
+
+- browse: listing, filters, search, nearby, details, reviews and trips
+- review-burst: clients creating, editing and upvoting reviews while others read
+- owner-dashboard: business owners on their listings and analytics
+
+Sessions log in through /api/auth/login before the run. After --warmup
+seconds the mix runs for --duration seconds (or --requests requests) from
+--concurrency clients. Per operation the report has throughput, p50/p95/p99
+latency, errors and database commands per request; the database commands
+come from the server's /metrics (per route, so operations on one route
+share the figure) and are 0 on the memory backend. --output writes the
+report, --baseline compares with an earlier one and exits with status 1
+when throughput or p95 latency got worse by more than --max-regression.
+
+    python benchmarks/load_test.py --backend memory --mix browse --duration 20 --output browse.json
+    python benchmarks/load_test.py --backend mongo --businesses 100000 --reviews 1000000 --mix review-burst
+    python benchmarks/load_test.py --url http://localhost:8000 --no-seed --mix browse --baseline browse.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import subprocess
+import sys
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from common import Timer, asgi_client, print_results, summarize, use_benchmark_database
+
+import datagen
+from config import settings
+
+SAMPLE = re.compile(r'^(\w+)\{(.*)\} (\S+)$')
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+SEARCH_WORDS = ["ceviche", "inca", "andean", "coffee", "museum", "trekking", "market", "pisco", "garden", "surf"]
+
+
+def scale(args) -> datagen.Scale:
+    return datagen.Scale(args.users, args.owners, args.businesses, args.reviews, args.trips, args.activities, args.zipf)
+
+
+async def seed(db, args) -> int:
+    """Replace the benchmark database with generated data; returns the number of reviews"""
+    from passwords import password_hasher
+    from repositories import Repositories
+
+    await db.client.drop_database(db.name)
+    password_hash = await password_hasher.hash(datagen.PASSWORD)
+    await datagen.seed(db, scale(args), password_hash)
+    # Building the indexes once at the end is faster than keeping them up to date during the load
+    await Repositories(db).ensure_indexes()
+    return scale(args).counts()["reviews"]
+
+
+class Session:
+    """A logged in user, and what the operations remember about it"""
+
+    def __init__(self, user_id: int, token: str):
+        self.user_id = user_id
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.businesses: List[dict] = []
+        self.reviews: List[dict] = []
+
+
+class Operation(NamedTuple):
+    method: str
+    route: str
+    run: Callable
+    # Creating a review the user already wrote is a 400, which is part of the traffic
+    ok: Tuple[int, ...] = (200, 201, 204)
+
+
+class Workload:
+    """One method per operation; each sends a single request"""
+
+    def __init__(self, client, args, reviews: int):
+        self.client = client
+        self.args = args
+        self.reviews = reviews
+        self.clients: List[Session] = []
+        self.owners: List[Session] = []
+        self.popularity = datagen.zipf_weights(args.businesses, args.zipf)
+
+    async def login(self, user_id: int) -> Session:
+        response = await self.client.post(
+            "/api/auth/login", json={"email": f"user{user_id}@example.com", "password": datagen.PASSWORD}
+        )
+        if response.status_code != 200:
+            raise SystemExit(f"Cannot log in user {user_id}: {response.status_code} {response.text}"
+                             " (was the database seeded with the same scale arguments?)")
+        return Session(user_id, response.json()["access_token"])
+
+    async def start_sessions(self, clients: int, owners: int):
+        """Log in clients and owners, and load the businesses of each owner"""
+        rng = random.Random(self.args.seed)
+        client_ids = rng.sample(range(self.args.owners + 1, self.args.users + 1),
+                                min(clients, self.args.users - self.args.owners))
+        owner_ids = rng.sample(range(1, self.args.owners + 1), min(owners, self.args.owners))
+        self.clients = list(await asyncio.gather(*(self.login(user_id) for user_id in client_ids)))
+        for session in await asyncio.gather(*(self.login(user_id) for user_id in owner_ids)):
+            response = await self.client.get("/api/businesses/owner/my-businesses",
+                                              params={"view": "summary"}, headers=session.headers)
+            session.businesses = response.json()
+            if session.businesses:
+                self.owners.append(session)
+
+    def business_id(self, rng) -> int:
+        """Popular businesses are requested more, like their reviews"""
+        return bisect_left(self.popularity, rng.random() * self.popularity[-1]) + 1
+
+    def city(self, rng) -> tuple:
+        return rng.choices(datagen.CITIES, cum_weights=datagen.CITY_WEIGHTS)[0]
+
+    # Browsing
+
+    async def list(self, rng):
+        return await self.client.get("/api/businesses/", params={"limit": 20})
+
+    async def list_category(self, rng):
+        params = {"category": rng.choice(datagen.CATEGORY_NAMES), "min_rating": rng.choice((0, 3, 4))}
+        return await self.client.get("/api/businesses/", params=params)
+
+    async def list_city(self, rng):
+        params = {"city": self.city(rng)[0], "max_price": rng.randint(1, 4), "view": "summary"}
+        return await self.client.get("/api/businesses/", params=params)
+
+    async def search(self, rng):
+        return await self.client.get("/api/businesses/", params={"search": rng.choice(SEARCH_WORDS), "search_mode": "text"})
+
+    async def near(self, rng):
+        _, _, _, latitude, longitude, _ = self.city(rng)
+        params = {"lat": latitude + rng.gauss(0, 0.02), "lng": longitude + rng.gauss(0, 0.02),
+                  "max_distance_km": rng.choice((1, 2, 5))}
+        return await self.client.get("/api/businesses/", params=params)
+
+    async def business(self, rng):
+        return await self.client.get(f"/api/businesses/{self.business_id(rng)}")
+
+    async def view(self, rng):
+        return await self.client.post(f"/api/businesses/{self.business_id(rng)}/view")
+
+    async def business_reviews(self, rng):
+        return await self.client.get(f"/api/reviews/business/{self.business_id(rng)}")
+
+    async def batch(self, rng):
+        ids = ",".join(str(self.business_id(rng)) for _ in range(12))
+        return await self.client.get("/api/businesses/batch", params={"ids": ids})
+
+    async def my_trips(self, rng):
+        session = rng.choice(self.clients)
+        return await self.client.get("/api/trips/", params={"expand": "businesses"}, headers=session.headers)
+
+    async def login_user(self, rng):
+        body = {"email": f"user{rng.randint(1, self.args.users)}@example.com", "password": datagen.PASSWORD}
+        return await self.client.post("/api/auth/login", json=body)
+
+    # Reviews
+
+    async def create_review(self, rng):
+        session = rng.choice(self.clients)
+        body = {"business_id": str(self.business_id(rng)), "rating": rng.randint(1, 5),
+                "title": rng.choice(datagen.REVIEW_TITLES), "text": rng.choice(datagen.REVIEW_TEXTS), "images": []}
+        response = await self.client.post("/api/reviews/", json=body, headers=session.headers)
+        if response.status_code == 201:
+            session.reviews.append({"id": response.json()["id"], "business_id": body["business_id"]})
+        return response
+
+    async def update_review(self, rng):
+        session = rng.choice(self.clients)
+        if not session.reviews:
+            return await self.create_review(rng)
+        review = rng.choice(session.reviews)
+        body = {"business_id": review["business_id"], "rating": rng.randint(1, 5),
+                "title": rng.choice(datagen.REVIEW_TITLES), "text": rng.choice(datagen.REVIEW_TEXTS), "images": []}
+        return await self.client.put(f"/api/reviews/{review['id']}", json=body, headers=session.headers)
+
+    async def helpful(self, rng):
+        session = rng.choice(self.clients)
+        return await self.client.post(f"/api/reviews/{rng.randint(1, max(1, self.reviews))}/helpful",
+                                      headers=session.headers)
+
+    # Owner dashboard
+
+    async def my_businesses(self, rng):
+        session = rng.choice(self.owners)
+        return await self.client.get("/api/businesses/owner/my-businesses", headers=session.headers)
+
+    async def analytics(self, rng):
+        session = rng.choice(self.owners)
+        return await self.client.get("/api/businesses/owner/analytics", headers=session.headers)
+
+    async def daily(self, rng):
+        session = rng.choice(self.owners)
+        params = {"days": rng.choice((7, 30, 90))}
+        if rng.random() < 0.5:
+            params["business_id"] = rng.choice(session.businesses)["id"]
+        return await self.client.get("/api/businesses/owner/analytics/daily", params=params, headers=session.headers)
+
+    async def activity(self, rng):
+        session = rng.choice(self.owners)
+        business_id = rng.choice(session.businesses)["id"]
+        params = {"granularity": rng.choice(("hour", "day")),
+                  "start": (datetime.utcnow() - timedelta(days=7)).isoformat()}
+        return await self.client.get(f"/api/businesses/{business_id}/activity", params=params,
+                                     headers=session.headers)
+
+    async def update_business(self, rng):
+        session = rng.choice(self.owners)
+        business_id = rng.choice(session.businesses)["id"]
+        response = await self.client.get(f"/api/businesses/{business_id}")
+        business = response.json()
+        body = {field: business.get(field) for field in
+                ("name", "description", "category", "location", "phone", "website", "price_level", "images", "tags")}
+        body["price_level"] = rng.randint(1, 4)
+        return await self.client.put(f"/api/businesses/{business_id}", json=body, headers=session.headers)
+
+
+OPERATIONS = {
+    "list": Operation("GET", "/api/businesses/", Workload.list),
+    "list category": Operation("GET", "/api/businesses/", Workload.list_category),
+    "list city": Operation("GET", "/api/businesses/", Workload.list_city),
+    "search": Operation("GET", "/api/businesses/", Workload.search),
+    "near": Operation("GET", "/api/businesses/", Workload.near),
+    "business": Operation("GET", "/api/businesses/{business_id}", Workload.business),
+    "view": Operation("POST", "/api/businesses/{business_id}/view", Workload.view),
+    "business reviews": Operation("GET", "/api/reviews/business/{business_id}", Workload.business_reviews),
+    "batch": Operation("GET", "/api/businesses/batch", Workload.batch),
+    "trips": Operation("GET", "/api/trips/", Workload.my_trips),
+    "login": Operation("POST", "/api/auth/login", Workload.login_user),
+    "create review": Operation("POST", "/api/reviews/", Workload.create_review, (201, 400)),
+    "update review": Operation("PUT", "/api/reviews/{review_id}", Workload.update_review, (200, 201, 400)),
+    "helpful": Operation("POST", "/api/reviews/{review_id}/helpful", Workload.helpful, (200, 404)),
+    "my businesses": Operation("GET", "/api/businesses/owner/my-businesses", Workload.my_businesses),
+    "analytics": Operation("GET", "/api/businesses/owner/analytics", Workload.analytics),
+    "analytics daily": Operation("GET", "/api/businesses/owner/analytics/daily", Workload.daily),
+    "activity": Operation("GET", "/api/businesses/{business_id}/activity", Workload.activity),
+    "update business": Operation("PUT", "/api/businesses/{business_id}", Workload.update_business),
+}
+
+# Operation weights per mix
+MIXES = {
+    "browse": {
+        "list": 10, "list category": 15, "list city": 10, "search": 10, "near": 10, "business": 20,
+        "view": 10, "business reviews": 10, "batch": 3, "trips": 2, "login": 0.5,
+    },
+    "review-burst": {
+        "create review": 30, "update review": 10, "helpful": 15, "business reviews": 25, "business": 20,
+    },
+    "owner-dashboard": {
+        "my businesses": 25, "analytics": 25, "analytics daily": 20, "activity": 15, "update business": 5,
+        "business": 10,
+    },
+}
+
+
+def parse_metrics(text: str) -> Tuple[Dict[Tuple[str, str], float], Dict[Tuple[str, str], float]]:
+    """(requests, database commands) per (method, route) from the Prometheus text of /metrics"""
+    requests: Dict[Tuple[str, str], float] = defaultdict(float)
+    commands: Dict[Tuple[str, str], float] = defaultdict(float)
+    for line in text.splitlines():
+        match = SAMPLE.match(line)
+        if not match:
+            continue
+        name, labels, value = match.groups()
+        labels = dict(LABEL.findall(labels))
+        key = (labels.get("method"), labels.get("route"))
+        if name == "explorerhub_http_requests_total":
+            requests[key] += float(value)
+        elif name == "explorerhub_http_request_db_commands_total":
+            commands[key] += float(value)
+    return requests, commands
+
+
+async def scrape_metrics(client) -> Optional[Tuple[dict, dict]]:
+    response = await client.get("/metrics")
+    return parse_metrics(response.text) if response.status_code == 200 else None
+
+
+def db_ops_per_route(before, after) -> Dict[Tuple[str, str], float]:
+    """Database commands per request of every route between two scrapes"""
+    if before is None or after is None:
+        return {}
+    (requests_before, commands_before), (requests_after, commands_after) = before, after
+    per_route = {}
+    for key, count in requests_after.items():
+        requests = count - requests_before.get(key, 0)
+        if requests > 0:
+            per_route[key] = (commands_after.get(key, 0) - commands_before.get(key, 0)) / requests
+    return per_route
+
+
+async def run_mix(workload, mix: Dict[str, float], args, seconds: float, requests: Optional[int]) -> dict:
+    """Send the mix from args.concurrency clients; latencies and errors per operation"""
+    names = list(mix)
+    weights = datagen.cumulative([mix[name] for name in names])
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    sample_errors: Dict[str, str] = {}
+    deadline = time.perf_counter() + seconds
+    remaining = [requests if requests is not None else float("inf")]
+
+    async def client_loop(seed: int):
+        rng = random.Random(seed)
+        while remaining[0] > 0 and time.perf_counter() < deadline:
+            remaining[0] -= 1
+            name = rng.choices(names, cum_weights=weights)[0]
+            operation = OPERATIONS[name]
+            with Timer() as timer:
+                try:
+                    response = await operation.run(workload, rng)
+                    status = response.status_code
+                except Exception as exc:
+                    status, response = None, exc
+            latencies[name].append(timer.elapsed)
+            if status not in operation.ok:
+                errors[name] += 1
+                sample_errors.setdefault(name, f"{status}: {getattr(response, 'text', response)}"[:200])
+            # Cached responses finish without suspending; yield so the clients take turns
+            await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop(args.seed + n) for n in range(args.concurrency)))
+    return {"elapsed": time.perf_counter() - start, "latencies": latencies, "errors": errors,
+            "sample_errors": sample_errors}
+
+
+def build_report(run: dict, mix: Dict[str, float], db_ops: dict, meta: dict) -> dict:
+    elapsed = run["elapsed"]
+    operations = {}
+    all_latencies, all_errors, all_commands = [], 0, 0.0
+    for name in mix:
+        latencies = run["latencies"].get(name, [])
+        if not latencies:
+            continue
+        operation = OPERATIONS[name]
+        ops = db_ops.get((operation.method, operation.route))
+        operations[name] = {
+            "route": f"{operation.method} {operation.route}",
+            "rps": round(len(latencies) / elapsed, 1),
+            "errors": run["errors"].get(name, 0),
+            **summarize(latencies),
+            "db_ops_per_request": round(ops, 2) if ops is not None else None,
+        }
+        all_latencies.extend(latencies)
+        all_errors += run["errors"].get(name, 0)
+        all_commands += (ops or 0) * len(latencies)
+    total = {
+        "rps": round(len(all_latencies) / elapsed, 1),
+        "errors": all_errors,
+        **summarize(all_latencies),
+        "db_ops_per_request": round(all_commands / len(all_latencies), 2) if all_latencies else None,
+    }
+    return {"meta": meta, "total": total, "operations": operations, "sample_errors": run["sample_errors"]}
+
+
+def compare(report: dict, baseline: dict, max_regression: float, min_samples: int) -> List[str]:
+    """Print the change of every operation against the baseline; names of the ones that regressed"""
+    regressions = []
+    rows = {"total": (report["total"], baseline.get("total"))}
+    rows.update({name: (stats, baseline.get("operations", {}).get(name)) for name, stats in report["operations"].items()})
+    print(f"\nAgainst baseline from {baseline.get('meta', {}).get('time', '?')} "
+          f"(commit {baseline.get('meta', {}).get('commit') or '?'}), max regression {max_regression:.0%}")
+    for field in ("mix", "target", "scale", "concurrency"):
+        if baseline.get("meta", {}).get(field) != report["meta"][field]:
+            print(f"  (the baseline has a different {field}: {baseline.get('meta', {}).get(field)})")
+    for name, (stats, old) in rows.items():
+        if not old:
+            print(f"  {name:<24} no baseline")
+            continue
+        changes = {key: (stats[key] - old[key]) / old[key] if old[key] else 0.0 for key in ("rps", "p50_ms", "p95_ms", "p99_ms")}
+        regressed = (
+            min(stats["count"], old["count"]) >= min_samples
+            and (changes["rps"] < -max_regression or changes["p95_ms"] > max_regression)
+        )
+        if regressed:
+            regressions.append(name)
+        print(f"  {name:<24} " + "  ".join(f"{key}={change:+.1%}" for key, change in changes.items())
+              + ("  REGRESSION" if regressed else ""))
+    return regressions
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+async def load_test(client, args, reviews: int, target: str) -> dict:
+    workload = Workload(client, args, reviews)
+    with Timer() as timer:
+        await workload.start_sessions(args.sessions, args.owner_sessions)
+    print(f"Logged in {len(workload.clients)} clients and {len(workload.owners)} owners in {timer.elapsed:.1f}s")
+    mix = dict(MIXES[args.mix])
+    if not workload.owners:
+        mix = {name: weight for name, weight in mix.items() if name not in (
+            "my businesses", "analytics", "analytics daily", "activity", "update business")}
+    if not mix:
+        raise SystemExit(f"No owner has a business, nothing to run in the {args.mix} mix")
+
+    if args.warmup > 0:
+        await run_mix(workload, mix, args, args.warmup, None)
+    before = await scrape_metrics(client)
+    run = await run_mix(workload, mix, args, args.duration if args.requests is None else float("inf"), args.requests)
+    after = await scrape_metrics(client)
+
+    meta = {
+        "time": datetime.utcnow().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "target": target,
+        "mix": args.mix,
+        "concurrency": args.concurrency,
+        "seconds": round(run["elapsed"], 2),
+        "warmup_seconds": args.warmup,
+        "scale": {**scale(args)._asdict(), "review_count": reviews},
+        "metrics": before is not None,
+    }
+    return build_report(run, mix, db_ops_per_route(before, after), meta)
+
+
+async def main(args):
+    if args.owners is None:
+        args.owners = max(1, args.users // 20)
+    if args.url and args.backend == "memory" and not args.no_seed:
+        raise SystemExit("The memory backend lives in this process; use --backend mongo or --no-seed with --url")
+
+    settings.database_backend = "mongo" if args.url else args.backend
+    use_benchmark_database()
+
+    # Imported after the settings are final; the singletons read them at import
+    from database import Database
+
+    db = None
+    reviews = scale(args).counts()["reviews"]
+    if not args.url or not args.no_seed:
+        await Database.connect_db()
+        db = Database.get_db()
+    try:
+        if not args.no_seed:
+            with Timer() as timer:
+                reviews = await seed(db, args)
+            print(f"Seeded {args.users} users, {args.businesses} businesses, {reviews} reviews and "
+                  f"{args.users * args.trips} trips into {db.name} in {timer.elapsed:.1f}s")
+
+        if args.url:
+            import httpx
+            async with httpx.AsyncClient(base_url=args.url, timeout=30,
+                                         limits=httpx.Limits(max_connections=args.concurrency)) as client:
+                report = await load_test(client, args, reviews, args.url)
+        else:
+            from events import event_recorder
+            from main import app
+            from view_counter import view_counter
+
+            view_counter.start()
+            await event_recorder.start()
+            try:
+                async with asgi_client(app) as client:
+                    report = await load_test(client, args, reviews, f"asgi ({args.backend})")
+            finally:
+                await event_recorder.stop()
+                await view_counter.stop()
+    finally:
+        if db is not None:
+            await Database.close_db()
+
+    print_results(
+        f"{args.mix} mix, {report['meta']['seconds']}s, concurrency {args.concurrency}, {report['meta']['target']}",
+        {"total": report["total"], **report["operations"]},
+    )
+    for name, error in report["sample_errors"].items():
+        print(f"  {name} failed, e.g. {error}")
+    if args.output:
+        with open(args.output, "w") as handle:
+            json.dump(report, handle, indent=2)
+        print(f"\nWrote {args.output}")
+    if args.baseline:
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)
+        regressions = compare(report, baseline, args.max_regression, args.min_samples)
+        if regressions:
+            print(f"\nRegressed: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="server to load (default: the app in this process)")
+    parser.add_argument("--backend", choices=["memory", "mongo"], default="memory")
+    parser.add_argument("--mix", choices=list(MIXES), default="browse")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--owners", type=int, help="users with the business role (default: 1 in 20)")
+    parser.add_argument("--businesses", type=int, default=5000)
+    parser.add_argument("--reviews", type=int, default=50000, help="total reviews")
+    parser.add_argument("--trips", type=int, default=1, help="trips per user")
+    parser.add_argument("--activities", type=int, default=6, help="activities per trip")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent of business popularity")
+    parser.add_argument("--no-seed", action="store_true", help="use the data of an earlier run")
+    parser.add_argument("--sessions", type=int, default=100, help="logged in clients")
+    parser.add_argument("--owner-sessions", type=int, default=20, help="logged in owners")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds before measuring")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to measure")
+    parser.add_argument("--requests", type=int, help="measure this many requests instead of --duration")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the report as JSON")
+    parser.add_argument("--baseline", help="report to compare with")
+    parser.add_argument("--max-regression", type=float, default=0.1, help="allowed loss of rps or gain of p95")
+    parser.add_argument("--min-samples", type=int, default=50, help="fewer requests are not compared")
+    asyncio.run(main(parser.parse_args()))
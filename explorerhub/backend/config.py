@@ -6,12 +6,92 @@ class Settings(BaseSettings):
     # MongoDB
     mongodb_url: str
     database_name: str = "ExplorerHub"
+    database_backend: str = "mongo"  # "mongo" or "memory" (in-process, for benchmarks; data is lost on exit)
+    
+    # MongoDB connection pool and timeouts (0 leaves the driver default)
+    mongodb_max_pool_size: int = 100
+    mongodb_min_pool_size: int = 10
+    mongodb_max_idle_time_ms: int = 0
+    mongodb_wait_queue_timeout_ms: int = 0
+    mongodb_server_selection_timeout_ms: int = 5000  # also how long startup waits for the database
+    mongodb_connect_timeout_ms: int = 0
+    mongodb_socket_timeout_ms: int = 0
+    mongodb_compressors: str = ""  # e.g. "zstd,snappy,zlib"; zstd needs zstandard, snappy needs python-snappy
+    mongodb_warm_connections: int = 10  # opened at startup
+    
+    # Read preference of writes and owner views, and of public list/detail reads
+    mongodb_read_preference: str = "primary"
+    public_read_preference: str = "secondaryPreferred"
+    public_read_max_staleness_seconds: int = 90  # at least 90, or -1 for no bound
+    # Public reads of a cached namespace go to the primary this long after a write to it,
+    # so the response cache is not refilled from a secondary that lacks the write
+    public_read_primary_after_write_seconds: float = 90.0
     
     # JWT
     jwt_secret_key: str
     jwt_algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
     
+    # Take user id/role from token claims instead of loading the user
+    auth_trust_token_claims: bool = False
+    
+    # Authenticated user cache (0 disables it)
+    principal_cache_ttl_seconds: float = 60.0
+    principal_cache_max_size: int = 10000
+    
+    # Sequential IDs reserved per worker with one counter update
+    id_block_size: int = 100
+    
+    # Public response cache (a TTL of 0 disables it)
+    response_cache_ttl_seconds: float = 30.0
+    response_cache_max_entries: int = 2048
+    response_cache_max_age_seconds: int = 10
+    
+    # Most ids accepted by GET/POST /api/businesses/batch
+    batch_max_ids: int = 100
+    
+    # GET /api/businesses/facets: cache TTL (at most the response cache TTL) and values per facet
+    facet_cache_ttl_seconds: float = 10.0
+    facet_max_values: int = 20
+    
+    # Buffered view counts
+    view_flush_interval_seconds: float = 5.0
+    view_flush_max_pending: int = 1000
+    view_dedup_window_seconds: float = 0.0  # 0 counts every view; per client address (see README)
+    
+    # Activity events (views, reviews, trip adds) and their rollups
+    event_store: str = "mongo"  # "mongo" (time-series collection) or "log"
+    event_log_dir: str = "event_log"
+    event_flush_interval_seconds: float = 2.0
+    event_flush_max_pending: int = 5000
+    event_retention_days: int = 30  # raw events
+    event_rollup_interval_seconds: float = 60.0
+    event_rollup_lag_seconds: float = 30.0  # wait for buffered events before rolling up
+    hourly_rollup_retention_days: int = 90  # daily rollups are kept
+    
+    # Password hashing
+    bcrypt_rounds: int = 12
+    password_hash_executor: str = "thread"  # "thread", "process" or "inline"
+    password_hash_workers: int = 4
+    password_hash_max_concurrency: int = 4
+    
+    # Request and database metrics (GET /metrics)
+    metrics_enabled: bool = True
+    
+    # Slow query log (GET /api/admin/slow-queries; a threshold of 0 disables it)
+    slow_query_threshold_ms: float = 100.0
+    slow_query_explain: bool = True  # explain("executionStats") each slow read shape
+    slow_query_explain_interval_seconds: float = 300.0  # per shape
+    slow_query_max_shapes: int = 200
+    
+    # Declared indexes (indexes.py): build missing ones in the background at startup,
+    # or refuse to start while a required one is missing (INDEX_STRICT)
+    index_build_on_startup: bool = True
+    index_strict: bool = False
+    
+    # Key for the /api/admin endpoints, sent as X-Admin-Key (empty disables them)
+    admin_api_key: str = ""
+    
     # CORS
     cors_origins: list = ["http://localhost:3000", "http://localhost:3001"]
     
@@ -1,29 +1,234 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
 from motor.motor_asyncio import AsyncIOMotorClient
-from typing import Optional
+from pymongo import monitoring, read_preferences
+from pymongo.errors import PyMongoError
 from config import settings
+from metrics import command_metrics
+from slow_queries import slow_query_tracker
+
+READ_PREFERENCES = {
+    "primary": read_preferences.Primary,
+    "primaryPreferred": read_preferences.PrimaryPreferred,
+    "secondary": read_preferences.Secondary,
+    "secondaryPreferred": read_preferences.SecondaryPreferred,
+    "nearest": read_preferences.Nearest,
+}
+
+
+def read_preference(mode: str, max_staleness: int = -1):
+    """pymongo read preference for a mode name; max_staleness does not apply to primary"""
+    if mode not in READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference {mode!r} (choose from {', '.join(READ_PREFERENCES)})")
+    if mode == "primary":
+        return read_preferences.Primary()
+    return READ_PREFERENCES[mode](max_staleness=max_staleness)
+
+
+def client_options() -> dict:
+    """AsyncIOMotorClient keyword options from the settings (they override the URL's)"""
+    listeners = [pool_monitor]
+    if settings.metrics_enabled:
+        listeners.append(command_metrics)
+    if slow_query_tracker.enabled:
+        listeners.append(slow_query_tracker)
+    options = {
+        "maxPoolSize": settings.mongodb_max_pool_size,
+        "minPoolSize": settings.mongodb_min_pool_size,
+        "serverSelectionTimeoutMS": settings.mongodb_server_selection_timeout_ms,
+        "read_preference": read_preference(settings.mongodb_read_preference),
+        "event_listeners": listeners,
+    }
+    optional = {
+        "maxIdleTimeMS": settings.mongodb_max_idle_time_ms,
+        "waitQueueTimeoutMS": settings.mongodb_wait_queue_timeout_ms,
+        "connectTimeoutMS": settings.mongodb_connect_timeout_ms,
+        "socketTimeoutMS": settings.mongodb_socket_timeout_ms,
+        "compressors": settings.mongodb_compressors,
+    }
+    options.update({name: value for name, value in optional.items() if value})
+    return options
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """
+    Connection pool counters from the driver's pool events: how long
+    operations wait to check out a connection, and how many connections are in
+    use against maxPoolSize (saturation is the busiest server's share).
+    Events arrive on the driver's threads; a check-out starts and ends on the
+    same thread, so the start time is kept thread-local.
+    """
+
+    def __init__(self, max_pool_size: int, samples: int = 1000):
+        self.max_pool_size = max_pool_size
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._waits = deque(maxlen=samples)
+        self._in_use: Dict[tuple, int] = {}
+        self._open: Dict[tuple, int] = {}
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.checkout_timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.peak_in_use = 0
+        self.pool_clears = 0
+
+    def _waited(self) -> float:
+        started = getattr(self._local, "started", None)
+        self._local.started = None
+        return time.perf_counter() - started if started is not None else 0.0
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        wait = self._waited()
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            self._waits.append(wait)
+            in_use = self._in_use[event.address] = self._in_use.get(event.address, 0) + 1
+            self.peak_in_use = max(self.peak_in_use, in_use)
+
+    def connection_check_out_failed(self, event):
+        wait = self._waited()
+        with self._lock:
+            self.checkout_failures += 1
+            if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+                self.checkout_timeouts += 1
+            self.wait_max = max(self.wait_max, wait)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self._in_use[event.address] = max(0, self._in_use.get(event.address, 0) - 1)
+
+    def connection_created(self, event):
+        with self._lock:
+            self._open[event.address] = self._open.get(event.address, 0) + 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self._open[event.address] = max(0, self._open.get(event.address, 0) - 1)
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        with self._lock:
+            self._in_use.pop(event.address, None)
+            self._open.pop(event.address, None)
+
+    def connection_ready(self, event):
+        pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = sorted(self._waits)
+            busiest = max(self._in_use.values(), default=0)
+            return {
+                "max_pool_size": self.max_pool_size,
+                "open_connections": sum(self._open.values()),
+                "in_use": sum(self._in_use.values()),
+                "peak_in_use": self.peak_in_use,
+                "saturation": round(busiest / self.max_pool_size, 3) if self.max_pool_size else 0.0,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "checkout_timeouts": self.checkout_timeouts,
+                "wait_avg_ms": round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "wait_p99_ms": round(waits[int(len(waits) * 0.99)] * 1000, 3) if waits else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+                "pool_clears": self.pool_clears,
+            }
+
+
+pool_monitor = PoolMonitor(settings.mongodb_max_pool_size)
+
 
 class Database:
     client: Optional[AsyncIOMotorClient] = None
-    
+    public_db = None
+
     @classmethod
     async def connect_db(cls):
-        """Connect to MongoDB"""
-        cls.client = AsyncIOMotorClient(settings.mongodb_url)
+        """
+        Connect to MongoDB, or create the in-memory database (DATABASE_BACKEND=memory).
+        Fails fast when MongoDB cannot be reached within the server selection
+        timeout, then opens mongodb_warm_connections connections up front.
+        """
+        if settings.database_backend == "memory":
+            from memory_db import MemoryClient
+            from repositories import Repositories
+            cls.client = MemoryClient()
+            await Repositories(cls.get_db()).ensure_indexes()
+            print("Using the in-memory database (data is lost on exit)")
+            return
+        cls.client = AsyncIOMotorClient(settings.mongodb_url, **client_options())
+        try:
+            await cls.client.admin.command("ping")
+        except PyMongoError as exc:
+            cls.client.close()
+            cls.client = None
+            raise RuntimeError(f"Cannot reach MongoDB: {exc}") from exc
+        await cls.warm_pool(settings.mongodb_warm_connections)
         print(f"Connected to MongoDB: {settings.mongodb_url}")
-    
+
+    @classmethod
+    async def warm_pool(cls, connections: int):
+        """Open connections with concurrent pings, to the primary and to the public read servers"""
+        if connections <= 0:
+            return
+        public = read_preference(settings.public_read_preference, settings.public_read_max_staleness_seconds)
+        await asyncio.gather(*(
+            cls.get_db().command("ping", read_preference=preference)
+            for preference in (read_preferences.Primary(), public)
+            for _ in range(connections)
+        ))
+
     @classmethod
     async def close_db(cls):
         """Close MongoDB connection"""
         if cls.client:
             cls.client.close()
             print("Closed MongoDB connection")
-    
+
     @classmethod
     def get_db(cls):
         """Get database instance"""
         return cls.client[settings.database_name]
 
+    @classmethod
+    def get_public_db(cls):
+        """
+        Database for public list and detail reads, which may be served by a
+        secondary at most public_read_max_staleness_seconds behind
+        """
+        if cls.public_db is None or cls.public_db.client is not cls.client:
+            cls.public_db = cls.client.get_database(
+                settings.database_name,
+                read_preference=read_preference(
+                    settings.public_read_preference, settings.public_read_max_staleness_seconds
+                )
+            )
+        return cls.public_db
+
 
 async def get_database():
     """Dependency for getting database"""
     return Database.get_db()
+
+
+async def get_public_database():
+    """Dependency for the database of public reads (see Database.get_public_db)"""
+    return Database.get_public_db()
@@ -0,0 +1,402 @@
+"""
+Synthetic data at any scale, for benchmarks, load tests and seeding
+
+Everything is derived from one random seed, so two runs with the same
+arguments produce the same documents. Ids are sequential as in
+models/counter.py, from 1 by default: users (the first `owners` have the
+business role), businesses, and reviews and trips numbered in the order they
+are generated. Users' emails are user<id>@example.com and every user shares
+one password hash, so any of them can log in. seed() writes a whole data
+set to a database in concurrent batches.
+"""
+import asyncio
+import itertools
+import random
+import time
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from models.business import derived_fields, empty_rating_histogram
+from repositories import CounterRepository
+
+PASSWORD = "benchmark-password"
+
+# (city, state, country, latitude, longitude, weight)
+CITIES = [
+    ("Lima", "Lima", "PE", -12.0464, -77.0428, 30),
+    ("Cusco", "Cusco", "PE", -13.5320, -71.9675, 18),
+    ("Arequipa", "Arequipa", "PE", -16.4090, -71.5375, 10),
+    ("Trujillo", "La Libertad", "PE", -8.1116, -79.0288, 6),
+    ("Puno", "Puno", "PE", -15.8402, -70.0219, 4),
+    ("Iquitos", "Loreto", "PE", -3.7437, -73.2516, 4),
+    ("Paracas", "Ica", "PE", -13.8340, -76.2500, 3),
+    ("Huaraz", "Ancash", "PE", -9.5278, -77.5278, 3),
+    ("Mancora", "Piura", "PE", -4.1039, -81.0475, 2),
+    ("La Paz", "La Paz", "BO", -16.4897, -68.1193, 6),
+    ("Quito", "Pichincha", "EC", -0.1807, -78.4678, 6),
+    ("Santiago", "Santiago", "CL", -33.4489, -70.6693, 8),
+]
+
+# category -> (weight, tags)
+CATEGORIES = {
+    "Restaurant": (35, ["Peruvian", "Seafood", "Ceviche", "Vegetarian", "Street Food", "Fine Dining", "Coffee",
+                        "Family", "Chifa", "Nikkei"]),
+    "Activity": (20, ["Hiking", "Trekking", "Rafting", "Surf", "Sandboarding", "Biking", "Climbing", "Tour"]),
+    "Attraction": (15, ["Viewpoint", "Ruins", "Plaza", "Market", "Architecture", "Photography"]),
+    "Nature": (12, ["Mountains", "Lake", "Jungle", "Beach", "Wildlife", "Canyon", "Hot Springs"]),
+    "Cultural": (10, ["Museum", "Inca", "Colonial", "Art", "Textiles", "Music", "History"]),
+    "Entertainment": (8, ["Nightlife", "Live Music", "Pisco", "Dance", "Theatre", "Festival"]),
+}
+
+NAME_WORDS = [
+    "Andean", "Inca", "Golden", "Sacred", "Pacific", "Condor", "Sunset", "Colonial", "Misty", "Llama",
+    "Alpaca", "Quinoa", "Amazon", "Coastal", "Royal", "Hidden", "Old Town", "Highland", "Silver", "Puma",
+]
+NAME_NOUNS = [
+    "Kitchen", "Tours", "House", "Garden", "Lodge", "Trail", "Market", "Table", "Corner", "Viewpoint",
+    "Experience", "Expeditions", "Cafe", "Gallery", "Terrace", "Club", "Adventures", "Grill", "Collective",
+]
+REVIEW_TITLES = ["Amazing", "Great visit", "Worth it", "Good value", "Not bad", "Disappointing", "Loved it"]
+REVIEW_TEXTS = [
+    "The staff were friendly and the place was spotless.",
+    "Great location, we will come back on our next trip.",
+    "A bit crowded at lunch time but the wait was worth it.",
+    "The views alone are worth the visit.",
+    "Prices are fair for the quality you get.",
+]
+
+
+def cumulative(weights: List[float]) -> List[float]:
+    return list(itertools.accumulate(weights))
+
+
+CITY_WEIGHTS = cumulative([city[5] for city in CITIES])
+CATEGORY_NAMES = list(CATEGORIES)
+CATEGORY_WEIGHTS = cumulative([CATEGORIES[name][0] for name in CATEGORY_NAMES])
+
+
+def business_name(business_id: int) -> str:
+    """Name of a business, a function of its id alone (trips can name it without the document)"""
+    return f"{NAME_WORDS[business_id * 7 % len(NAME_WORDS)]} {NAME_NOUNS[business_id * 13 % len(NAME_NOUNS)]} {business_id}"
+
+
+def zipf_weights(count: int, exponent: float) -> List[float]:
+    """Cumulative weights of ranks 1..count under Zipf's law, for random.choices"""
+    return cumulative([1.0 / (rank ** exponent) for rank in range(1, count + 1)])
+
+
+def zipf_counts(total: int, count: int, exponent: float, cap: int) -> List[int]:
+    """
+    total split over count items so item k gets about total / k**exponent / H,
+    at most cap each (e.g. one review per user and business)
+    """
+    harmonic = sum(1.0 / (rank ** exponent) for rank in range(1, count + 1))
+    counts = [min(cap, int(total / (rank ** exponent) / harmonic)) for rank in range(1, count + 1)]
+    # Rounding down leaves a remainder; hand it to the least reviewed items
+    remainder = total - sum(counts)
+    while remainder > 0:
+        below_cap = [index for index in range(count - 1, -1, -1) if counts[index] < cap][:remainder]
+        if not below_cap:
+            break
+        for index in below_cap:
+            counts[index] += 1
+        remainder -= len(below_cap)
+    return counts
+
+
+def user_doc(user_id: int, role: str, password_hash: str, now: datetime) -> dict:
+    return {
+        "id": user_id,
+        "email": f"user{user_id}@example.com",
+        "full_name": f"User {user_id}",
+        "role": role,
+        "hashed_password": password_hash,
+        "is_active": True,
+        "language": "es",
+        "preferences": [],
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+def business_doc(business_id: int, owner_id: int, rng: random.Random, now: datetime) -> dict:
+    city, state, country, latitude, longitude, _ = rng.choices(CITIES, cum_weights=CITY_WEIGHTS)[0]
+    category = rng.choices(CATEGORY_NAMES, cum_weights=CATEGORY_WEIGHTS)[0]
+    tags = rng.sample(CATEGORIES[category][1], rng.randint(1, 4))
+    name = business_name(business_id)
+    business = {
+        "id": business_id,
+        "name": name,
+        "description": f"{category} in {city}: {', '.join(tags).lower()}. {rng.choice(REVIEW_TEXTS)}",
+        "category": category,
+        "location": {
+            "address": f"Av. {NAME_WORDS[business_id % len(NAME_WORDS)]} {rng.randint(1, 2000)}",
+            "city": city,
+            "state": state,
+            "country": country,
+            # Most places cluster around the center, about 3 km either way
+            "latitude": round(latitude + rng.gauss(0, 0.03), 6),
+            "longitude": round(longitude + rng.gauss(0, 0.03), 6),
+        },
+        "phone": f"+51 1 {rng.randint(200, 999)} {rng.randint(1000, 9999)}",
+        "website": f"https://example.com/{business_id}",
+        "price_level": rng.choices((1, 2, 3, 4), weights=(30, 40, 20, 10))[0],
+        "images": [f"/images/{business_id}-{n}.jpg" for n in range(rng.randint(1, 5))],
+        "tags": tags,
+        "owner_id": str(owner_id),
+        "rating": 0.0,
+        "review_count": 0,
+        "rating_sum": 0,
+        "rating_histogram": empty_rating_histogram(),
+        "views": rng.randint(0, 5000),
+        "created_at": now - timedelta(days=rng.randint(30, 1500)),
+        "updated_at": now,
+        "is_active": True,
+    }
+    business.update(derived_fields(business))
+    return business
+
+
+def generate_users(count: int, owners: int, password_hash: str, now: Optional[datetime] = None,
+                   first_id: int = 1) -> Iterator[dict]:
+    """The first `owners` users have the business role"""
+    now = now or datetime.utcnow()
+    for user_id in range(first_id, first_id + count):
+        yield user_doc(user_id, "business" if user_id < first_id + owners else "client", password_hash, now)
+
+
+def generate_businesses(
+    count: int,
+    users: int,
+    owners: int,
+    reviews: int,
+    zipf_exponent: float = 1.1,
+    seed: int = 42,
+    now: Optional[datetime] = None,
+    first_id: int = 1,
+    first_user_id: int = 1,
+    first_review_id: int = 1,
+) -> Iterator[Tuple[dict, List[dict]]]:
+    """
+    (business, its reviews) pairs. Review counts follow Zipf's law over the
+    businesses in id order (the first is the most reviewed) and each review
+    comes from a different user; the rating fields of the business match its
+    reviews.
+    """
+    rng = random.Random(seed)
+    now = now or datetime.utcnow()
+    counts = zipf_counts(reviews, count, zipf_exponent, cap=users)
+    review_id = first_review_id
+    for rank in range(count):
+        business_id = first_id + rank
+        owner_id = first_user_id + rng.randrange(max(1, owners))
+        business = business_doc(business_id, owner_id, rng, now)
+        quality = min(5.0, max(1.0, rng.gauss(3.9, 0.6)))
+        business_reviews = []
+        histogram = business["rating_histogram"]
+        for user_id in rng.sample(range(first_user_id, first_user_id + users), counts[rank]):
+            rating = min(5, max(1, round(rng.gauss(quality, 0.9))))
+            histogram[str(rating)] += 1
+            created_at = now - timedelta(minutes=rng.randint(0, 60 * 24 * 365))
+            business_reviews.append({
+                "id": review_id,
+                "business_id": business_id,
+                "user_id": str(user_id),
+                "user_name": f"User {user_id}",
+                "rating": rating,
+                "title": rng.choice(REVIEW_TITLES),
+                "text": rng.choice(REVIEW_TEXTS),
+                "images": [],
+                "helpful_count": rng.randint(0, 3),
+                "created_at": created_at,
+                "updated_at": created_at,
+            })
+            review_id += 1
+        business["review_count"] = len(business_reviews)
+        business["rating_sum"] = sum(review["rating"] for review in business_reviews)
+        if business_reviews:
+            business["rating"] = round(business["rating_sum"] / len(business_reviews), 1)
+        yield business, business_reviews
+
+
+def generate_trips(
+    users: int,
+    businesses: int,
+    trips_per_user: int,
+    activities: int,
+    zipf_exponent: float = 1.1,
+    seed: int = 43,
+    now: Optional[datetime] = None,
+    first_id: int = 1,
+    first_user_id: int = 1,
+    first_business_id: int = 1,
+) -> Iterator[dict]:
+    """Trips of every user; popular (low id) businesses show up in more of them"""
+    rng = random.Random(seed)
+    now = now or datetime.utcnow()
+    weights = zipf_weights(businesses, zipf_exponent)
+    trip_id = first_id
+    for user_id in range(first_user_id, first_user_id + users):
+        for _ in range(trips_per_user):
+            city = rng.choices(CITIES, cum_weights=CITY_WEIGHTS)[0][0]
+            start = (now + timedelta(days=rng.randint(-365, 180))).date()
+            chosen = sorted({
+                first_business_id + bisect_left(weights, rng.random() * weights[-1]) for _ in range(activities)
+            })
+            yield {
+                "id": trip_id,
+                "user_id": str(user_id),
+                "name": f"{city} trip {trip_id}",
+                "destination": city,
+                "start_date": start.isoformat(),
+                "end_date": (start + timedelta(days=rng.randint(2, 14))).isoformat(),
+                "activities": [
+                    {"business_id": str(business_id), "business_name": business_name(business_id)}
+                    for business_id in chosen
+                ],
+                "created_at": now,
+                "updated_at": now,
+            }
+            trip_id += 1
+
+
+def batched(documents: Iterator[dict], size: int) -> Iterator[List[dict]]:
+    """Lists of at most size documents"""
+    iterator = iter(documents)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def expected_reviews(reviews: int, businesses: int, users: int, zipf_exponent: float = 1.1) -> int:
+    """How many reviews generate_businesses produces (fewer than asked when capped by users)"""
+    return sum(zipf_counts(reviews, businesses, zipf_exponent, cap=users))
+
+
+class Scale(NamedTuple):
+    """How much data to generate"""
+    users: int
+    owners: int
+    businesses: int
+    reviews: int
+    trips_per_user: int = 1
+    activities: int = 6
+    zipf_exponent: float = 1.1
+    seed: int = 42
+
+    def counts(self) -> Dict[str, int]:
+        """Documents per collection"""
+        return {
+            "users": self.users,
+            "businesses": self.businesses,
+            "reviews": expected_reviews(self.reviews, self.businesses, self.users, self.zipf_exponent),
+            "trips": self.users * self.trips_per_user,
+        }
+
+
+def generate(scale: Scale, password_hash: str, first_ids: Dict[str, int], batch_size: int = 1000,
+             now: Optional[datetime] = None) -> Iterator[Tuple[str, List[dict]]]:
+    """(collection name, documents) batches of everything at a scale, ids starting at first_ids"""
+    now = now or datetime.utcnow()
+    users = generate_users(scale.users, scale.owners, password_hash, now, first_ids["users"])
+    for batch in batched(users, batch_size):
+        yield "users", batch
+
+    businesses, reviews = [], []
+    generated = generate_businesses(
+        scale.businesses, scale.users, scale.owners, scale.reviews, scale.zipf_exponent, scale.seed, now,
+        first_ids["businesses"], first_ids["users"], first_ids["reviews"],
+    )
+    for business, business_reviews in generated:
+        businesses.append(business)
+        reviews.extend(business_reviews)
+        if len(businesses) >= batch_size:
+            yield "businesses", businesses
+            businesses = []
+        while len(reviews) >= batch_size:
+            yield "reviews", reviews[:batch_size]
+            reviews = reviews[batch_size:]
+    if businesses:
+        yield "businesses", businesses
+    if reviews:
+        yield "reviews", reviews
+
+    trips = generate_trips(
+        scale.users, scale.businesses, scale.trips_per_user, scale.activities, scale.zipf_exponent,
+        scale.seed + 1, now, first_ids["trips"], first_ids["users"], first_ids["businesses"],
+    )
+    for batch in batched(trips, batch_size):
+        yield "trips", batch
+
+
+class Progress:
+    """Documents inserted per collection, printed every `interval` seconds"""
+
+    def __init__(self, totals: Dict[str, int], interval: float = 5.0):
+        self.totals = totals
+        self.interval = interval
+        self.inserted = {name: 0 for name in totals}
+        self.start = time.perf_counter()
+        self._printed = self.start
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def rate(self) -> float:
+        return sum(self.inserted.values()) / max(self.elapsed, 1e-9)
+
+    def add(self, collection_name: str, count: int):
+        self.inserted[collection_name] += count
+        now = time.perf_counter()
+        if self.interval and now - self._printed >= self.interval:
+            self._printed = now
+            print(self.line())
+
+    def line(self) -> str:
+        done = "  ".join(f"{name} {self.inserted[name]}/{total}" for name, total in self.totals.items())
+        return f"[{self.elapsed:7.1f}s] {done}  ({self.rate():,.0f} docs/s)"
+
+
+async def bulk_insert(db, batches: Iterable[Tuple[str, List[dict]]], workers: int = 4,
+                      progress: Optional[Progress] = None):
+    """
+    Unordered insert_many of every batch, up to `workers` at a time; the next
+    batches are generated while the earlier ones are being written
+    """
+    async def insert(collection_name: str, documents: List[dict]):
+        await db[collection_name].insert_many(documents, ordered=False)
+        if progress is not None:
+            progress.add(collection_name, len(documents))
+
+    pending = set()
+    try:
+        for collection_name, documents in batches:
+            if len(pending) >= workers:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+            pending.add(asyncio.ensure_future(insert(collection_name, documents)))
+        if pending:
+            await asyncio.gather(*pending)
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def seed(db, scale: Scale, password_hash: str, batch_size: int = 1000, workers: int = 4,
+               progress: Optional[Progress] = None) -> Dict[str, int]:
+    """
+    Insert the documents of a scale, with ids from blocks reserved on the
+    counters (one $inc per collection), so the app's sequences continue after
+    them. Returns the first id of each collection.
+    """
+    first_ids = {}
+    counters = CounterRepository(db)
+    for collection_name, count in scale.counts().items():
+        last = await counters.increment(collection_name, count)
+        first_ids[collection_name] = last - count + 1
+    await bulk_insert(db, generate(scale, password_hash, first_ids, batch_size), workers, progress)
+    return first_ids
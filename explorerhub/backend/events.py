@@ -0,0 +1,269 @@
+"""
+Append-only stream of activity events (views, reviews, trip adds)
+
+Events are buffered in memory and appended in batches to an EventStore:
+a MongoDB time-series collection, or a local append-only log with one
+JSON lines file per UTC day where time-series collections are not
+available. rollups.py compacts them into hourly and daily buckets.
+"""
+import asyncio
+import json
+import os
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from config import settings
+from database import Database
+from models.event import EVENT_COUNT_FIELDS, EVENT_TYPES
+
+
+class EventStore(ABC):
+    """Storage interface for raw events"""
+
+    async def setup(self):
+        """Create whatever the store needs; called once at startup"""
+
+    @abstractmethod
+    async def append(self, events: List[dict]):
+        """Append events ({"ts", "type", "business_id"})"""
+
+    @abstractmethod
+    def hourly_counts(self, start: datetime, end: datetime) -> AsyncIterator[dict]:
+        """
+        Per business and hour counts of the events in [start, end), as
+        {"business_id", "bucket", "views", "reviews", "trip_adds"}
+        """
+
+    async def expire(self, before: datetime):
+        """Drop events older than `before` (no-op where the store expires them itself)"""
+
+
+class MongoEventStore(EventStore):
+    """Events in a time-series collection whose TTL enforces the retention"""
+
+    def __init__(self, collection_name: str = "events", retention_days: int = 30, db=None):
+        self.collection_name = collection_name
+        self.retention_days = retention_days
+        self._db = db
+
+    @property
+    def db(self):
+        return self._db if self._db is not None else Database.get_db()
+
+    async def setup(self):
+        expire_after = int(self.retention_days * 86400)
+        existing = await self.db.list_collection_names(filter={"name": self.collection_name})
+        if not existing:
+            await self.db.create_collection(
+                self.collection_name,
+                timeseries={"timeField": "ts", "metaField": "meta", "granularity": "seconds"},
+                expireAfterSeconds=expire_after,
+            )
+        else:
+            # Keep the TTL in line with the configured retention
+            await self.db.command("collMod", self.collection_name, expireAfterSeconds=expire_after)
+
+    async def append(self, events: List[dict]):
+        await self.db[self.collection_name].insert_many([
+            {"ts": event["ts"], "meta": {"business_id": event["business_id"], "type": event["type"]}}
+            for event in events
+        ], ordered=False)
+
+    async def hourly_counts(self, start: datetime, end: datetime) -> AsyncIterator[dict]:
+        counts = {
+            field: {"$sum": {"$cond": [{"$eq": ["$meta.type", event_type]}, 1, 0]}}
+            for event_type, field in EVENT_COUNT_FIELDS.items()
+        }
+        pipeline = [
+            {"$match": {"ts": {"$gte": start, "$lt": end}}},
+            {"$group": {
+                "_id": {
+                    "business_id": "$meta.business_id",
+                    "bucket": {"$dateTrunc": {"date": "$ts", "unit": "hour"}},
+                },
+                **counts,
+            }},
+            {"$project": {
+                "_id": 0,
+                "business_id": "$_id.business_id",
+                "bucket": "$_id.bucket",
+                **{field: 1 for field in EVENT_COUNT_FIELDS.values()},
+            }},
+        ]
+        async for row in self.db[self.collection_name].aggregate(pipeline, allowDiskUse=True):
+            yield row
+
+
+class LogEventStore(EventStore):
+    """
+    Events in local append-only files, one per UTC day, each line being
+    [epoch milliseconds, type, business id]. Retention deletes whole files.
+    Only suitable for a single process.
+    """
+
+    def __init__(self, directory: str = "event_log"):
+        self.directory = directory
+
+    def _path(self, day: datetime) -> str:
+        return os.path.join(self.directory, f"events-{day:%Y%m%d}.jsonl")
+
+    async def setup(self):
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _write(self, events: List[dict]):
+        by_day: Dict[str, List[str]] = defaultdict(list)
+        for event in events:
+            ts = event["ts"]
+            millis = int((ts - datetime(1970, 1, 1)).total_seconds() * 1000)
+            by_day[self._path(ts)].append(json.dumps([millis, event["type"], event["business_id"]]))
+        for path, lines in by_day.items():
+            with open(path, "a", encoding="utf-8") as log:
+                log.write("\n".join(lines) + "\n")
+
+    async def append(self, events: List[dict]):
+        await asyncio.to_thread(self._write, events)
+
+    def _count(self, start: datetime, end: datetime) -> Dict[Tuple, Dict[str, int]]:
+        start_ms = int((start - datetime(1970, 1, 1)).total_seconds() * 1000)
+        end_ms = int((end - datetime(1970, 1, 1)).total_seconds() * 1000)
+        counts: Dict[Tuple, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(EVENT_COUNT_FIELDS.values(), 0))
+        day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        while day < end:
+            path = self._path(day)
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as log:
+                    for line in log:
+                        millis, event_type, business_id = json.loads(line)
+                        if start_ms <= millis < end_ms:
+                            bucket = millis - millis % 3_600_000
+                            counts[(business_id, bucket)][EVENT_COUNT_FIELDS[event_type]] += 1
+            day += timedelta(days=1)
+        return counts
+
+    async def hourly_counts(self, start: datetime, end: datetime) -> AsyncIterator[dict]:
+        counts = await asyncio.to_thread(self._count, start, end)
+        for (business_id, bucket), fields in counts.items():
+            yield {
+                "business_id": business_id,
+                "bucket": datetime(1970, 1, 1) + timedelta(milliseconds=bucket),
+                **fields,
+            }
+
+    def _expire(self, before: datetime):
+        if not os.path.isdir(self.directory):
+            return
+        oldest = self._path(before.replace(hour=0, minute=0, second=0, microsecond=0))
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith("events-") and path < oldest:
+                os.remove(path)
+
+    async def expire(self, before: datetime):
+        await asyncio.to_thread(self._expire, before)
+
+
+class EventRecorder:
+    """
+    Buffers events and appends them to the store every `flush_interval`
+    seconds or once `max_pending` events are waiting. A failed append is
+    retried on the next flush unless the buffer has grown past ten times
+    `max_pending`, in which case the batch is dropped.
+    """
+
+    def __init__(self, store: EventStore, flush_interval: float = 2.0, max_pending: int = 5000):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: List[dict] = []
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._size_flush: Optional[asyncio.Task] = None
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+
+    def record(self, event_type: str, business_id, ts: Optional[datetime] = None):
+        """Queue one event"""
+        if event_type not in EVENT_TYPES:
+            raise ValueError(f"Unknown event type: {event_type}")
+        self._pending.append({"ts": ts or datetime.utcnow(), "type": event_type, "business_id": business_id})
+        self.recorded += 1
+
+        if len(self._pending) >= self.max_pending and (self._size_flush is None or self._size_flush.done()):
+            self._size_flush = asyncio.ensure_future(self.flush())
+
+    async def flush(self) -> int:
+        """Append pending events; returns the number written"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            events, self._pending = self._pending, []
+            try:
+                await self.store.append(events)
+            except Exception as exc:
+                if len(self._pending) + len(events) <= self.max_pending * 10:
+                    self._pending = events + self._pending
+                else:
+                    self.dropped += len(events)
+                print(f"Event flush failed: {exc}")
+                return 0
+            self.flushes += 1
+            self.written += len(events)
+            return len(events)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def start(self):
+        """Prepare the store and start the periodic flush task"""
+        try:
+            await self.store.setup()
+        except Exception as exc:
+            print(f"Event store setup failed: {exc}")
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the periodic task and write whatever is still pending"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "store": type(self.store).__name__,
+            "recorded": self.recorded,
+            "written": self.written,
+            "pending": len(self._pending),
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+        }
+
+
+def create_event_store() -> EventStore:
+    if settings.event_store == "log":
+        return LogEventStore(settings.event_log_dir)
+    if settings.event_store == "mongo":
+        return MongoEventStore(retention_days=settings.event_retention_days)
+    raise ValueError("event_store must be 'mongo' or 'log'")
+
+
+event_store = create_event_store()
+
+event_recorder = EventRecorder(
+    event_store,
+    flush_interval=settings.event_flush_interval_seconds,
+    max_pending=settings.event_flush_max_pending,
+)
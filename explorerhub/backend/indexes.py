@@ -0,0 +1,259 @@
+"""
+Declared indexes, and their drift from what the database has
+
+Every model module, and rollups.py, lists the indexes its queries need in
+INDEXES. The
+IndexManager compares them with index_information() of each collection:
+missing ones are built (in the background at startup), ones with the same
+name but other keys or options are reported as conflicts, and with
+$indexStats the indexes nobody uses or that another index makes redundant
+are listed. INDEX_STRICT=true refuses to start while a required index is
+missing instead of building it.
+"""
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure, PyMongoError
+
+# Options that change what an index does; others (background, name) do not
+COMPARED_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+
+def normalize_keys(keys: Any) -> List[Tuple[str, Any]]:
+    if isinstance(keys, str):
+        return [(keys, 1)]
+    if isinstance(keys, dict):
+        keys = keys.items()
+    return [(field, int(direction) if isinstance(direction, float) else direction) for field, direction in keys]
+
+
+class IndexSpec:
+    """
+    One index of a collection. required=True marks indexes a query cannot do
+    without (uniqueness, $text, $geoNear) or that every request depends on;
+    `purpose` says which query it serves.
+    """
+
+    def __init__(self, collection_name: str, keys: Any, purpose: str = "", required: bool = False,
+                 name: Optional[str] = None, **options):
+        self.collection_name = collection_name
+        self.keys = normalize_keys(keys)
+        self.name = name or "_".join(f"{field}_{direction}" for field, direction in self.keys)
+        self.purpose = purpose
+        self.required = required
+        self.options = options
+
+    def __repr__(self) -> str:
+        return f"{self.collection_name}.{self.name}"
+
+    @property
+    def text(self) -> bool:
+        return any(direction == "text" for _, direction in self.keys)
+
+    def text_fields(self) -> set:
+        return {field for field, direction in self.keys if direction == "text"}
+
+    def model(self, background: bool = False) -> IndexModel:
+        options = dict(self.options)
+        if background:
+            options["background"] = True
+        return IndexModel(self.keys, name=self.name, **options)
+
+    def same_keys(self, info: dict) -> bool:
+        keys = normalize_keys(info["key"])
+        if self.text:
+            # MongoDB lists a text index as _fts/_ftsx with the fields in its weights
+            fields = set(info.get("weights") or ()) or {field for field, direction in keys if direction == "text"}
+            return any(direction == "text" for _, direction in keys) and fields == self.text_fields()
+        return keys == self.keys
+
+    def same_options(self, info: dict) -> bool:
+        for option in COMPARED_OPTIONS:
+            declared, actual = self.options.get(option), info.get(option)
+            if option in ("unique", "sparse"):
+                declared, actual = bool(declared), bool(actual)
+            if declared != actual:
+                return False
+        return not self.text or "weights" not in self.options or self.options["weights"] == info.get("weights")
+
+
+def declared_indexes() -> List[IndexSpec]:
+    """The indexes of every model module and of the event rollups"""
+    import rollups
+    from models import business, counter, owner_stats, review, trip, user
+    return [
+        *user.INDEXES, *business.INDEXES, *review.INDEXES, *trip.INDEXES, *counter.INDEXES,
+        *owner_stats.INDEXES, *rollups.INDEXES,
+    ]
+
+
+def collection_indexes(collection_name: str) -> List[IndexSpec]:
+    return [spec for spec in declared_indexes() if spec.collection_name == collection_name]
+
+
+def is_prefix(shorter: List[Tuple[str, Any]], longer: List[Tuple[str, Any]]) -> bool:
+    return len(shorter) < len(longer) and longer[:len(shorter)] == shorter
+
+
+class IndexManager:
+    """
+    Diffs and builds the declared indexes. check() reports, per declared
+    index, whether it is present, missing or in conflict, and lists the
+    indexes the database has that nobody declared. Builds run one at a time
+    in a background task at startup, so requests are served meanwhile
+    (possibly slowly, until the build finishes).
+    """
+
+    def __init__(self, specs_fn=declared_indexes):
+        self.specs_fn = specs_fn
+        self.missing: List[IndexSpec] = []
+        self.conflicts: List[IndexSpec] = []
+        self.building: Optional[IndexSpec] = None
+        self.built = 0
+        self.errors: Dict[str, str] = {}
+        self.last_check: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def check(self, db) -> Dict[str, Any]:
+        """Declared indexes against the database's"""
+        specs = self.specs_fn()
+        existing: Dict[str, Dict[str, dict]] = {}
+        for collection_name in sorted({spec.collection_name for spec in specs}):
+            existing[collection_name] = await db[collection_name].index_information()
+
+        report = {"present": [], "missing": [], "conflicts": [], "undeclared": []}
+        matched = set()
+        for spec in specs:
+            indexes = existing[spec.collection_name]
+            name, info = next(
+                ((name, info) for name, info in indexes.items() if spec.same_keys(info) and spec.same_options(info)),
+                (None, None),
+            )
+            if name is not None:
+                matched.add((spec.collection_name, name))
+                report["present"].append(spec)
+            elif spec.name in indexes:
+                matched.add((spec.collection_name, spec.name))
+                report["conflicts"].append(spec)
+            else:
+                report["missing"].append(spec)
+        for collection_name, indexes in existing.items():
+            for name, info in indexes.items():
+                if name != "_id_" and (collection_name, name) not in matched:
+                    report["undeclared"].append({"collection": collection_name, "name": name, "key": info["key"]})
+
+        self.missing = report["missing"]
+        self.conflicts = report["conflicts"]
+        self.last_check = datetime.utcnow()
+        return report
+
+    async def build(self, db, specs: List[IndexSpec], background: bool = True) -> int:
+        """Create indexes one at a time; failures (e.g. duplicates under a unique index) are recorded"""
+        built = 0
+        for spec in list(specs):
+            self.building = spec
+            try:
+                await db[spec.collection_name].create_indexes([spec.model(background)])
+            except PyMongoError as exc:
+                self.errors[repr(spec)] = str(exc)
+                print(f"Index build failed for {spec!r}: {exc}")
+            else:
+                built += 1
+                self.built += 1
+                self.errors.pop(repr(spec), None)
+                if spec in self.missing:
+                    self.missing.remove(spec)
+            finally:
+                self.building = None
+        return built
+
+    async def startup(self, db, strict: bool = False, build: bool = True):
+        """
+        Check the indexes at startup. Strict mode raises when a required index
+        is missing or conflicting; otherwise missing indexes are built in the
+        background.
+        """
+        report = await self.check(db)
+        blocking = [spec for spec in report["missing"] + report["conflicts"] if spec.required]
+        if strict and blocking:
+            raise RuntimeError(
+                "Required indexes are missing or differ (run scripts/create_indexes.py): "
+                + ", ".join(repr(spec) for spec in blocking)
+            )
+        for spec in report["conflicts"]:
+            print(f"Index {spec!r} exists with other keys or options; drop it to have it rebuilt")
+        if report["missing"]:
+            names = ", ".join(repr(spec) for spec in report["missing"])
+            if build:
+                print(f"Building {len(report['missing'])} missing indexes in the background: {names}")
+                self._task = asyncio.create_task(self.build(db, report["missing"]))
+            else:
+                print(f"Missing indexes: {names}")
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def usage(self, db) -> List[dict]:
+        """
+        Indexes of the declared collections with their $indexStats use since
+        the server started and why they may not be needed: "unused" (no use),
+        "redundant" (a prefix of another index with the same directions).
+        _id and unique indexes are never called unneeded; they enforce a constraint.
+        """
+        rows = []
+        for collection_name in sorted({spec.collection_name for spec in self.specs_fn()}):
+            collection = db[collection_name]
+            indexes = await collection.index_information()
+            try:
+                stats = {
+                    row["name"]: row for row in await collection.aggregate([{"$indexStats": {}}]).to_list(length=None)
+                }
+            except (OperationFailure, NotImplementedError):
+                stats = {}
+            for name, info in indexes.items():
+                keys = normalize_keys(info["key"])
+                accesses = (stats.get(name) or {}).get("accesses") or {}
+                row = {
+                    "collection": collection_name,
+                    "name": name,
+                    "key": keys,
+                    "ops": accesses.get("ops"),
+                    "since": accesses.get("since"),
+                    "notes": [],
+                }
+                if name == "_id_" or info.get("unique"):
+                    rows.append(row)
+                    continue
+                if row["ops"] == 0:
+                    row["notes"].append("unused")
+                plain = not any(info.get(option) for option in ("sparse", "partialFilterExpression", "expireAfterSeconds"))
+                covering = [
+                    other for other, other_info in indexes.items()
+                    if other != name and plain and is_prefix(keys, normalize_keys(other_info["key"]))
+                    and not other_info.get("partialFilterExpression") and not other_info.get("sparse")
+                ]
+                if covering:
+                    row["notes"].append(f"redundant with {', '.join(covering)}")
+                rows.append(row)
+        return rows
+
+    def stats(self) -> dict:
+        return {
+            "missing": len(self.missing),
+            "missing_required": sum(1 for spec in self.missing if spec.required),
+            "conflicts": len(self.conflicts),
+            "building": repr(self.building) if self.building else None,
+            "built": self.built,
+            "build_errors": len(self.errors),
+            "last_check": self.last_check.isoformat() if self.last_check else None,
+        }
+
+
+index_manager = IndexManager()
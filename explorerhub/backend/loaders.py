@@ -0,0 +1,93 @@
+"""
+Request-scoped batching of lookups by id (DataLoader style)
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+from fastapi import Depends
+from repositories import Repositories, get_repositories, public_repositories
+
+
+class DataLoader:
+    """
+    Collects the load(key) calls made while the event loop is busy with other
+    work and resolves them with one batch_fn(keys) call, which returns
+    {key: value} (absent keys resolve to None). Results are memoized for the
+    loader's lifetime, so create one per request and treat values as read-only.
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]], max_batch_size: int = 1000):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self._results: Dict[Hashable, asyncio.Future] = {}
+        self._queue: List[Hashable] = []
+        self.loads = 0
+        self.batches = 0
+
+    def load(self, key: Hashable) -> Awaitable[Optional[Any]]:
+        """Value for one key, fetched in the next batch"""
+        self.loads += 1
+        future = self._results.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._results[key] = loop.create_future()
+            self._queue.append(key)
+            if len(self._queue) == 1:
+                # Runs after the tasks that are already scheduled had their turn
+                loop.call_soon(self._dispatch)
+        return future
+
+    async def load_many(self, keys: List[Hashable]) -> List[Optional[Any]]:
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def _dispatch(self):
+        queue, self._queue = self._queue, []
+        for start in range(0, len(queue), self.max_batch_size):
+            asyncio.ensure_future(self._run_batch(queue[start:start + self.max_batch_size]))
+
+    async def _run_batch(self, keys: List[Hashable]):
+        self.batches += 1
+        try:
+            values = await self.batch_fn(keys)
+        except Exception as exc:
+            for key in keys:
+                # Not memoized, so a later load can retry
+                future = self._results.pop(key)
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for key in keys:
+            future = self._results[key]
+            if not future.done():
+                future.set_result(values.get(key))
+
+
+class Loaders:
+    """
+    The loaders of one request. loaders.get("businesses").load(42) does the
+    same as repos.businesses.get(42), except that concurrent calls share one
+    query.
+    """
+
+    def __init__(self, repos: Repositories):
+        self.repos = repos
+        self._loaders: Dict[tuple, DataLoader] = {}
+
+    def get(self, collection_name: str, projection: Optional[dict] = None) -> DataLoader:
+        key = (collection_name, repr(projection))
+        loader = self._loaders.get(key)
+        if loader is None:
+            repository = self.repos[collection_name]
+            loader = self._loaders[key] = DataLoader(lambda keys: repository.get_many(keys, projection))
+        return loader
+
+
+async def get_loaders(repos: Repositories = Depends(get_repositories)) -> Loaders:
+    """Dependency giving each request its own loaders"""
+    return Loaders(repos)
+
+
+def public_loaders(namespace: str):
+    """Dependency for loaders over public_repositories(namespace) (may read from a secondary)"""
+    async def dependency(repos: Repositories = Depends(public_repositories(namespace))) -> Loaders:
+        return Loaders(repos)
+    return dependency
@@ -1,16 +1,41 @@
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from database import Database
+from database import Database, pool_monitor
+from passwords import password_hasher
+from auth import principal_cache
+from view_counter import view_counter
+from response_cache import response_cache
+from events import event_recorder
+from rollups import event_rollup
+from metrics import MetricsMiddleware, metrics
+from slow_queries import slow_query_tracker
+from indexes import index_manager
 from config import settings
-from routes import auth, businesses, reviews, trips
+from routes import admin, auth, businesses, reviews, trips
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     await Database.connect_db()
+    # The events collection and the rollup TTL are set up before the indexes are checked
+    await event_recorder.start()
+    await event_rollup.setup()
+    await index_manager.startup(
+        Database.get_db(), strict=settings.index_strict, build=settings.index_build_on_startup
+    )
+    slow_query_tracker.start(Database.get_db())
+    view_counter.start()
+    await event_rollup.start()
     yield
     # Shutdown
+    await event_rollup.stop()
+    await event_recorder.stop()
+    await view_counter.stop()
+    password_hasher.shutdown()
+    slow_query_tracker.stop()
+    await index_manager.stop()
     await Database.close_db()
 
 app = FastAPI(
@@ -26,12 +51,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
+# Outermost, so the latency covers the other middleware too
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware, metrics=metrics)
+
 app.include_router(auth.router)
 app.include_router(businesses.router)
 app.include_router(reviews.router)
 app.include_router(trips.router)
+app.include_router(admin.router)
 
 @app.get("/")
 async def root():
@@ -39,4 +70,28 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "password_hasher": password_hasher.stats(),
+        "principal_cache": principal_cache.stats(),
+        "view_counter": view_counter.stats(),
+        "response_cache": response_cache.stats(),
+        "events": event_recorder.stats(),
+        "event_rollup": event_rollup.stats(),
+        "database_pool": pool_monitor.stats(),
+        "indexes": index_manager.stats(),
+    }
+
+metrics.register_stats("database_pool", pool_monitor.stats)
+metrics.register_stats("response_cache", response_cache.stats)
+metrics.register_stats("principal_cache", principal_cache.stats)
+metrics.register_stats("view_counter", view_counter.stats)
+metrics.register_stats("events", event_recorder.stats)
+metrics.register_stats("password_hasher", password_hasher.stats)
+metrics.register_stats("slow_queries", slow_query_tracker.stats)
+metrics.register_stats("indexes", index_manager.stats)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Request, database and component metrics in the Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
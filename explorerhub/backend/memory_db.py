@@ -0,0 +1,1643 @@
+"""
+In-memory stand-in for MongoDB
+
+Implements the part of the Motor API and of the query, update and
+aggregation languages that the app uses, on plain dicts held by the
+process, so the API can run and be benchmarked without a MongoDB server
+(DATABASE_BACKEND=memory). Fields passed to create_index get hash indexes
+that serve equality and $in lookups; unique indexes are enforced. Anything
+outside the supported subset raises NotImplementedError instead of
+silently behaving differently. Data is lost when the process exits.
+"""
+import math
+import re
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from bson import ObjectId
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from pymongo.results import (
+    BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult,
+)
+
+_MISSING = object()
+
+EARTH_RADIUS_METERS = 6378100.0
+# Words of text indexes and $text searches
+WORD = re.compile(r"\w+")
+
+
+def clone(value: Any) -> Any:
+    """Copy of a document; callers may mutate what they get back"""
+    if isinstance(value, dict):
+        return {key: clone(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [clone(item) for item in value]
+    return value
+
+
+def freeze(value: Any) -> Any:
+    """Hashable index key for a value"""
+    if isinstance(value, bool):
+        return ("bool", value)
+    if isinstance(value, dict):
+        return ("doc", tuple((key, freeze(item)) for key, item in value.items()))
+    if isinstance(value, list):
+        return ("list", tuple(freeze(item) for item in value))
+    return value
+
+
+# Sort order of BSON types
+def _type_rank(value: Any) -> int:
+    if value is None or value is _MISSING:
+        return 1
+    if isinstance(value, bool):
+        return 8
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, str):
+        return 3
+    if isinstance(value, dict):
+        return 4
+    if isinstance(value, list):
+        return 5
+    if isinstance(value, ObjectId):
+        return 7
+    if isinstance(value, datetime):
+        return 9
+    return 10
+
+
+def sort_key(value: Any) -> tuple:
+    rank = _type_rank(value)
+    if rank == 1:
+        return (rank, 0)
+    if rank in (4, 5, 10):
+        return (rank, repr(value))
+    if rank == 7:
+        return (rank, str(value))
+    return (rank, value)
+
+
+def compare(left: Any, right: Any) -> int:
+    """-1, 0 or 1 like MongoDB's comparison across types"""
+    left_key, right_key = sort_key(left), sort_key(right)
+    return (left_key > right_key) - (left_key < right_key)
+
+
+def values_equal(left: Any, right: Any) -> bool:
+    return _type_rank(left) == _type_rank(right) and left == right
+
+
+# Paths
+
+def field_values(doc: Any, path: str) -> List[Any]:
+    """Values at a dotted path, descending into arrays like a query does"""
+    values = [doc]
+    for part in path.split("."):
+        found = []
+        for value in values:
+            if isinstance(value, dict):
+                if part in value:
+                    found.append(value[part])
+            elif isinstance(value, list):
+                if part.isdigit():
+                    index = int(part)
+                    if index < len(value):
+                        found.append(value[index])
+                for item in value:
+                    if isinstance(item, dict) and part in item:
+                        found.append(item[part])
+        values = found
+    return values
+
+
+def get_path(doc: Any, path: str) -> Any:
+    """Value at a dotted path, without descending into arrays (_MISSING when absent)"""
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, dict):
+            value = value.get(part, _MISSING)
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return _MISSING
+        if value is _MISSING:
+            return _MISSING
+    return value
+
+
+def set_path(doc: dict, path: str, value: Any):
+    parts = path.split(".")
+    target = doc
+    for part in parts[:-1]:
+        child = target.get(part)
+        if not isinstance(child, dict):
+            child = target[part] = {}
+        target = child
+    target[parts[-1]] = value
+
+
+def _expanded(values: List[Any]) -> List[Any]:
+    """Values plus the elements of array values, the candidates a condition is tested against"""
+    expanded = []
+    for value in values:
+        expanded.append(value)
+        if isinstance(value, list):
+            expanded.extend(value)
+    return expanded
+
+
+# Queries
+
+def _regex(pattern: Any, options: str = "") -> "re.Pattern":
+    if isinstance(pattern, re.Pattern):
+        return pattern
+    flags = 0
+    for option in options:
+        flags |= {"i": re.IGNORECASE, "m": re.MULTILINE, "s": re.DOTALL, "x": re.VERBOSE}.get(option, 0)
+    return re.compile(pattern, flags)
+
+
+def _eq(values: List[Any], target: Any) -> bool:
+    if isinstance(target, re.Pattern):
+        return any(isinstance(value, str) and target.search(value) for value in _expanded(values))
+    if target is None:
+        return not values or any(value is None for value in _expanded(values))
+    return any(values_equal(value, target) for value in _expanded(values))
+
+
+def _ordered(values: List[Any], target: Any, test: Callable[[int], bool]) -> bool:
+    rank = _type_rank(target)
+    return any(
+        _type_rank(value) == rank and test(compare(value, target))
+        for value in _expanded(values)
+    )
+
+
+def _match_operators(values: List[Any], condition: dict) -> bool:
+    for operator, operand in condition.items():
+        if operator == "$options":
+            continue
+        if operator == "$eq":
+            matched = _eq(values, operand)
+        elif operator == "$ne":
+            matched = not _eq(values, operand)
+        elif operator == "$gt":
+            matched = _ordered(values, operand, lambda order: order > 0)
+        elif operator == "$gte":
+            matched = _ordered(values, operand, lambda order: order >= 0)
+        elif operator == "$lt":
+            matched = _ordered(values, operand, lambda order: order < 0)
+        elif operator == "$lte":
+            matched = _ordered(values, operand, lambda order: order <= 0)
+        elif operator == "$in":
+            matched = any(_eq(values, target) for target in operand)
+        elif operator == "$nin":
+            matched = not any(_eq(values, target) for target in operand)
+        elif operator == "$exists":
+            matched = bool(values) == bool(operand)
+        elif operator == "$regex":
+            matched = _eq(values, _regex(operand, condition.get("$options", "")))
+        elif operator == "$not":
+            matched = not (
+                _eq(values, operand) if isinstance(operand, re.Pattern) else _match_operators(values, operand)
+            )
+        elif operator == "$size":
+            matched = any(isinstance(value, list) and len(value) == operand for value in values)
+        elif operator == "$all":
+            matched = all(_eq(values, target) for target in operand)
+        elif operator == "$elemMatch":
+            matched = any(
+                isinstance(value, list) and any(_element_matches(item, operand) for item in value)
+                for value in values
+            )
+        else:
+            raise NotImplementedError(f"Query operator {operator} is not supported by the in-memory database")
+        if not matched:
+            return False
+    return True
+
+
+def _is_operator_dict(condition: Any) -> bool:
+    return isinstance(condition, dict) and bool(condition) and all(key.startswith("$") for key in condition)
+
+
+def _element_matches(item: Any, condition: Any) -> bool:
+    """An array element against an $elemMatch / $pull / array filter condition"""
+    if _is_operator_dict(condition):
+        return _match_operators([item], condition)
+    if isinstance(condition, dict):
+        return isinstance(item, dict) and matches(item, condition)
+    return _eq([item], condition)
+
+
+def matches(doc: dict, query: Optional[dict]) -> bool:
+    if not query:
+        return True
+    for key, condition in query.items():
+        if key == "$and":
+            if not all(matches(doc, part) for part in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, part) for part in condition):
+                return False
+        elif key == "$nor":
+            if any(matches(doc, part) for part in condition):
+                return False
+        elif key == "$expr":
+            if not evaluate(condition, doc):
+                return False
+        elif key == "$text":
+            # Resolved by the collection through its text index
+            continue
+        elif key.startswith("$"):
+            raise NotImplementedError(f"Query operator {key} is not supported by the in-memory database")
+        else:
+            values = field_values(doc, key)
+            if _is_operator_dict(condition):
+                if not _match_operators(values, condition):
+                    return False
+            elif not _eq(values, condition):
+                return False
+    return True
+
+
+# Expressions
+
+def _path_value(doc: Any, path: str) -> Any:
+    """Aggregation field path: arrays of documents map to arrays of their field"""
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, dict):
+            value = value.get(part, _MISSING)
+        elif isinstance(value, list):
+            value = [item[part] for item in value if isinstance(item, dict) and part in item]
+        else:
+            return _MISSING
+        if value is _MISSING:
+            return _MISSING
+    return value
+
+
+def _number(value: Any) -> Any:
+    return None if value is _MISSING else value
+
+
+def _date_argument(operand: Any, doc: dict) -> Optional[datetime]:
+    if isinstance(operand, dict) and "date" in operand:
+        operand = operand["date"]
+    value = evaluate(operand, doc)
+    return value if isinstance(value, datetime) else None
+
+
+def _truncate_date(value: datetime, unit: str, bin_size: int = 1) -> datetime:
+    if unit == "minute":
+        value = value.replace(second=0, microsecond=0)
+        return value - timedelta(minutes=value.minute % bin_size)
+    if unit == "hour":
+        value = value.replace(minute=0, second=0, microsecond=0)
+        return value - timedelta(hours=value.hour % bin_size)
+    if unit == "day":
+        return value.replace(hour=0, minute=0, second=0, microsecond=0)
+    if unit == "month":
+        return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    if unit == "year":
+        return value.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+    raise NotImplementedError(f"$dateTrunc unit {unit} is not supported by the in-memory database")
+
+
+def evaluate(expression: Any, doc: dict) -> Any:
+    """Value of an aggregation expression for one document (_MISSING for missing fields)"""
+    if isinstance(expression, str):
+        if expression == "$$ROOT":
+            return doc
+        if expression == "$$NOW":
+            return datetime.utcnow()
+        if expression.startswith("$$"):
+            raise NotImplementedError(f"Variable {expression} is not supported by the in-memory database")
+        if expression.startswith("$"):
+            return _path_value(doc, expression[1:])
+        return expression
+    if isinstance(expression, list):
+        return [_number(evaluate(item, doc)) for item in expression]
+    if not isinstance(expression, dict):
+        return expression
+    if len(expression) != 1 or not next(iter(expression)).startswith("$"):
+        return {key: _number(evaluate(value, doc)) for key, value in expression.items()}
+
+    operator, operand = next(iter(expression.items()))
+    if operator == "$literal":
+        return operand
+
+    def args() -> List[Any]:
+        operands = operand if isinstance(operand, list) else [operand]
+        return [_number(evaluate(item, doc)) for item in operands]
+
+    if operator in ("$add", "$multiply"):
+        values = args()
+        if any(value is None for value in values):
+            return None
+        if operator == "$multiply":
+            return math.prod(values)
+        total = 0
+        date = None
+        for value in values:
+            if isinstance(value, datetime):
+                date = value
+            else:
+                total += value
+        return date + timedelta(milliseconds=total) if date is not None else total
+    if operator in ("$subtract", "$divide", "$mod"):
+        left, right = args()
+        if left is None or right is None:
+            return None
+        if operator == "$divide":
+            return left / right
+        if operator == "$mod":
+            return math.fmod(left, right)
+        if isinstance(left, datetime) and isinstance(right, datetime):
+            return int((left - right).total_seconds() * 1000)
+        if isinstance(left, datetime):
+            return left - timedelta(milliseconds=right)
+        return left - right
+    if operator == "$round":
+        values = args()
+        value, places = values[0], (values[1] if len(values) > 1 else 0)
+        return None if value is None else round(value, places)
+    if operator == "$abs":
+        value = args()[0]
+        return None if value is None else abs(value)
+    if operator == "$ifNull":
+        values = args()
+        for value in values[:-1]:
+            if value is not None:
+                return value
+        return values[-1]
+    if operator == "$cond":
+        if isinstance(operand, dict):
+            condition, then, otherwise = operand["if"], operand["then"], operand["else"]
+        else:
+            condition, then, otherwise = operand
+        return _number(evaluate(then if _truthy(evaluate(condition, doc)) else otherwise, doc))
+    if operator in ("$eq", "$ne", "$gt", "$gte", "$lt", "$lte"):
+        left, right = args()
+        order = compare(left, right)
+        return {
+            "$eq": order == 0, "$ne": order != 0, "$gt": order > 0,
+            "$gte": order >= 0, "$lt": order < 0, "$lte": order <= 0,
+        }[operator]
+    if operator == "$and":
+        return all(_truthy(value) for value in args())
+    if operator == "$or":
+        return any(_truthy(value) for value in args())
+    if operator == "$not":
+        return not _truthy(args()[0])
+    if operator == "$in":
+        value, array = args()
+        return any(values_equal(value, item) for item in array or [])
+    if operator == "$size":
+        value = args()[0]
+        if not isinstance(value, list):
+            raise ValueError("The argument to $size must be an array")
+        return len(value)
+    if operator in ("$sum", "$avg", "$min", "$max"):
+        values = args()
+        if len(values) == 1 and isinstance(values[0], list):
+            values = values[0]
+        numbers = [value for value in values if isinstance(value, (int, float)) and not isinstance(value, bool)]
+        if operator == "$sum":
+            return sum(numbers)
+        if operator == "$avg":
+            return sum(numbers) / len(numbers) if numbers else None
+        present = [value for value in values if value is not None]
+        if not present:
+            return None
+        ordered = sorted(present, key=sort_key)
+        return ordered[0] if operator == "$min" else ordered[-1]
+    if operator == "$arrayElemAt":
+        array, index = args()
+        if not isinstance(array, list) or not -len(array) <= index < len(array):
+            return _MISSING
+        return array[index]
+    if operator == "$slice":
+        array, *count = args()
+        if not isinstance(array, list):
+            return None
+        return _slice(array, count if len(count) == 2 else count[0])
+    if operator == "$concat":
+        values = args()
+        return None if any(value is None for value in values) else "".join(values)
+    if operator == "$toLower":
+        value = args()[0]
+        return "" if value is None else str(value).lower()
+    if operator == "$toString":
+        value = args()[0]
+        return None if value is None else str(value)
+    if operator in ("$year", "$month", "$dayOfMonth", "$hour", "$minute"):
+        value = _date_argument(operand, doc)
+        if value is None:
+            return None
+        return getattr(value, {
+            "$year": "year", "$month": "month", "$dayOfMonth": "day", "$hour": "hour", "$minute": "minute",
+        }[operator])
+    if operator == "$dateFromParts":
+        parts = {key: _number(evaluate(value, doc)) for key, value in operand.items()}
+        return datetime(
+            parts["year"], parts.get("month", 1), parts.get("day", 1),
+            parts.get("hour", 0), parts.get("minute", 0), parts.get("second", 0),
+        )
+    if operator == "$dateTrunc":
+        value = _date_argument(operand, doc)
+        if value is None:
+            return None
+        return _truncate_date(value, operand["unit"], operand.get("binSize", 1))
+    raise NotImplementedError(f"Expression operator {operator} is not supported by the in-memory database")
+
+
+def _truthy(value: Any) -> bool:
+    return value not in (None, False, 0, _MISSING)
+
+
+# Projections
+
+class Projection:
+    """A find or $project projection, parsed once and applied per document"""
+
+    def __init__(self, spec: Optional[dict], aggregation: bool = False):
+        self.spec = spec
+        self.include_id = True
+        self.included: List[List[str]] = []
+        self.excluded: List[List[str]] = []
+        self.slices: Dict[str, Any] = {}
+        self.computed: Dict[str, Any] = {}
+        self.score_fields: List[str] = []
+        for path, value in (spec or {}).items():
+            if path == "_id" and not isinstance(value, (dict, str)):
+                self.include_id = bool(value)
+            elif isinstance(value, dict) and "$slice" in value and len(value) == 1 and not _is_expression(value["$slice"]):
+                if aggregation:
+                    # MongoDB rejects find's {"$slice": n} in $project; so must this backend
+                    raise OperationFailure(
+                        "Expression $slice takes at least 2 arguments, and at most 3, but 1 were passed in.",
+                        code=28667,
+                    )
+                self.slices[path] = value["$slice"]
+            elif isinstance(value, dict) and value.get("$meta") == "textScore":
+                self.score_fields.append(path)
+            elif isinstance(value, (dict, str, list)):
+                self.computed[path] = value
+            elif value:
+                self.included.append(path.split("."))
+            else:
+                self.excluded.append(path.split("."))
+        self.inclusive = bool(self.included or self.computed)
+
+    def apply(self, doc: dict, score: Optional[float] = None) -> dict:
+        if self.spec is None:
+            return clone(doc)
+        if self.inclusive:
+            result = {}
+            if self.include_id and "_id" in doc:
+                result["_id"] = doc["_id"]
+            for parts in self.included:
+                _copy_path(doc, result, parts)
+            for path in self.slices:
+                value = get_path(doc, path)
+                if value is not _MISSING:
+                    set_path(result, path, clone(value))
+        else:
+            result = clone(doc)
+            if not self.include_id:
+                result.pop("_id", None)
+            for parts in self.excluded:
+                _remove_path(result, parts)
+        for path, count in self.slices.items():
+            value = get_path(result, path)
+            if isinstance(value, list):
+                set_path(result, path, _slice(value, count))
+        for path, expression in self.computed.items():
+            value = evaluate(expression, doc)
+            if value is not _MISSING:
+                set_path(result, path, clone(value))
+        for path in self.score_fields:
+            set_path(result, path, score or 0.0)
+        return result
+
+
+def _is_expression(count: Any) -> bool:
+    """True for the $project form {"$slice": ["$field", n]} as opposed to find's {"$slice": n}"""
+    return isinstance(count, list) and bool(count) and isinstance(count[0], str)
+
+
+def _copy_path(source: dict, target: dict, parts: List[str]):
+    key = parts[0]
+    if key not in source:
+        return
+    value = source[key]
+    if len(parts) == 1:
+        target[key] = clone(value)
+    elif isinstance(value, dict):
+        child = target.get(key)
+        if not isinstance(child, dict):
+            child = target[key] = {}
+        _copy_path(value, child, parts[1:])
+    elif isinstance(value, list):
+        items = [item for item in value if isinstance(item, dict)]
+        children = target.get(key)
+        if not isinstance(children, list):
+            children = target[key] = [{} for _ in items]
+        for item, child in zip(items, children):
+            _copy_path(item, child, parts[1:])
+
+
+def _remove_path(doc: Any, parts: List[str]):
+    if isinstance(doc, list):
+        for item in doc:
+            _remove_path(item, parts)
+    elif isinstance(doc, dict):
+        if len(parts) == 1:
+            doc.pop(parts[0], None)
+        elif parts[0] in doc:
+            _remove_path(doc[parts[0]], parts[1:])
+
+
+def _slice(values: list, count: Any) -> list:
+    if isinstance(count, list):
+        skip, limit = count
+        start = skip if skip >= 0 else max(0, len(values) + skip)
+        return values[start:start + limit]
+    return values[:count] if count >= 0 else values[count:]
+
+
+# Sorting
+
+def sort_documents(items: List[Any], sort: List[Tuple[str, Any]], key: Callable[[Any], dict] = lambda item: item,
+                   scores: Optional[Dict[int, float]] = None) -> List[Any]:
+    """Stable multi-key sort; a {"$meta": "textScore"} direction sorts by relevance"""
+    items = list(items)
+    for field, direction in reversed(sort):
+        if isinstance(direction, dict):
+            items.sort(key=lambda item: (scores or {}).get(id(key(item)), 0.0), reverse=True)
+        else:
+            items.sort(key=lambda item: _sort_value(key(item), field, direction), reverse=direction < 0)
+    return items
+
+
+def _sort_value(doc: dict, field: str, direction: int) -> tuple:
+    values = field_values(doc, field)
+    if not values:
+        return sort_key(None)
+    candidates = []
+    for value in values:
+        if isinstance(value, list):
+            candidates.extend(value or [None])
+        else:
+            candidates.append(value)
+    # Arrays sort by their smallest element ascending, largest descending
+    keys = [sort_key(value) for value in candidates]
+    return min(keys) if direction > 0 else max(keys)
+
+
+def normalize_sort(key_or_list: Any, direction: Any = None) -> List[Tuple[str, Any]]:
+    if key_or_list is None:
+        return []
+    if isinstance(key_or_list, str):
+        return [(key_or_list, 1 if direction is None else direction)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return [tuple(item) for item in key_or_list]
+
+
+# Updates
+
+def _array_filter_conditions(array_filters: Optional[List[dict]]) -> Dict[str, dict]:
+    """{identifier: condition on the element}, with the element wrapped as {"": element}"""
+    conditions: Dict[str, dict] = {}
+    for array_filter in array_filters or []:
+        for path, condition in array_filter.items():
+            identifier, _, rest = path.partition(".")
+            conditions.setdefault(identifier, {})["." + rest if rest else ""] = condition
+    return conditions
+
+
+def _filtered_element_matches(item: Any, condition: dict) -> bool:
+    wrapped = {"": item}
+    return all(
+        _element_matches(item, value) if path == "" else matches(wrapped, {path: value})
+        for path, value in condition.items()
+    )
+
+
+def _update_path(target: Any, parts: List[str], change: Callable[[Any], Any], filters: Dict[str, dict], create: bool):
+    part = parts[0]
+    last = len(parts) == 1
+    if isinstance(target, list):
+        if part == "$[]":
+            indices = range(len(target))
+        elif part.startswith("$[") and part.endswith("]"):
+            condition = filters.get(part[2:-1])
+            if condition is None:
+                raise ValueError(f"No array filter found for identifier {part[2:-1]}")
+            indices = [index for index, item in enumerate(target) if _filtered_element_matches(item, condition)]
+        elif part.isdigit():
+            index = int(part)
+            if index >= len(target):
+                if not create:
+                    return
+                target.extend([None] * (index + 1 - len(target)))
+            indices = [index]
+        else:
+            raise NotImplementedError(f"Update path part {part} on an array is not supported by the in-memory database")
+        for index in indices:
+            if last:
+                value = change(target[index])
+                target[index] = None if value is _MISSING else value
+            elif isinstance(target[index], (dict, list)):
+                _update_path(target[index], parts[1:], change, filters, create)
+        return
+    if not isinstance(target, dict):
+        raise ValueError(f"Cannot apply an update to {part} of a non-document value")
+    if last:
+        value = change(target.get(part, _MISSING))
+        if value is _MISSING:
+            target.pop(part, None)
+        else:
+            target[part] = value
+        return
+    child = target.get(part)
+    if not isinstance(child, (dict, list)):
+        if not create:
+            return
+        child = target[part] = {}
+    _update_path(child, parts[1:], change, filters, create)
+
+
+def apply_update(doc: dict, update: Any, inserting: bool = False, array_filters: Optional[List[dict]] = None) -> bool:
+    """Apply update operators or an update pipeline to doc in place; returns whether it changed"""
+    if isinstance(update, list):
+        result = run_stages([clone(doc)], update)[0]
+        if "_id" in doc:
+            result["_id"] = doc["_id"]
+        changed = result != doc
+        doc.clear()
+        doc.update(result)
+        return changed
+
+    filters = _array_filter_conditions(array_filters)
+    changed = False
+
+    def apply(path: str, change: Callable[[Any], Any], create: bool = True):
+        def tracked(old):
+            nonlocal changed
+            new = change(old)
+            if new is not old and (new is _MISSING or old is _MISSING or not values_equal(new, old)):
+                changed = True
+            return new
+        _update_path(doc, path.split("."), tracked, filters, create)
+
+    for operator, fields in update.items():
+        for path, operand in fields.items():
+            if operator == "$set":
+                apply(path, lambda old, value=operand: clone(value))
+            elif operator == "$setOnInsert":
+                if inserting:
+                    apply(path, lambda old, value=operand: clone(value))
+            elif operator == "$unset":
+                apply(path, lambda old: _MISSING, create=False)
+            elif operator == "$inc":
+                apply(path, lambda old, delta=operand: delta if old in (_MISSING, None) else old + delta)
+            elif operator == "$mul":
+                apply(path, lambda old, factor=operand: 0 if old in (_MISSING, None) else old * factor)
+            elif operator == "$min":
+                apply(path, lambda old, value=operand: value if old is _MISSING or compare(value, old) < 0 else old)
+            elif operator == "$max":
+                apply(path, lambda old, value=operand: value if old is _MISSING or compare(value, old) > 0 else old)
+            elif operator == "$currentDate":
+                apply(path, lambda old: datetime.utcnow())
+            elif operator == "$push":
+                apply(path, lambda old, value=operand: _push(old, value))
+            elif operator == "$addToSet":
+                apply(path, lambda old, value=operand: _add_to_set(old, value))
+            elif operator == "$pull":
+                apply(path, lambda old, condition=operand: _pull(old, condition), create=False)
+            else:
+                raise NotImplementedError(f"Update operator {operator} is not supported by the in-memory database")
+    return changed
+
+
+def _push(old: Any, value: Any) -> list:
+    array = [] if old in (_MISSING, None) else list(old)
+    if isinstance(value, dict) and "$each" in value:
+        array.extend(clone(value["$each"]))
+        if "$slice" in value:
+            array = _slice(array, value["$slice"])
+    else:
+        array.append(clone(value))
+    return array
+
+
+def _add_to_set(old: Any, value: Any) -> list:
+    array = [] if old in (_MISSING, None) else list(old)
+    items = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+    for item in items:
+        if not any(values_equal(existing, item) for existing in array):
+            array.append(clone(item))
+    return array
+
+
+def _pull(old: Any, condition: Any) -> Any:
+    if not isinstance(old, list):
+        return old
+    return [item for item in old if not _element_matches(item, condition)]
+
+
+def _upsert_seed(query: dict) -> dict:
+    """Document an upsert starts from: the equality conditions of its filter"""
+    doc: dict = {}
+    for key, condition in (query or {}).items():
+        if key == "$and":
+            for part in condition:
+                for path, value in _upsert_seed(part).items():
+                    doc[path] = value
+        elif key.startswith("$"):
+            continue
+        elif _is_operator_dict(condition):
+            if "$eq" in condition:
+                set_path(doc, key, clone(condition["$eq"]))
+        elif not isinstance(condition, re.Pattern):
+            set_path(doc, key, clone(condition))
+    return doc
+
+
+# Aggregation
+
+def _group_key(value: Any) -> Any:
+    return freeze(None if value is _MISSING else value)
+
+
+def _accumulate(spec: dict, docs: List[dict]) -> List[dict]:
+    id_expression = spec["_id"]
+    accumulators = {field: next(iter(value.items())) for field, value in spec.items() if field != "_id"}
+    states: Dict[Any, dict] = {}
+    order: List[Any] = []
+    for doc in docs:
+        group_id = _number(evaluate(id_expression, doc))
+        key = _group_key(group_id)
+        state = states.get(key)
+        if state is None:
+            state = states[key] = {"_id": group_id, "_values": {field: [] for field in accumulators}}
+            order.append(key)
+        for field, (operator, expression) in accumulators.items():
+            state["_values"][field].append(evaluate(expression, doc) if operator != "$count" else 1)
+
+    results = []
+    for key in order:
+        state = states[key]
+        result = {"_id": state["_id"]}
+        for field, (operator, _) in accumulators.items():
+            values = state["_values"][field]
+            present = [value for value in values if value is not _MISSING]
+            numbers = [value for value in present if isinstance(value, (int, float)) and not isinstance(value, bool)]
+            if operator in ("$sum", "$count"):
+                result[field] = sum(numbers)
+            elif operator == "$avg":
+                result[field] = sum(numbers) / len(numbers) if numbers else None
+            elif operator in ("$min", "$max"):
+                non_null = sorted((value for value in present if value is not None), key=sort_key)
+                result[field] = (non_null[0] if operator == "$min" else non_null[-1]) if non_null else None
+            elif operator == "$first":
+                result[field] = _number(values[0]) if values else None
+            elif operator == "$last":
+                result[field] = _number(values[-1]) if values else None
+            elif operator == "$push":
+                result[field] = [clone(value) for value in present]
+            elif operator == "$addToSet":
+                result[field] = _add_to_set([], {"$each": present})
+            else:
+                raise NotImplementedError(f"Accumulator {operator} is not supported by the in-memory database")
+        results.append(result)
+    return results
+
+
+def _unwind(docs: List[dict], spec: Any) -> List[dict]:
+    if isinstance(spec, str):
+        spec = {"path": spec}
+    path = spec["path"][1:]
+    keep_empty = spec.get("preserveNullAndEmptyArrays", False)
+    results = []
+    for doc in docs:
+        value = get_path(doc, path)
+        if isinstance(value, list) and value:
+            for item in value:
+                unwound = clone(doc)
+                set_path(unwound, path, clone(item))
+                results.append(unwound)
+        elif isinstance(value, list) or value in (None, _MISSING):
+            if keep_empty:
+                results.append(doc)
+        else:
+            results.append(doc)
+    return results
+
+
+def haversine_meters(first: List[float], second: List[float]) -> float:
+    """Distance between two [lng, lat] points on a sphere, in meters"""
+    lng1, lat1, lng2, lat2 = map(math.radians, (*first, *second))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * math.asin(min(1.0, math.sqrt(a)))
+
+
+# Stages that never modify their input documents
+READ_ONLY_STAGES = {"$match", "$sort", "$skip", "$limit", "$count", "$group", "$project"}
+# Stages that output new documents
+RESHAPING_STAGES = {"$count", "$group", "$project"}
+
+
+def _facet(docs: List[dict], stages: List[dict], database: Optional["MemoryDatabase"]) -> List[dict]:
+    """One $facet sub-pipeline; the documents are only copied for stages that modify them"""
+    names = [next(iter(stage)) for stage in stages]
+    if not all(name in READ_ONLY_STAGES for name in names):
+        return run_stages([clone(doc) for doc in docs], stages, database)
+    results = run_stages(list(docs), stages, database)
+    # Facets must not share output documents
+    return results if any(name in RESHAPING_STAGES for name in names) else [clone(doc) for doc in results]
+
+
+def run_stages(docs: List[dict], pipeline: List[dict], database: Optional["MemoryDatabase"] = None) -> List[dict]:
+    """Run aggregation stages over documents the caller owns (they may be modified)"""
+    for stage in pipeline:
+        name, spec = next(iter(stage.items()))
+        if name == "$match":
+            docs = [doc for doc in docs if matches(doc, spec)]
+        elif name == "$project":
+            projection = Projection(spec, aggregation=True)
+            docs = [projection.apply(doc) for doc in docs]
+        elif name in ("$set", "$addFields"):
+            for doc in docs:
+                values = {field: evaluate(expression, doc) for field, expression in spec.items()}
+                for field, value in values.items():
+                    if value is _MISSING:
+                        _remove_path(doc, field.split("."))
+                    else:
+                        set_path(doc, field, clone(value))
+        elif name == "$unset":
+            for doc in docs:
+                for field in [spec] if isinstance(spec, str) else spec:
+                    _remove_path(doc, field.split("."))
+        elif name == "$group":
+            docs = _accumulate(spec, docs)
+        elif name == "$sort":
+            docs = sort_documents(docs, normalize_sort(spec))
+        elif name == "$skip":
+            docs = docs[spec:]
+        elif name == "$limit":
+            docs = docs[:spec]
+        elif name == "$count":
+            docs = [{spec: len(docs)}] if docs else []
+        elif name == "$unwind":
+            docs = _unwind(docs, spec)
+        elif name in ("$replaceRoot", "$replaceWith"):
+            expression = spec["newRoot"] if name == "$replaceRoot" else spec
+            docs = [clone(evaluate(expression, doc)) for doc in docs]
+        elif name == "$facet":
+            docs = [{field: _facet(docs, stages, database) for field, stages in spec.items()}]
+        elif name == "$merge":
+            if database is None:
+                raise NotImplementedError("$merge needs a database")
+            database[spec["into"]]._merge(docs, spec)
+            docs = []
+        else:
+            raise NotImplementedError(f"Aggregation stage {name} is not supported by the in-memory database")
+    return docs
+
+
+# Collections
+
+class MemoryCursor:
+    """Lazy find() cursor; the query runs on to_list or iteration"""
+
+    def __init__(self, collection: "MemoryCollection", query: Optional[dict], projection: Optional[dict]):
+        self.collection = collection
+        self.query = query or {}
+        self.projection = projection
+        self._sort: List[Tuple[str, Any]] = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key_or_list: Any, direction: Any = None) -> "MemoryCursor":
+        self._sort = normalize_sort(key_or_list, direction)
+        return self
+
+    def skip(self, count: int) -> "MemoryCursor":
+        self._skip = count
+        return self
+
+    def limit(self, count: int) -> "MemoryCursor":
+        self._limit = count
+        return self
+
+    def batch_size(self, size: int) -> "MemoryCursor":
+        return self
+
+    def _results(self, length: Optional[int] = None) -> List[dict]:
+        limit = self._limit
+        if length is not None and (not limit or length < limit):
+            limit = length
+        return self.collection._find(self.query, self.projection, self._sort, self._skip, limit)
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        return self._results(length)
+
+    def __aiter__(self):
+        return _AsyncIterator(self._results())
+
+
+class MemoryCommandCursor:
+    """aggregate() cursor; the pipeline runs on to_list or iteration"""
+
+    def __init__(self, run: Callable[[], List[dict]]):
+        self._run = run
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        docs = self._run()
+        return docs if length is None else docs[:length]
+
+    def __aiter__(self):
+        return _AsyncIterator(self._run())
+
+
+class _AsyncIterator:
+    def __init__(self, docs: List[dict]):
+        self._docs = iter(docs)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> dict:
+        try:
+            return next(self._docs)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class MemoryIndex:
+    def __init__(self, name: str, keys: List[Tuple[str, Any]], unique: bool = False, options: Optional[dict] = None):
+        self.name = name
+        self.keys = keys
+        self.unique = unique
+        self.options = options or {}
+        self.entries: Dict[Any, Set[int]] = {}
+
+    @property
+    def hashable(self) -> bool:
+        return self.keys[0][1] in (1, -1)
+
+    @property
+    def text(self) -> bool:
+        return any(direction == "text" for _, direction in self.keys)
+
+    @property
+    def keyed(self) -> bool:
+        """Whether entries maps keys to documents (equality keys, or words for a text index)"""
+        return self.hashable or self.text
+
+    def text_fields(self) -> List[str]:
+        return [field for field, direction in self.keys if direction == "text"]
+
+    def field_text(self, doc: dict, field: str) -> str:
+        return " ".join(
+            str(value) for value in _expanded(field_values(doc, field)) if isinstance(value, str)
+        ).lower()
+
+    def doc_keys(self, doc: dict) -> Set[Any]:
+        """Keys of the first field of the index for a document (one per array element), or its words"""
+        if self.text:
+            return {word for field in self.text_fields() for word in WORD.findall(self.field_text(doc, field))}
+        values = field_values(doc, self.keys[0][0])
+        if not values:
+            return {freeze(None)}
+        keys = set()
+        for value in values:
+            keys.add(freeze(value))
+            if isinstance(value, list):
+                keys.update(freeze(item) for item in value)
+        return keys
+
+    def unique_key(self, doc: dict) -> tuple:
+        key = []
+        for field, _ in self.keys:
+            values = field_values(doc, field)
+            key.append(freeze(values[0] if values else None))
+        return tuple(key)
+
+    def info(self) -> dict:
+        info = {"key": list(self.keys), "v": 2}
+        if self.unique:
+            info["unique"] = True
+        info.update(self.options)
+        return info
+
+
+class MemoryCollection:
+    def __init__(self, database: "MemoryDatabase", name: str):
+        self.database = database
+        self.name = name
+        self._reset()
+
+    def _reset(self):
+        self._docs: Dict[int, dict] = {}
+        self._next_seq = 0
+        self._indexes: Dict[str, MemoryIndex] = {}
+        self._unique: Dict[str, Dict[tuple, int]] = {}
+        self._add_index(MemoryIndex("_id_", [("_id", 1)], unique=True))
+
+    @property
+    def _exists(self) -> bool:
+        # Approximation: MongoDB also lists empty collections created explicitly
+        return bool(self._docs) or len(self._indexes) > 1
+
+    @property
+    def full_name(self) -> str:
+        return f"{self.database.name}.{self.name}"
+
+    # Indexes
+
+    def _add_index(self, index: MemoryIndex):
+        self._indexes[index.name] = index
+        if index.unique:
+            self._unique[index.name] = {}
+        for seq, doc in self._docs.items():
+            self._index_doc(index, seq, doc)
+
+    def _index_doc(self, index: MemoryIndex, seq: int, doc: dict):
+        if index.keyed:
+            for key in index.doc_keys(doc):
+                index.entries.setdefault(key, set()).add(seq)
+        if index.unique:
+            key = index.unique_key(doc)
+            owner = self._unique[index.name].get(key)
+            if owner is not None and owner != seq:
+                raise DuplicateKeyError(
+                    f"E11000 duplicate key error collection: {self.full_name} index: {index.name} dup key: {key}",
+                    11000,
+                )
+            self._unique[index.name][key] = seq
+
+    def _unindex_doc(self, index: MemoryIndex, seq: int, doc: dict):
+        if index.keyed:
+            for key in index.doc_keys(doc):
+                entries = index.entries.get(key)
+                if entries is not None:
+                    entries.discard(seq)
+                    if not entries:
+                        del index.entries[key]
+        if index.unique:
+            key = index.unique_key(doc)
+            if self._unique[index.name].get(key) == seq:
+                del self._unique[index.name][key]
+
+    def _check_unique(self, doc: dict, seq: Optional[int] = None):
+        for name, owners in self._unique.items():
+            owner = owners.get(self._indexes[name].unique_key(doc))
+            if owner is not None and owner != seq:
+                raise DuplicateKeyError(
+                    f"E11000 duplicate key error collection: {self.full_name} index: {name}", 11000
+                )
+
+    def _store(self, seq: int, doc: dict):
+        self._check_unique(doc, seq)
+        old = self._docs.get(seq)
+        if old is not None:
+            for index in self._indexes.values():
+                self._unindex_doc(index, seq, old)
+        self._docs[seq] = doc
+        for index in self._indexes.values():
+            self._index_doc(index, seq, doc)
+
+    def _remove(self, seq: int):
+        doc = self._docs.pop(seq)
+        for index in self._indexes.values():
+            self._unindex_doc(index, seq, doc)
+
+    async def create_index(self, keys: Any, unique: bool = False, name: Optional[str] = None, **options) -> str:
+        keys = normalize_sort(keys, 1)
+        name = name or "_".join(f"{field}_{direction}" for field, direction in keys)
+        if name not in self._indexes:
+            self._add_index(MemoryIndex(name, keys, unique, options))
+        return name
+
+    async def create_indexes(self, models: List[Any]) -> List[str]:
+        names = []
+        for model in models:
+            document = dict(model.document)
+            keys = list(document.pop("key").items())
+            names.append(await self.create_index(keys, **document))
+        return names
+
+    async def drop_index(self, name: str):
+        index = self._indexes.pop(name)
+        self._unique.pop(index.name, None)
+
+    async def index_information(self) -> Dict[str, dict]:
+        return {name: index.info() for name, index in self._indexes.items()}
+
+    def _text_index(self) -> MemoryIndex:
+        for index in self._indexes.values():
+            if index.text:
+                return index
+        raise OperationFailure("text index required for $text query", code=27)
+
+    def _near_index(self, key: Optional[str]) -> str:
+        for index in self._indexes.values():
+            for field, direction in index.keys:
+                if direction in ("2dsphere", "2d") and (key is None or field == key):
+                    return field
+        raise ValueError("$geoNear requires a 2dsphere index")
+
+    # Query planning
+
+    def _index_values(self, condition: Any) -> Optional[List[Any]]:
+        """Equality values an index can look up for a condition, or None"""
+        if isinstance(condition, re.Pattern):
+            return None
+        if not isinstance(condition, dict):
+            return [condition]
+        if _is_operator_dict(condition):
+            if set(condition) == {"$eq"}:
+                return [condition["$eq"]]
+            if set(condition) == {"$in"} and not any(isinstance(value, re.Pattern) for value in condition["$in"]):
+                return list(condition["$in"])
+        return None
+
+    def _candidates(self, query: dict) -> Iterable[int]:
+        """Sequence numbers worth matching against the query, narrowed through an index"""
+        conditions = [(key, value) for key, value in query.items() if not key.startswith("$")]
+        for part in query.get("$and", []):
+            conditions.extend((key, value) for key, value in part.items() if not key.startswith("$"))
+        best: Optional[Set[int]] = None
+        for field, condition in conditions:
+            index = next(
+                (index for index in self._indexes.values() if index.hashable and index.keys[0][0] == field), None
+            )
+            if index is None:
+                continue
+            values = self._index_values(condition)
+            if values is None:
+                continue
+            found: Set[int] = set()
+            for value in values:
+                found.update(index.entries.get(freeze(value), ()))
+            if best is None or len(found) < len(best):
+                best = found
+        if best is None:
+            return list(self._docs)
+        return sorted(best)
+
+    def _text_scores(self, query: dict, seqs: Iterable[int]) -> Dict[int, float]:
+        """Text search: score per matching document, summed field weight times term hits"""
+        text = query["$text"]
+        search = text["$search"]
+        phrases = [phrase.lower() for phrase in re.findall(r'"([^"]+)"', search)]
+        search = re.sub(r'"[^"]*"', " ", search)
+        terms = [term.lower() for term in re.findall(r"-?\w+", search)]
+        negated = {term[1:] for term in terms if term.startswith("-")}
+        terms = [term for term in terms if not term.startswith("-")]
+        index = self._text_index()
+        weights = index.options.get("weights", {})
+        fields = index.text_fields()
+        # Only documents holding a searched word can match; the index has them
+        found: Set[int] = set()
+        for word in terms or [word for phrase in phrases for word in WORD.findall(phrase)]:
+            found.update(index.entries.get(word, ()))
+        scores = {}
+        for seq in sorted(found.intersection(seqs)):
+            doc = self._docs[seq]
+            score = 0.0
+            text_of_doc = []
+            for field in fields:
+                field_text = index.field_text(doc, field)
+                text_of_doc.append(field_text)
+                tokens = WORD.findall(field_text)
+                hits = sum(tokens.count(term) for term in terms)
+                score += weights.get(field, 1) * hits
+            full_text = " ".join(text_of_doc)
+            if negated & set(WORD.findall(full_text)) or not all(phrase in full_text for phrase in phrases):
+                continue
+            if score > 0 or (phrases and not terms):
+                scores[seq] = score or 1.0
+        return scores
+
+    def _matching(self, query: dict) -> Tuple[List[int], Optional[Dict[int, float]]]:
+        seqs = self._candidates(query)
+        scores = None
+        if "$text" in query:
+            scores = self._text_scores(query, seqs)
+            seqs = list(scores)
+        return [seq for seq in seqs if matches(self._docs[seq], query)], scores
+
+    def _find(self, query: dict, projection: Optional[dict], sort: List[Tuple[str, Any]], skip: int = 0,
+              limit: int = 0) -> List[dict]:
+        compiled = Projection(projection)
+        if limit and not sort and "$text" not in query:
+            # Stop scanning once the page is full
+            docs = []
+            for seq in self._candidates(query):
+                doc = self._docs[seq]
+                if matches(doc, query):
+                    if skip:
+                        skip -= 1
+                        continue
+                    docs.append(compiled.apply(doc))
+                    if len(docs) == limit:
+                        break
+            return docs
+        seqs, scores = self._matching(query)
+        if sort:
+            doc_scores = {id(self._docs[seq]): score for seq, score in (scores or {}).items()}
+            seqs = sort_documents(seqs, sort, key=lambda seq: self._docs[seq], scores=doc_scores)
+        seqs = seqs[skip:skip + limit] if limit else seqs[skip:]
+        return [compiled.apply(self._docs[seq], (scores or {}).get(seq)) for seq in seqs]
+
+    def _first(self, query: Optional[dict], sort: Any = None) -> Optional[int]:
+        query = query or {}
+        if sort or "$text" in query:
+            seqs, _ = self._matching(query)
+            if sort:
+                seqs = sort_documents(seqs, normalize_sort(sort), key=lambda seq: self._docs[seq])
+            return seqs[0] if seqs else None
+        for seq in self._candidates(query):
+            if matches(self._docs[seq], query):
+                return seq
+        return None
+
+    # Reads
+
+    def find(self, filter: Optional[dict] = None, projection: Optional[dict] = None, **kwargs) -> MemoryCursor:
+        cursor = MemoryCursor(self, filter, projection)
+        if kwargs.get("sort"):
+            cursor.sort(kwargs["sort"])
+        if kwargs.get("skip"):
+            cursor.skip(kwargs["skip"])
+        if kwargs.get("limit"):
+            cursor.limit(kwargs["limit"])
+        return cursor
+
+    async def find_one(self, filter: Optional[dict] = None, projection: Optional[dict] = None, **kwargs) -> Optional[dict]:
+        docs = await self.find(filter, projection, **kwargs).limit(1).to_list(length=1)
+        return docs[0] if docs else None
+
+    async def count_documents(self, filter: dict, skip: int = 0, limit: int = 0, **kwargs) -> int:
+        seqs, _ = self._matching(filter)
+        count = max(0, len(seqs) - skip)
+        return min(count, limit) if limit else count
+
+    async def estimated_document_count(self, **kwargs) -> int:
+        return len(self._docs)
+
+    async def distinct(self, key: str, filter: Optional[dict] = None, **kwargs) -> List[Any]:
+        seqs, _ = self._matching(filter or {})
+        values: List[Any] = []
+        for seq in seqs:
+            for value in _expanded(field_values(self._docs[seq], key)):
+                if not isinstance(value, list) and not any(values_equal(value, seen) for seen in values):
+                    values.append(value)
+        return values
+
+    def aggregate(self, pipeline: List[dict], **kwargs) -> MemoryCommandCursor:
+        return MemoryCommandCursor(lambda: self._aggregate(pipeline))
+
+    def _aggregate(self, pipeline: List[dict]) -> List[dict]:
+        stages = list(pipeline)
+        if stages and "$geoNear" in stages[0]:
+            docs = self._geo_near(stages.pop(0)["$geoNear"])
+        elif stages and "$match" in stages[0]:
+            query = stages.pop(0)["$match"]
+            seqs, scores = self._matching(query)
+            docs = [clone(self._docs[seq]) for seq in seqs]
+        else:
+            docs = [clone(doc) for doc in self._docs.values()]
+        return run_stages(docs, stages, self.database)
+
+    def _geo_near(self, spec: dict) -> List[dict]:
+        key = self._near_index(spec.get("key"))
+        near = spec["near"]
+        point = near["coordinates"] if isinstance(near, dict) else near
+        max_distance = spec.get("maxDistance")
+        min_distance = spec.get("minDistance")
+        seqs, _ = self._matching(spec.get("query") or {})
+        found = []
+        for seq in seqs:
+            location = get_path(self._docs[seq], key)
+            if not isinstance(location, dict) or location.get("type") != "Point":
+                continue
+            distance = haversine_meters(point, location["coordinates"])
+            if max_distance is not None and distance > max_distance:
+                continue
+            if min_distance is not None and distance < min_distance:
+                continue
+            found.append((distance, seq))
+        found.sort(key=lambda item: item[0])
+        docs = []
+        for distance, seq in found:
+            doc = clone(self._docs[seq])
+            set_path(doc, spec["distanceField"], distance * spec.get("distanceMultiplier", 1))
+            docs.append(doc)
+        return docs
+
+    def _merge(self, docs: List[dict], spec: dict):
+        on = spec.get("on", "_id")
+        on = [on] if isinstance(on, str) else on
+        when_matched = spec.get("whenMatched", "merge")
+        when_not_matched = spec.get("whenNotMatched", "insert")
+        for doc in docs:
+            query = {field: doc.get(field) for field in on}
+            seq = self._first(query)
+            if seq is None:
+                if when_not_matched == "insert":
+                    self._insert(doc)
+                elif when_not_matched == "fail":
+                    raise ValueError("$merge found no matching document")
+                continue
+            existing = self._docs[seq]
+            if when_matched == "replace":
+                replacement = clone(doc)
+                replacement["_id"] = existing["_id"]
+            elif when_matched == "merge":
+                replacement = {**clone(existing), **clone(doc), "_id": existing["_id"]}
+            elif when_matched == "keepExisting":
+                continue
+            else:
+                raise NotImplementedError(f"$merge whenMatched {when_matched} is not supported by the in-memory database")
+            self._store(seq, replacement)
+
+    # Writes
+
+    def _insert(self, doc: dict) -> Any:
+        stored = clone(doc)
+        if "_id" not in stored:
+            stored["_id"] = ObjectId()
+        seq = self._next_seq
+        self._next_seq += 1
+        self._store(seq, stored)
+        return stored["_id"]
+
+    async def insert_one(self, document: dict, **kwargs) -> InsertOneResult:
+        if "_id" not in document:
+            # Like pymongo, the caller's document gets the generated _id
+            document["_id"] = ObjectId()
+        return InsertOneResult(self._insert(document), True)
+
+    async def insert_many(self, documents: Iterable[dict], ordered: bool = True, **kwargs) -> InsertManyResult:
+        inserted, errors = [], []
+        for position, document in enumerate(documents):
+            if "_id" not in document:
+                document["_id"] = ObjectId()
+            try:
+                inserted.append(self._insert(document))
+            except DuplicateKeyError as exc:
+                errors.append({"index": position, "code": 11000, "errmsg": str(exc), "op": document})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({
+                "writeErrors": errors, "writeConcernErrors": [], "nInserted": len(inserted),
+                "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": [],
+            })
+        return InsertManyResult(inserted, True)
+
+    def _upsert(self, filter: dict, update: Any, array_filters: Optional[List[dict]]) -> Tuple[Any, int]:
+        """Insert the document an upsert creates; returns its _id and sequence number"""
+        doc = _upsert_seed(filter)
+        apply_update(doc, update, inserting=True, array_filters=array_filters)
+        upserted_id = self._insert(doc)
+        return upserted_id, self._next_seq - 1
+
+    def _update_seq(self, seq: int, update: Any, array_filters: Optional[List[dict]]) -> bool:
+        # Updated on a copy so a failed unique check leaves the document as it was
+        doc = clone(self._docs[seq])
+        if apply_update(doc, update, array_filters=array_filters):
+            self._store(seq, doc)
+            return True
+        return False
+
+    def _update(self, filter: dict, update: Any, multi: bool = False, upsert: bool = False,
+                array_filters: Optional[List[dict]] = None) -> Tuple[int, int, Any]:
+        """Returns the matched and modified counts and the upserted _id"""
+        if multi:
+            seqs, _ = self._matching(filter)
+        else:
+            seq = self._first(filter)
+            seqs = [] if seq is None else [seq]
+        if not seqs:
+            if not upsert:
+                return 0, 0, None
+            upserted_id, _ = self._upsert(filter, update, array_filters)
+            return 0, 0, upserted_id
+        modified = sum(self._update_seq(seq, update, array_filters) for seq in seqs)
+        return len(seqs), modified, None
+
+    @staticmethod
+    def _update_result(matched: int, modified: int, upserted_id: Any) -> UpdateResult:
+        raw = {"n": matched + (1 if upserted_id is not None else 0), "nModified": modified, "ok": 1.0}
+        if upserted_id is not None:
+            raw["upserted"] = upserted_id
+        return UpdateResult(raw, True)
+
+    async def update_one(self, filter: dict, update: Any, upsert: bool = False,
+                         array_filters: Optional[List[dict]] = None, **kwargs) -> UpdateResult:
+        matched, modified, upserted_id = self._update(filter, update, False, upsert, array_filters)
+        return self._update_result(matched, modified, upserted_id)
+
+    async def update_many(self, filter: dict, update: Any, upsert: bool = False,
+                          array_filters: Optional[List[dict]] = None, **kwargs) -> UpdateResult:
+        matched, modified, upserted_id = self._update(filter, update, True, upsert, array_filters)
+        return self._update_result(matched, modified, upserted_id)
+
+    def _replace(self, filter: dict, replacement: dict, upsert: bool = False) -> Tuple[int, int, Any]:
+        seq = self._first(filter)
+        if seq is None:
+            if not upsert:
+                return 0, 0, None
+            doc = {**_upsert_seed(filter), **clone(replacement)}
+            return 0, 0, self._insert(doc)
+        existing = self._docs[seq]
+        doc = clone(replacement)
+        doc["_id"] = existing["_id"]
+        changed = doc != existing
+        if changed:
+            self._store(seq, doc)
+        return 1, int(changed), None
+
+    async def replace_one(self, filter: dict, replacement: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        return self._update_result(*self._replace(filter, replacement, upsert))
+
+    async def find_one_and_update(self, filter: dict, update: Any, projection: Optional[dict] = None,
+                                  sort: Any = None, upsert: bool = False, return_document: bool = False,
+                                  array_filters: Optional[List[dict]] = None, **kwargs) -> Optional[dict]:
+        seq = self._first(filter, sort)
+        compiled = Projection(projection)
+        if seq is None:
+            if not upsert:
+                return None
+            _, seq = self._upsert(filter, update, array_filters)
+            return compiled.apply(self._docs[seq]) if return_document else None
+        before = self._docs[seq]
+        self._update_seq(seq, update, array_filters)
+        return compiled.apply(self._docs[seq] if return_document else before)
+
+    async def find_one_and_replace(self, filter: dict, replacement: dict, projection: Optional[dict] = None,
+                                   upsert: bool = False, return_document: bool = False, **kwargs) -> Optional[dict]:
+        seq = self._first(filter)
+        before = self._docs[seq] if seq is not None else None
+        self._replace(filter, replacement, upsert)
+        compiled = Projection(projection)
+        if return_document:
+            seq = self._first(filter)
+            return compiled.apply(self._docs[seq]) if seq is not None else None
+        return compiled.apply(before) if before is not None else None
+
+    async def find_one_and_delete(self, filter: dict, projection: Optional[dict] = None, sort: Any = None,
+                                  **kwargs) -> Optional[dict]:
+        seq = self._first(filter, sort)
+        if seq is None:
+            return None
+        doc = self._docs[seq]
+        self._remove(seq)
+        return Projection(projection).apply(doc)
+
+    async def delete_one(self, filter: dict, **kwargs) -> DeleteResult:
+        seq = self._first(filter)
+        if seq is not None:
+            self._remove(seq)
+        return DeleteResult({"n": int(seq is not None), "ok": 1.0}, True)
+
+    async def delete_many(self, filter: dict, **kwargs) -> DeleteResult:
+        seqs, _ = self._matching(filter)
+        for seq in seqs:
+            self._remove(seq)
+        return DeleteResult({"n": len(seqs), "ok": 1.0}, True)
+
+    async def bulk_write(self, requests: List[Any], ordered: bool = True, **kwargs) -> BulkWriteResult:
+        result = {
+            "writeErrors": [], "writeConcernErrors": [], "nInserted": 0, "nUpserted": 0,
+            "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": [],
+        }
+        for position, request in enumerate(requests):
+            try:
+                if isinstance(request, InsertOne):
+                    self._insert(request._doc)
+                    result["nInserted"] += 1
+                elif isinstance(request, (UpdateOne, UpdateMany)):
+                    matched, modified, upserted_id = self._update(
+                        request._filter, request._doc, isinstance(request, UpdateMany),
+                        bool(request._upsert), request._array_filters,
+                    )
+                    result["nMatched"] += matched
+                    result["nModified"] += modified
+                    if upserted_id is not None:
+                        result["nUpserted"] += 1
+                        result["upserted"].append({"index": position, "_id": upserted_id})
+                elif isinstance(request, ReplaceOne):
+                    matched, modified, upserted_id = self._replace(request._filter, request._doc, bool(request._upsert))
+                    result["nMatched"] += matched
+                    result["nModified"] += modified
+                    if upserted_id is not None:
+                        result["nUpserted"] += 1
+                        result["upserted"].append({"index": position, "_id": upserted_id})
+                elif isinstance(request, (DeleteOne, DeleteMany)):
+                    deleted = await (self.delete_many if isinstance(request, DeleteMany) else self.delete_one)(
+                        request._filter
+                    )
+                    result["nRemoved"] += deleted.deleted_count
+                else:
+                    raise NotImplementedError(f"{type(request).__name__} is not supported by the in-memory database")
+            except DuplicateKeyError as exc:
+                result["writeErrors"].append({"index": position, "code": 11000, "errmsg": str(exc)})
+                if ordered:
+                    break
+        if result["writeErrors"]:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    async def drop(self):
+        await self.database.drop_collection(self.name)
+
+
+class MemoryDatabase:
+    def __init__(self, client: "MemoryClient", name: str):
+        self.client = client
+        self.name = name
+        self._collections: Dict[str, MemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = MemoryCollection(self, name)
+        return collection
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_collection(self, name: str, **kwargs) -> MemoryCollection:
+        return self[name]
+
+    async def list_collection_names(self, filter: Optional[dict] = None, **kwargs) -> List[str]:
+        names = [{"name": name} for name, collection in self._collections.items() if collection._exists]
+        return [entry["name"] for entry in names if matches(entry, filter)]
+
+    async def create_collection(self, name: str, **options) -> MemoryCollection:
+        # Options such as timeseries or expireAfterSeconds have no effect here
+        return self[name]
+
+    async def drop_collection(self, name: Any):
+        # Emptied in place: like Motor handles, existing references stay usable
+        collection = self._collections.get(getattr(name, "name", name))
+        if collection is not None:
+            collection._reset()
+
+    async def command(self, command: Any, *args, **kwargs) -> dict:
+        """Accepts ping and collMod (only the index options change); anything else is not supported"""
+        name = command if isinstance(command, str) else next(iter(command))
+        if name == "collMod" and "index" in kwargs:
+            options = dict(kwargs["index"])
+            index = self[args[0]]._indexes.get(options.pop("name"))
+            if index is None:
+                raise OperationFailure("cannot find index", code=27)
+            index.options.update(options)
+        if name in ("ping", "collMod"):
+            return {"ok": 1.0}
+        raise NotImplementedError(f"Command {name} is not supported by the in-memory database")
+
+
+class MemoryClient:
+    """Stands in for AsyncIOMotorClient; databases live as long as the client"""
+
+    def __init__(self):
+        self._databases: Dict[str, MemoryDatabase] = {}
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        database = self._databases.get(name)
+        if database is None:
+            database = self._databases[name] = MemoryDatabase(self, name)
+        return database
+
+    def get_database(self, name: str, **kwargs) -> MemoryDatabase:
+        return self[name]
+
+    async def drop_database(self, name: Any):
+        database = self._databases.get(getattr(name, "name", name))
+        if database is not None:
+            for collection in database._collections.values():
+                collection._reset()
+
+    async def list_database_names(self) -> List[str]:
+        return [
+            name for name, database in self._databases.items()
+            if any(collection._exists for collection in database._collections.values())
+        ]
+
+    def close(self):
+        pass
@@ -0,0 +1,267 @@
+"""
+Request and database metrics, served in the Prometheus text format by GET /metrics
+"""
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Tuple
+from pymongo import monitoring
+
+PREFIX = "explorerhub"
+
+# Upper bounds in seconds; requests and commands mostly take milliseconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+# Connection housekeeping, not database work
+IGNORED_COMMANDS = frozenset({
+    "hello", "isMaster", "ismaster", "ping", "endSessions", "saslStart", "saslContinue", "buildInfo",
+})
+
+# [seconds, commands] spent in the database by the current request. Motor
+# runs operations on its threads in a copy of the caller's context, so the
+# command listener sees the request's list.
+request_db_time: ContextVar[Optional[List[float]]] = ContextVar("request_db_time", default=None)
+
+
+class Histogram:
+    """Counts per bucket (non-cumulative; made cumulative when rendered), sum and count"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def label_value(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{label_value(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_number(value: float) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metrics:
+    """
+    Per-route request counts, latency and database time, per-collection
+    database command latency and document counts, plus gauges read from the
+    stats() of other components when rendered.
+    Requests are recorded on the event loop thread; commands arrive on the
+    driver's threads and take the lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.requests: Dict[Tuple[str, str, str], int] = {}
+        self.request_latency: Dict[Tuple[str, str], Histogram] = {}
+        self.request_db_time: Dict[Tuple[str, str], Histogram] = {}
+        self.request_db_commands: Dict[Tuple[str, str], int] = {}
+        self.commands: Dict[Tuple[str, str], Histogram] = {}
+        self.command_documents: Dict[Tuple[str, str], int] = {}
+        self.command_failures: Dict[Tuple[str, str], int] = {}
+        self._stats: List[Tuple[str, Callable[[], dict]]] = []
+
+    def register_stats(self, name: str, stats: Callable[[], dict]):
+        """Export the numeric values of a stats() dict as <prefix>_<name>_<key> gauges"""
+        self._stats.append((name, stats))
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float, db_time: List[float]):
+        key = (method, route)
+        status_key = (method, route, str(status))
+        self.requests[status_key] = self.requests.get(status_key, 0) + 1
+        latency = self.request_latency.get(key)
+        if latency is None:
+            latency = self.request_latency[key] = Histogram()
+            self.request_db_time[key] = Histogram()
+            self.request_db_commands[key] = 0
+        latency.observe(seconds)
+        self.request_db_time[key].observe(db_time[0])
+        self.request_db_commands[key] += int(db_time[1])
+
+    def observe_command(self, collection: str, command: str, seconds: float, documents: int, failed: bool):
+        key = (collection, command)
+        db_time = request_db_time.get()
+        with self._lock:
+            histogram = self.commands.get(key)
+            if histogram is None:
+                histogram = self.commands[key] = Histogram()
+            histogram.observe(seconds)
+            if documents:
+                self.command_documents[key] = self.command_documents.get(key, 0) + documents
+            if failed:
+                self.command_failures[key] = self.command_failures.get(key, 0) + 1
+            if db_time is not None:
+                db_time[0] += seconds
+                db_time[1] += 1
+
+    def render(self) -> str:
+        """Everything in the Prometheus text exposition format"""
+        lines: List[str] = []
+        route_labels = ("method", "route")
+        command_labels = ("collection", "command")
+
+        def metric(name: str, kind: str, help_text: str):
+            lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+
+        def samples(name: str, labels: Tuple[str, ...], values: Dict[Tuple, float]):
+            for key, value in sorted(values.items()):
+                lines.append(f"{PREFIX}_{name}{format_labels(labels, key)} {format_number(value)}")
+
+        def histograms(name: str, labels: Tuple[str, ...], values: Dict[Tuple, Histogram]):
+            for key, histogram in sorted(values.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    le = f'le="{bound}"'
+                    lines.append(f"{PREFIX}_{name}_bucket{format_labels(labels, key, le)} {cumulative}")
+                le = 'le="+Inf"'
+                lines.append(f"{PREFIX}_{name}_bucket{format_labels(labels, key, le)} {histogram.count}")
+                lines.append(f"{PREFIX}_{name}_sum{format_labels(labels, key)} {format_number(histogram.sum)}")
+                lines.append(f"{PREFIX}_{name}_count{format_labels(labels, key)} {histogram.count}")
+
+        metric("http_requests_in_flight", "gauge", "Requests being handled")
+        lines.append(f"{PREFIX}_http_requests_in_flight {self.in_flight}")
+        metric("http_requests_total", "counter", "Requests by method, route and status")
+        samples("http_requests_total", ("method", "route", "status"), dict(self.requests))
+        metric("http_request_duration_seconds", "histogram", "Time until the response was sent")
+        histograms("http_request_duration_seconds", route_labels, dict(self.request_latency))
+        metric("http_request_db_seconds", "histogram", "Database time per request")
+        histograms("http_request_db_seconds", route_labels, dict(self.request_db_time))
+        metric("http_request_db_commands_total", "counter", "Database commands sent by requests")
+        samples("http_request_db_commands_total", route_labels, dict(self.request_db_commands))
+
+        with self._lock:
+            metric("mongodb_command_duration_seconds", "histogram", "Database command latency")
+            histograms("mongodb_command_duration_seconds", command_labels, self.commands)
+            documents = dict(self.command_documents)
+            failures = dict(self.command_failures)
+        metric("mongodb_command_documents_total", "counter", "Documents returned or written by commands")
+        samples("mongodb_command_documents_total", command_labels, documents)
+        metric("mongodb_command_failures_total", "counter", "Failed database commands")
+        samples("mongodb_command_failures_total", command_labels, failures)
+
+        for name, stats in self._stats:
+            for key, value in stats().items():
+                if isinstance(value, (int, float)):
+                    metric(f"{name}_{key}", "gauge", f"{key} from the {name} stats")
+                    lines.append(f"{PREFIX}_{name}_{key} {format_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def command_documents(command_name: str, reply: dict) -> int:
+    """Documents a command returned or wrote, from its reply"""
+    cursor = reply.get("cursor")
+    if cursor is not None:
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or ())
+    if command_name == "findAndModify":
+        return 1 if reply.get("value") is not None else 0
+    n = reply.get("n")
+    return n if isinstance(n, int) else 0
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """Feeds database command latency and document counts into Metrics"""
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        self._collections: Dict[Tuple, str] = {}
+
+    def started(self, event):
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        else:
+            collection = event.command.get(event.command_name)
+        with self._lock:
+            self._collections[(event.connection_id, event.request_id)] = (
+                collection if isinstance(collection, str) else ""
+            )
+
+    def _finished(self, event, reply: Optional[dict]):
+        with self._lock:
+            collection = self._collections.pop((event.connection_id, event.request_id), None)
+        if collection is None:
+            return
+        documents = command_documents(event.command_name, reply) if reply is not None else 0
+        self.metrics.observe_command(
+            collection, event.command_name, event.duration_micros / 1e6, documents, failed=reply is None
+        )
+
+    def succeeded(self, event):
+        self._finished(event, event.reply)
+
+    def failed(self, event):
+        self._finished(event, None)
+
+
+class MetricsMiddleware:
+    """
+    Plain ASGI middleware (no per-request objects beyond a closure) that
+    records every HTTP request under its route template, e.g.
+    /api/businesses/{business_id}. The latency ends when the last body chunk
+    is sent, so background tasks are not counted.
+    """
+
+    def __init__(self, app, metrics: Metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        metrics = self.metrics
+        start = perf_counter()
+        end = 0.0
+        status = 500
+
+        async def send_recorded(message):
+            nonlocal status, end
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif not message.get("more_body"):
+                end = perf_counter()
+            await send(message)
+
+        db_time = [0.0, 0]
+        token = request_db_time.set(db_time)
+        metrics.in_flight += 1
+        try:
+            await self.app(scope, receive, send_recorded)
+        finally:
+            metrics.in_flight -= 1
+            request_db_time.reset(token)
+            route = scope.get("route")
+            metrics.observe_request(
+                scope["method"], route.path if route is not None else UNMATCHED_ROUTE, status,
+                (end or perf_counter()) - start, db_time
+            )
+
+
+metrics = Metrics()
+command_metrics = CommandMetrics(metrics)
@@ -0,0 +1,174 @@
+"""
+Batched, resumable data migrations for the scripts in scripts/
+
+A Migration names a collection, a filter and a transform from one document
+to a write (UpdateOne, ReplaceOne, DeleteOne) or None. The runner reads the
+matching documents in _id order, a batch at a time, sends the writes of each
+batch with one unordered bulk_write and then records the last _id in the
+`migrations` collection, so an interrupted run resumes where it stopped and
+a finished migration is not run again (unless restarted). Each batch is a
+new query for _id greater than the checkpoint, so a throttled run never
+holds a cursor open long enough for it to time out.
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, List, Optional
+from motor.motor_asyncio import AsyncIOMotorClient
+from config import settings
+
+STATE_COLLECTION = "migrations"
+DRY_RUN_SAMPLES = 5
+
+
+class Migration:
+    """Subclass with a unique name, and either transform() over a collection or finish() alone"""
+
+    name = ""
+    description = ""
+    # Documents to transform; None for migrations that only run finish()
+    collection_name: Optional[str] = None
+    query: dict = {}
+    projection: Optional[dict] = None
+
+    async def start(self, db, state: dict):
+        """Runs before the first batch of every run; state["scanned"] documents were done by earlier runs"""
+
+    def transform(self, document: dict) -> Optional[Any]:
+        """The write for one document, or None to leave it as it is"""
+        return None
+
+    async def finish(self, db, dry_run: bool) -> int:
+        """Runs once after the last batch; returns the number of writes it made (or would make)"""
+        return 0
+
+
+class MigrationRunner:
+    """
+    Runs migrations against a database. ops_per_second > 0 spaces the batches
+    so the writes stay under that rate on average, leaving room for live
+    traffic; dry_run reads and transforms everything but writes nothing (not
+    even checkpoints) and prints a few of the writes it would make.
+    """
+
+    def __init__(self, db, batch_size: int = 1000, ops_per_second: float = 0, dry_run: bool = False,
+                 progress_interval: float = 10.0):
+        self.db = db
+        self.batch_size = max(1, batch_size)
+        self.ops_per_second = ops_per_second
+        self.dry_run = dry_run
+        self.progress_interval = progress_interval
+
+    async def state(self, name: str) -> Optional[dict]:
+        return await self.db[STATE_COLLECTION].find_one({"_id": name})
+
+    async def _checkpoint(self, name: str, fields: dict):
+        if not self.dry_run:
+            fields["updated_at"] = datetime.utcnow()
+            await self.db[STATE_COLLECTION].update_one({"_id": name}, {"$set": fields}, upsert=True)
+
+    async def run(self, migration: Migration, restart: bool = False) -> dict:
+        """Run (or resume) a migration; returns its final state"""
+        state = None if restart else await self.state(migration.name)
+        if state and state.get("status") == "done":
+            print(f"{migration.name}: already done on {state['finished_at']:%Y-%m-%d %H:%M} (restart to run again)")
+            return state
+        if state is None or restart:
+            state = {"status": "running", "started_at": datetime.utcnow(), "last_id": None,
+                     "scanned": 0, "written": 0, "modified": 0}
+            await self._checkpoint(migration.name, dict(state))
+        elif state.get("last_id") is not None:
+            print(f"{migration.name}: resuming after _id {state['last_id']} ({state['scanned']} documents done)")
+
+        prefix = "[dry run] " if self.dry_run else ""
+        print(f"{prefix}{migration.name}: {migration.description}")
+        await migration.start(self.db, state)
+        start = last_report = time.perf_counter()
+        written_this_run = 0
+        samples = 0
+
+        if migration.collection_name:
+            collection = self.db[migration.collection_name]
+            while True:
+                query = dict(migration.query)
+                if state["last_id"] is not None:
+                    query = {"$and": [query, {"_id": {"$gt": state["last_id"]}}]} if query else {
+                        "_id": {"$gt": state["last_id"]}
+                    }
+                documents = await collection.find(query, migration.projection).sort("_id", 1).to_list(
+                    length=self.batch_size
+                )
+                if not documents:
+                    break
+
+                writes: List[Any] = []
+                for document in documents:
+                    write = migration.transform(document)
+                    if write is not None:
+                        writes.append(write)
+                state["scanned"] += len(documents)
+                state["last_id"] = documents[-1]["_id"]
+                state["written"] += len(writes)
+
+                if self.dry_run:
+                    for write in writes[:max(0, DRY_RUN_SAMPLES - samples)]:
+                        print(f"  would write {write}")
+                        samples += 1
+                elif writes:
+                    result = await collection.bulk_write(writes, ordered=False)
+                    state["modified"] += result.modified_count + result.deleted_count + result.upserted_count
+                await self._checkpoint(migration.name, {
+                    key: state[key] for key in ("last_id", "scanned", "written", "modified")
+                })
+
+                written_this_run += len(writes)
+                await self._throttle(start, written_this_run)
+                now = time.perf_counter()
+                if self.progress_interval and now - last_report >= self.progress_interval:
+                    last_report = now
+                    print(f"  {state['scanned']} scanned, {state['written']} writes "
+                          f"({state['scanned'] / max(now - start, 1e-9):,.0f} docs/s)")
+                if len(documents) < self.batch_size:
+                    break
+
+        state["written"] += await migration.finish(self.db, self.dry_run)
+        state["status"] = "done"
+        state["finished_at"] = datetime.utcnow()
+        await self._checkpoint(migration.name, {key: state[key] for key in ("status", "finished_at", "written")})
+        verb = "would write" if self.dry_run else "wrote"
+        modified = f" (modified {state['modified']})" if migration.collection_name and not self.dry_run else ""
+        print(f"{prefix}{migration.name}: scanned {state['scanned']} documents, {verb} {state['written']}"
+              f"{modified} in {time.perf_counter() - start:.1f}s")
+        return state
+
+    async def _throttle(self, start: float, writes: int):
+        """Sleep until `writes` fits under ops_per_second since start"""
+        if self.ops_per_second > 0 and not self.dry_run:
+            delay = writes / self.ops_per_second - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+
+def migration_main(*migrations: Migration):
+    """Command line of a migration script: run the given migrations in order"""
+    parser = argparse.ArgumentParser(
+        description="\n".join(f"{migration.name}: {migration.description}" for migration in migrations)
+    )
+    parser.add_argument("--dry-run", action="store_true", help="show what would change without writing")
+    parser.add_argument("--batch-size", type=int, default=1000, help="documents per batch")
+    parser.add_argument("--ops-per-second", type=float, default=0, help="write rate limit (0: unlimited)")
+    parser.add_argument("--restart", action="store_true", help="start over, ignoring earlier progress")
+    args = parser.parse_args()
+
+    async def run():
+        client = AsyncIOMotorClient(settings.mongodb_url)
+        try:
+            runner = MigrationRunner(client[settings.database_name], args.batch_size, args.ops_per_second,
+                                     args.dry_run)
+            for migration in migrations:
+                await runner.run(migration, restart=args.restart)
+        finally:
+            client.close()
+
+    asyncio.run(run())
@@ -1,7 +1,24 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Dict, Optional, List, Union
 from datetime import datetime
 from bson import ObjectId
+from utils import normalize_text
+from indexes import IndexSpec
+
+INDEXES = [
+    IndexSpec("businesses", "id", "lookups by id", required=True, unique=True),
+    IndexSpec("businesses", [("is_active", 1), ("rating", -1), ("id", -1)], "listing sort", required=True),
+    IndexSpec("businesses", "owner_id", "owner views and ownership checks", required=True),
+    IndexSpec("businesses", "category", "category filter"),
+    IndexSpec("businesses", [("location.city", 1), ("category", 1)], "city filter"),
+    IndexSpec(
+        "businesses", [("name", "text"), ("tags", "text"), ("description", "text")], "search",
+        required=True, name="business_text_search", weights={"name": 10, "tags": 5, "description": 1},
+    ),
+    IndexSpec("businesses", "name_normalized", "prefix search"),
+    IndexSpec("businesses", "city_normalized", "prefix search on the city"),
+    IndexSpec("businesses", [("geo", "2dsphere"), ("category", 1)], "nearby search", required=True),
+]
 
 
 class Location(BaseModel):
@@ -34,6 +51,8 @@ class BusinessInDB(BusinessBase):
     owner_id: str
     rating: float = 0.0
     review_count: int = 0
+    rating_sum: int = 0
+    rating_histogram: Dict[str, int] = Field(default_factory=lambda: empty_rating_histogram())
     views: int = 0
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -52,3 +71,76 @@ class Business(BusinessBase):
     review_count: int
     created_at: datetime
     is_active: bool
+    score: Optional[float] = None  # text search relevance
+    distance: Optional[float] = None  # meters, for "near" queries
+    rating_histogram: Optional[Dict[str, int]] = None  # review count per star
+
+
+class BusinessSummary(BaseModel):
+    """Lightweight shape for list views (first image only)"""
+    id: int
+    name: str
+    category: str
+    location: Location
+    price_level: int
+    images: List[str] = []
+    rating: float
+    review_count: int
+    is_active: bool
+    score: Optional[float] = None
+    distance: Optional[float] = None
+
+
+class FacetCount(BaseModel):
+    value: Union[str, int, float]
+    count: int
+
+
+class BusinessFacets(BaseModel):
+    """
+    Counts per category, city, price level and rating band for a search,
+    with the total and first page of its results
+    """
+    total: int
+    businesses: Union[List[Business], List[BusinessSummary]]
+    facets: Dict[str, List[FacetCount]]
+
+
+class BusinessBatchRequest(BaseModel):
+    ids: List[int]
+
+
+class BusinessBatch(BaseModel):
+    """Businesses in request order plus the ids that were not found"""
+    businesses: List[Business]
+    missing: List[int]
+
+
+def search_fields(business: dict) -> dict:
+    """Normalized copies of name and city used for indexed prefix search"""
+    return {
+        "name_normalized": normalize_text(business.get("name", "")),
+        "city_normalized": normalize_text((business.get("location") or {}).get("city", "")),
+    }
+
+
+def geo_point(location: Optional[dict]) -> Optional[dict]:
+    """GeoJSON point for a Location, or None without coordinates"""
+    if not location:
+        return None
+    latitude, longitude = location.get("latitude"), location.get("longitude")
+    if latitude is None or longitude is None:
+        return None
+    return {"type": "Point", "coordinates": [longitude, latitude]}
+
+
+def derived_fields(business: dict) -> dict:
+    """Fields stored alongside a business that are computed from its other fields"""
+    fields = search_fields(business)
+    fields["geo"] = geo_point(business.get("location"))
+    return fields
+
+
+def empty_rating_histogram() -> Dict[str, int]:
+    """Review count per star, keyed "1" to "5" """
+    return {str(star): 0 for star in range(1, 6)}
@@ -1,9 +1,17 @@
 """
 Counter model for sequential IDs
 """
+import asyncio
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Dict, Optional, Tuple
 from bson import ObjectId
+from config import settings
+from repositories import CounterRepository
+from indexes import IndexSpec
+
+INDEXES = [
+    IndexSpec("counters", "collection_name", "sequence increments", required=True, unique=True),
+]
 
 
 class Counter(BaseModel):
@@ -15,26 +23,53 @@ class Counter(BaseModel):
         json_encoders = {ObjectId: str}
 
 
+class SequenceAllocator:
+    """
+    Hands out sequential IDs from blocks reserved with a single atomic $inc.
+    Each process reserves its own block, so IDs stay unique across workers;
+    IDs left in a block when a worker stops are simply skipped (gaps are fine).
+    """
+
+    def __init__(self, block_size: int = 100):
+        self.block_size = max(1, block_size)
+        # (database, collection) -> [next value, last value in block]
+        self._blocks: Dict[Tuple[str, str], list] = {}
+        self._locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+        self.reservations = 0
+
+    async def reserve_block(self, collection_name: str, db, size: int) -> Tuple[int, int]:
+        """Reserve `size` IDs and return the first and last of the range"""
+        last = await CounterRepository(db).increment(collection_name, size)
+        self.reservations += 1
+        return last - size + 1, last
+
+    async def next_value(self, collection_name: str, db) -> int:
+        key = (getattr(db, "name", ""), collection_name)
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        
+        async with lock:
+            block = self._blocks.get(key)
+            if block is None or block[0] > block[1]:
+                block = list(await self.reserve_block(collection_name, db, self.block_size))
+                self._blocks[key] = block
+            value = block[0]
+            block[0] += 1
+            return value
+
+    def reset(self):
+        """Forget reserved blocks (the unused IDs become gaps)"""
+        self._blocks.clear()
+        self._locks.clear()
+
+
+sequence_allocator = SequenceAllocator(block_size=settings.id_block_size)
+
+
 async def get_next_sequence_value(collection_name: str, db) -> int:
     """
     Get the next sequence value for a collection.
-    Implements an atomic counter using MongoDB's findOneAndUpdate.
+    IDs come from a per-process block reserved with one counter increment.
     """
-    counter = await db.counters.find_one_and_update(
-        {"collection_name": collection_name},
-        {"$inc": {"sequence_value": 1}},
-        upsert=True,
-        return_document=True  # Return the updated document
-    )
-    
-    # If this is the first time, the counter might be None or have sequence_value 0
-    if counter is None or counter.get("sequence_value") == 0:
-        # Initialize counter
-        await db.counters.update_one(
-            {"collection_name": collection_name},
-            {"$set": {"sequence_value": 1}},
-            upsert=True
-        )
-        return 1
-    
-    return counter["sequence_value"]
+    return await sequence_allocator.next_value(collection_name, db)
@@ -0,0 +1,27 @@
+"""
+Activity event and rollup models
+"""
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import datetime
+
+EVENT_TYPES = ("view", "review", "trip_add")
+
+# Rollup count field for each event type
+EVENT_COUNT_FIELDS = {"view": "views", "review": "reviews", "trip_add": "trip_adds"}
+
+
+class ActivityBucket(BaseModel):
+    """Event counts of one business for one hour or day (UTC)"""
+    bucket: datetime
+    views: int = 0
+    reviews: int = 0
+    trip_adds: int = 0
+
+
+class ActivitySeries(BaseModel):
+    business_id: int
+    granularity: str
+    # Events after this time may not be rolled up yet
+    complete_until: Optional[datetime] = None
+    buckets: List[ActivityBucket]
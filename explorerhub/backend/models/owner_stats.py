@@ -0,0 +1,139 @@
+"""
+Materialized owner analytics
+
+owner_stats holds one document per owner with running totals that the
+business, review and view write paths adjust with $inc. The $group
+pipeline over businesses rebuilds a document when it is missing or has
+drifted. Per-day counts come from the event rollups (rollups.py).
+"""
+from datetime import date, datetime
+from typing import Dict, Optional
+from pydantic import BaseModel
+from pymongo import UpdateOne
+from indexes import IndexSpec
+
+INDEXES = [
+    IndexSpec("owner_stats", "owner_id", "owner analytics", required=True, unique=True),
+]
+
+
+class OwnerStats(BaseModel):
+    """Analytics summary for the businesses of one owner"""
+    total_businesses: int = 0
+    average_rating: float = 0.0
+    total_reviews: int = 0
+    total_views: int = 0
+
+
+class DailyStats(BaseModel):
+    """Views and reviews of one UTC day"""
+    date: date
+    views: int = 0
+    reviews: int = 0
+
+
+def owner_stats_pipeline(owner_id: Optional[str] = None) -> list:
+    """Aggregation computing owner_stats documents from the businesses collection"""
+    pipeline = []
+    if owner_id is not None:
+        pipeline.append({"$match": {"owner_id": owner_id}})
+    pipeline.append({"$group": {
+        "_id": "$owner_id",
+        "total_businesses": {"$sum": 1},
+        # Sum of business ratings; the average is derived when reading
+        "rating_total": {"$sum": {"$ifNull": ["$rating", 0]}},
+        "total_reviews": {"$sum": {"$ifNull": ["$review_count", 0]}},
+        "total_views": {"$sum": {"$ifNull": ["$views", 0]}},
+    }})
+    return pipeline
+
+
+def owner_stats_document(owner_id: str, totals: Optional[dict]) -> dict:
+    """owner_stats document for the totals produced by owner_stats_pipeline"""
+    totals = totals or {}
+    return {
+        "owner_id": owner_id,
+        "total_businesses": totals.get("total_businesses", 0),
+        "rating_total": totals.get("rating_total", 0.0),
+        "total_reviews": totals.get("total_reviews", 0),
+        "total_views": totals.get("total_views", 0),
+        "updated_at": datetime.utcnow(),
+    }
+
+
+def owner_stats_fields(doc: dict) -> dict:
+    """Response fields of an owner_stats document"""
+    total = doc.get("total_businesses", 0)
+    average = doc.get("rating_total", 0.0) / total if total > 0 else 0.0
+    return OwnerStats(
+        total_businesses=total,
+        average_rating=round(average, 2),
+        total_reviews=doc.get("total_reviews", 0),
+        total_views=doc.get("total_views", 0),
+    ).model_dump()
+
+
+async def rebuild_owner_stats(db, owner_id: str) -> dict:
+    """Recompute one owner's stats document from their businesses"""
+    result = await db.businesses.aggregate(owner_stats_pipeline(owner_id)).to_list(length=1)
+    doc = owner_stats_document(owner_id, result[0] if result else None)
+    await db.owner_stats.replace_one({"owner_id": owner_id}, doc, upsert=True)
+    return doc
+
+
+async def get_owner_stats(db, owner_id: str) -> dict:
+    """Owner stats from the materialized document, rebuilding it when missing"""
+    doc = await db.owner_stats.find_one({"owner_id": owner_id}, {"_id": 0})
+    if doc is None:
+        doc = await rebuild_owner_stats(db, owner_id)
+    return owner_stats_fields(doc)
+
+
+async def apply_owner_stats_change(
+    db,
+    owner_id: Optional[str],
+    businesses: int = 0,
+    rating_total: float = 0.0,
+    reviews: int = 0,
+    views: int = 0,
+):
+    """
+    Adjust an owner's running totals for one write. Owners without a stats
+    document are left alone; their first read rebuilds it from scratch.
+    """
+    if owner_id is None:
+        return
+    changes = {
+        "total_businesses": businesses,
+        "rating_total": rating_total,
+        "total_reviews": reviews,
+        "total_views": views,
+    }
+    changes = {field: delta for field, delta in changes.items() if delta}
+    if not changes:
+        return
+    await db.owner_stats.update_one(
+        {"owner_id": owner_id},
+        {"$inc": changes, "$set": {"updated_at": datetime.utcnow()}}
+    )
+
+
+async def apply_view_counts(db, counts: Dict[int, int]):
+    """Add flushed view counts to the owners' totals"""
+    if not counts:
+        return
+    cursor = db.businesses.find({"id": {"$in": list(counts)}}, {"_id": 0, "id": 1, "owner_id": 1})
+    owners = {business["id"]: business.get("owner_id") async for business in cursor}
+
+    owner_views: Dict[str, int] = {}
+    for business_id, count in counts.items():
+        owner_id = owners.get(business_id)
+        if owner_id is not None:
+            owner_views[owner_id] = owner_views.get(owner_id, 0) + count
+
+    if owner_views:
+        now = datetime.utcnow()
+        await db.owner_stats.bulk_write([
+            UpdateOne({"owner_id": owner_id}, {"$inc": {"total_views": views}, "$set": {"updated_at": now}})
+            for owner_id, views in owner_views.items()
+        ], ordered=False)
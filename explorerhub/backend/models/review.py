@@ -2,6 +2,15 @@ from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
 from bson import ObjectId
+from indexes import IndexSpec
+
+INDEXES = [
+    IndexSpec("reviews", "id", "lookups by id", required=True, unique=True),
+    IndexSpec("reviews", [("business_id", 1), ("user_id", 1)], "one review per user and business", required=True),
+    IndexSpec("reviews", [("business_id", 1), ("created_at", -1), ("id", -1)], "reviews of a business, newest first",
+              required=True),
+    IndexSpec("reviews", [("user_id", 1), ("created_at", -1)], "reviews of a user, newest first"),
+]
 
 
 class ReviewBase(BaseModel):
@@ -30,8 +39,19 @@ class ReviewInDB(ReviewBase):
 
 
 class Review(ReviewBase):
-    id: str
+    id: int
+    business_id: int
     user_id: str
     user_name: str
     helpful_count: int
     created_at: datetime
+
+
+class ReviewSummary(BaseModel):
+    """Lightweight shape for list views (no text or images)"""
+    id: int
+    business_id: int
+    rating: int
+    title: str
+    user_name: str
+    created_at: datetime
@@ -2,6 +2,12 @@ from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime, date
 from bson import ObjectId
+from indexes import IndexSpec
+
+INDEXES = [
+    IndexSpec("trips", "id", "lookups by id", required=True, unique=True),
+    IndexSpec("trips", [("user_id", 1), ("start_date", -1)], "trips of a user, latest first", required=True),
+]
 
 
 class TripActivity(BaseModel):
@@ -36,7 +42,36 @@ class TripInDB(TripBase):
 
 
 class Trip(TripBase):
-    id: str
+    id: int
     user_id: str
     activities: List[TripActivity]
     created_at: datetime
+
+
+class BusinessCard(BaseModel):
+    """Business fields needed to render an activity card"""
+    id: int
+    name: str
+    image: Optional[str] = None
+    rating: float = 0.0
+    city: Optional[str] = None
+    price_level: Optional[int] = None
+
+
+class ExpandedTripActivity(TripActivity):
+    business: Optional[BusinessCard] = None
+
+
+class ExpandedTrip(Trip):
+    """Trip whose activities carry their business card (expand=businesses)"""
+    activities: List[ExpandedTripActivity]
+
+
+class TripSummary(BaseModel):
+    """Lightweight shape for list views (activity count instead of activities)"""
+    id: int
+    name: str
+    destination: str
+    start_date: date
+    end_date: date
+    activity_count: int = 0
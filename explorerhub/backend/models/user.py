@@ -2,6 +2,12 @@ from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List
 from datetime import datetime
 from bson import ObjectId
+from indexes import IndexSpec
+
+INDEXES = [
+    IndexSpec("users", "id", "lookups by id", required=True, unique=True),
+    IndexSpec("users", "email", "login and signup", required=True, unique=True),
+]
 
 
 class PyObjectId(ObjectId):
@@ -0,0 +1,126 @@
+"""
+Password hashing service
+Runs bcrypt off the event loop in a bounded thread or process pool
+"""
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional, Tuple
+from passlib.context import CryptContext
+from config import settings
+
+# Module level so process pool workers build their own copy on import
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=settings.bcrypt_rounds,
+)
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def _verify_and_rehash(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password and return a fresh hash if the stored one uses outdated settings"""
+    if not pwd_context.verify(plain_password, hashed_password):
+        return False, None
+    if pwd_context.needs_update(hashed_password):
+        return True, pwd_context.hash(plain_password)
+    return True, None
+
+
+class PasswordHasher:
+    """
+    Runs password hashing in a worker pool with a cap on concurrent jobs.
+    executor_kind is "thread", "process" or "inline" (runs on the event loop,
+    only meant for benchmarks and debugging).
+    """
+
+    def __init__(self, executor_kind: str = "thread", max_workers: int = 4, max_concurrency: int = 4):
+        if executor_kind not in ("thread", "process", "inline"):
+            raise ValueError("executor_kind must be 'thread', 'process' or 'inline'")
+        self.executor_kind = executor_kind
+        self.max_workers = max_workers
+        self.max_concurrency = max_concurrency
+        self._executor: Optional[Executor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.pending = 0
+        self.in_flight = 0
+        self.completed = 0
+
+    def _get_executor(self) -> Optional[Executor]:
+        if self.executor_kind == "inline":
+            return None
+        if self._executor is None:
+            if self.executor_kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="password-hasher",
+                )
+        return self._executor
+
+    async def _run(self, func, *args):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        self.pending += 1
+        try:
+            async with self._semaphore:
+                self.in_flight += 1
+                try:
+                    executor = self._get_executor()
+                    if executor is None:
+                        return func(*args)
+                    loop = asyncio.get_running_loop()
+                    return await loop.run_in_executor(executor, func, *args)
+                finally:
+                    self.in_flight -= 1
+                    self.completed += 1
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        """Hash a password"""
+        return await self._run(_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """Verify a password against a hash"""
+        return await self._run(_verify, plain_password, hashed_password)
+
+    async def verify_and_rehash(self, plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """Verify a password; the second item is a new hash when the stored one needs an update"""
+        return await self._run(_verify_and_rehash, plain_password, hashed_password)
+
+    @property
+    def queue_depth(self) -> int:
+        """Jobs waiting for a free slot"""
+        return self.pending - self.in_flight
+
+    def stats(self) -> dict:
+        return {
+            "executor": self.executor_kind,
+            "max_workers": self.max_workers,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "completed": self.completed,
+        }
+
+    def shutdown(self):
+        """Stop the worker pool"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    executor_kind=settings.password_hash_executor,
+    max_workers=settings.password_hash_workers,
+    max_concurrency=settings.password_hash_max_concurrency,
+)
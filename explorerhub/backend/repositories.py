@@ -0,0 +1,287 @@
+"""
+Data access for the users, businesses, reviews, trips and counters collections
+
+Routers go through these repositories instead of using collections
+directly. Each repository wraps one collection of the configured database,
+MongoDB through Motor or the in-memory stand-in (memory_db.py), so the same
+queries run against both backends.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from fastapi import Depends
+from pymongo import ReturnDocument, UpdateMany
+from database import get_database, get_public_database
+from indexes import IndexSpec, collection_indexes, declared_indexes
+from response_cache import response_cache
+from serialization import aggregation_projection
+
+
+class Repository:
+    """Lookups and owner-scoped writes of a collection keyed by a sequential `id`"""
+
+    collection_name = ""
+    # Field holding the id (as a string) of the user a document belongs to
+    owner_field: Optional[str] = None
+
+    def __init__(self, db):
+        self.db = db
+        self.collection = db[self.collection_name]
+
+    @property
+    def indexes(self) -> List[IndexSpec]:
+        """The indexes declared for the collection in the models (see indexes.py)"""
+        return collection_indexes(self.collection_name)
+
+    async def ensure_indexes(self):
+        await self.collection.create_indexes([spec.model() for spec in self.indexes])
+
+    async def get(self, item_id: Any, projection: Optional[dict] = None) -> Optional[dict]:
+        return await self.collection.find_one({"id": item_id}, projection)
+
+    async def get_many(self, item_ids: Iterable[Any], projection: Optional[dict] = None) -> Dict[Any, dict]:
+        """Documents by id with one $in query (a projection must keep "id")"""
+        cursor = self.collection.find({"id": {"$in": list(item_ids)}}, projection)
+        return {doc["id"]: doc async for doc in cursor}
+
+    async def exists(self, item_id: Any) -> bool:
+        return bool(await self.collection.count_documents({"id": item_id}, limit=1))
+
+    async def find(
+        self,
+        query: dict,
+        projection: Optional[dict] = None,
+        sort: Optional[List[Tuple[str, Any]]] = None,
+        skip: int = 0,
+        limit: int = 0,
+    ) -> List[dict]:
+        cursor = self.collection.find(query, projection)
+        if sort:
+            cursor = cursor.sort(sort)
+        if skip:
+            cursor = cursor.skip(skip)
+        if limit:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list(length=limit or None)
+
+    async def aggregate(self, pipeline: List[dict], length: Optional[int] = None) -> List[dict]:
+        return await self.collection.aggregate(pipeline).to_list(length=length)
+
+    async def insert(self, doc: dict) -> dict:
+        """Insert a document; returns it (with its _id) as the response source"""
+        await self.collection.insert_one(doc)
+        return doc
+
+    async def update(
+        self,
+        item_id: Any,
+        update: Any,
+        projection: Optional[dict] = None,
+        return_before: bool = False,
+    ) -> Optional[dict]:
+        """Apply an update (operators or a pipeline) in one round trip; None if there is no such document"""
+        return await self.collection.find_one_and_update(
+            {"id": item_id},
+            update,
+            projection=projection,
+            return_document=ReturnDocument.BEFORE if return_before else ReturnDocument.AFTER
+        )
+
+    def owned(self, item_id: Any, owner_id: str) -> dict:
+        """Filter matching a document only if it belongs to owner_id"""
+        return {"id": item_id, self.owner_field: owner_id}
+
+    async def list_owned(
+        self,
+        owner_id: str,
+        projection: Optional[dict] = None,
+        sort: Optional[List[Tuple[str, Any]]] = None,
+        limit: int = 100,
+    ) -> List[dict]:
+        return await self.find({self.owner_field: owner_id}, projection, sort, limit=limit)
+
+    async def update_owned(
+        self,
+        item_id: Any,
+        owner_id: str,
+        update: Any,
+        projection: Optional[dict] = None,
+        return_before: bool = False,
+    ) -> Optional[dict]:
+        """
+        Update a document of owner_id and return it; None when it does not
+        exist or belongs to someone else (exists() tells which)
+        """
+        return await self.collection.find_one_and_update(
+            self.owned(item_id, owner_id),
+            update,
+            projection=projection,
+            return_document=ReturnDocument.BEFORE if return_before else ReturnDocument.AFTER
+        )
+
+    async def delete_owned(self, item_id: Any, owner_id: str) -> bool:
+        result = await self.collection.delete_one(self.owned(item_id, owner_id))
+        return result.deleted_count > 0
+
+    async def pop_owned(self, item_id: Any, owner_id: str, projection: Optional[dict] = None) -> Optional[dict]:
+        """Delete a document of owner_id and return what it was"""
+        return await self.collection.find_one_and_delete(self.owned(item_id, owner_id), projection=projection)
+
+
+class UserRepository(Repository):
+    collection_name = "users"
+
+    async def by_email(self, email: str, projection: Optional[dict] = None) -> Optional[dict]:
+        return await self.collection.find_one({"email": email}, projection)
+
+    async def email_taken(self, email: str) -> bool:
+        return bool(await self.collection.count_documents({"email": email}, limit=1))
+
+    async def set_password_hash(self, email: str, hashed_password: str):
+        await self.collection.update_one({"email": email}, {"$set": {"hashed_password": hashed_password}})
+
+
+class BusinessRepository(Repository):
+    collection_name = "businesses"
+    owner_field = "owner_id"
+
+    async def search(
+        self,
+        query: dict,
+        projection: dict,
+        tiebreak: List[Tuple[str, Any]],
+        skip: int = 0,
+        limit: int = 0,
+    ) -> List[dict]:
+        """Text search (query carries $text), most relevant first, with `score`"""
+        return await self.find(
+            query,
+            {**projection, "score": {"$meta": "textScore"}},
+            [("score", {"$meta": "textScore"}), *tiebreak],
+            skip,
+            limit,
+        )
+
+    async def near(
+        self,
+        lng: float,
+        lat: float,
+        max_distance_m: float,
+        query: dict,
+        projection: dict,
+        skip: int = 0,
+        limit: int = 20,
+    ) -> List[dict]:
+        """Businesses within max_distance_m of a point, nearest first, with `distance` in meters"""
+        pipeline = [
+            {"$geoNear": {
+                "near": {"type": "Point", "coordinates": [lng, lat]},
+                "key": "geo",
+                "distanceField": "distance",
+                "maxDistance": max_distance_m,
+                "spherical": True,
+                "query": query,
+            }},
+            {"$skip": skip},
+            {"$limit": limit},
+            {"$project": {**aggregation_projection(projection), "distance": 1}},
+        ]
+        return await self.aggregate(pipeline, length=limit)
+
+    async def deactivate_owned(self, business_id: int, owner_id: str, now) -> bool:
+        """Soft delete; False when the business does not exist or is not owner_id's"""
+        result = await self.collection.update_one(
+            self.owned(business_id, owner_id),
+            {"$set": {"is_active": False, "updated_at": now}}
+        )
+        return result.matched_count > 0
+
+
+class ReviewRepository(Repository):
+    collection_name = "reviews"
+    owner_field = "user_id"
+
+    async def has_reviewed(self, business_id: int, user_id: str) -> bool:
+        return bool(await self.collection.count_documents(
+            {"business_id": business_id, "user_id": user_id}, limit=1
+        ))
+
+    async def mark_helpful(self, review_id: int) -> bool:
+        result = await self.collection.update_one({"id": review_id}, {"$inc": {"helpful_count": 1}})
+        return result.modified_count > 0
+
+
+class TripRepository(Repository):
+    collection_name = "trips"
+    owner_field = "user_id"
+
+    async def rename_business(self, user_id: str, names: Dict[str, str]):
+        """Rewrite the business_name copies in a user's trips (business id -> current name)"""
+        await self.collection.bulk_write([
+            UpdateMany(
+                {"user_id": user_id, "activities.business_id": business_id},
+                {"$set": {"activities.$[activity].business_name": name}},
+                array_filters=[{"activity.business_id": business_id, "activity.business_name": {"$ne": name}}]
+            )
+            for business_id, name in names.items()
+        ], ordered=False)
+
+
+class CounterRepository(Repository):
+    collection_name = "counters"
+
+    async def increment(self, collection_name: str, amount: int) -> int:
+        """Add amount to a sequence with one atomic upsert; returns the new value"""
+        counter = await self.collection.find_one_and_update(
+            {"collection_name": collection_name},
+            {"$inc": {"sequence_value": amount}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return counter["sequence_value"]
+
+
+class Repositories:
+    """The repositories of one database"""
+
+    def __init__(self, db):
+        self.db = db
+        self.users = UserRepository(db)
+        self.businesses = BusinessRepository(db)
+        self.reviews = ReviewRepository(db)
+        self.trips = TripRepository(db)
+        self.counters = CounterRepository(db)
+
+    def __getitem__(self, collection_name: str) -> Repository:
+        return getattr(self, collection_name)
+
+    async def ensure_indexes(self):
+        """Build every declared index, including those of collections without a repository"""
+        specs = declared_indexes()
+        for collection_name in dict.fromkeys(spec.collection_name for spec in specs):
+            await self.db[collection_name].create_indexes(
+                [spec.model() for spec in specs if spec.collection_name == collection_name]
+            )
+
+
+async def get_repositories(db = Depends(get_database)) -> Repositories:
+    """Dependency giving routes the repositories of the app database"""
+    return Repositories(db)
+
+
+async def get_public_repositories(db = Depends(get_public_database)) -> Repositories:
+    """
+    Repositories for public list and detail reads, which may be served by a
+    secondary (PUBLIC_READ_PREFERENCE); writes and owner views use get_repositories
+    """
+    return Repositories(db)
+
+
+def public_repositories(namespace: str):
+    """
+    Dependency for public reads cached under a response cache namespace: the
+    public repositories, or the primary's while the namespace was written
+    recently, so a response cached after a write is never read from a
+    secondary that has not applied it yet
+    """
+    async def dependency(db = Depends(get_database), public_db = Depends(get_public_database)) -> Repositories:
+        return Repositories(db if await response_cache.recently_written(namespace) else public_db)
+    return dependency
@@ -0,0 +1,235 @@
+"""
+Response caching for public read endpoints, with ETag / conditional GET
+"""
+import hashlib
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+from fastapi import Request, Response
+from cache import TTLCache
+from serialization import dumps
+from config import settings
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    etag: str
+    headers: Dict[str, str] = field(default_factory=dict)
+
+
+class CacheBackend(ABC):
+    """
+    Storage interface for the response cache. Methods are async so a shared
+    backend (e.g. Redis) can be dropped in without touching the routes.
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: float):
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str):
+        ...
+
+    @abstractmethod
+    async def clear(self):
+        ...
+
+    def stats(self) -> dict:
+        return {}
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Per-process TTL + LRU storage"""
+
+    def __init__(self, max_size: int = 2048, ttl: float = 30.0):
+        self._cache = TTLCache(max_size=max_size, ttl=ttl)
+
+    async def get(self, key: str) -> Optional[Any]:
+        return self._cache.get(key)
+
+    async def set(self, key: str, value: Any, ttl: float):
+        self._cache.set(key, value, ttl=ttl)
+
+    async def delete(self, key: str):
+        self._cache.delete(key)
+
+    async def clear(self):
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match covers this ETag"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [value.strip() for value in header.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+class ResponseCache:
+    """
+    Caches serialized JSON bodies of public reads under a namespace.
+    Single items live under "<namespace>:item:<id>"; list queries are keyed by
+    their normalized parameters plus a namespace generation, so replacing the
+    generation invalidates every cached list at once. Invalidating also marks
+    the namespace as written for `write_window` seconds (see recently_written).
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: float = 30.0, max_age: int = 10, write_window: float = 0.0):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_age = max_age
+        self.write_window = write_window
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    async def _generation(self, namespace: str, renew: bool = False) -> int:
+        key = f"{namespace}:generation"
+        generation = None if renew else await self.backend.get(key)
+        if generation is None:
+            # A lost generation must never fall back to an older one
+            generation = time.time_ns()
+            await self.backend.set(key, generation, ttl=max(self.ttl * 10, 3600))
+        return generation
+
+    async def list_key(self, namespace: str, params: Dict[str, Any]) -> str:
+        """Cache key for a list query; None and empty values are ignored"""
+        normalized = sorted((name, str(value)) for name, value in params.items() if value not in (None, ""))
+        return f"{namespace}:list:{await self._generation(namespace)}:{urlencode(normalized)}"
+
+    def item_key(self, namespace: str, item_id: Any) -> str:
+        return f"{namespace}:item:{item_id}"
+
+    async def has_item(self, namespace: str, item_id: Any) -> bool:
+        """Whether an item is cached (so it exists), without counting a lookup"""
+        return self.enabled and await self.backend.get(self.item_key(namespace, item_id)) is not None
+
+    async def invalidate(self, namespace: str, item_id: Any = None):
+        """Drop a cached item (if given) and every cached list of the namespace"""
+        if item_id is not None:
+            await self.backend.delete(self.item_key(namespace, item_id))
+        await self._generation(namespace, renew=True)
+        if self.write_window > 0:
+            await self.backend.set(f"{namespace}:written", True, ttl=self.write_window)
+
+    async def recently_written(self, namespace: str) -> bool:
+        """Whether the namespace was invalidated in the last `write_window` seconds"""
+        return self.write_window > 0 and await self.backend.get(f"{namespace}:written") is not None
+
+    def _response(self, request: Request, cached: CachedResponse) -> Response:
+        headers = {
+            "ETag": cached.etag,
+            "Cache-Control": f"public, max-age={self.max_age}",
+            **cached.headers,
+        }
+        if etag_matches(request, cached.etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=cached.body, media_type="application/json", headers=headers)
+
+    def encode(self, content: Any, headers: Optional[Dict[str, str]] = None) -> CachedResponse:
+        body = dumps(content)
+        return CachedResponse(body=body, etag=make_etag(body), headers=headers or {})
+
+    async def lookup(self, key: str) -> Optional[CachedResponse]:
+        cached = await self.backend.get(key) if self.enabled else None
+        if cached is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return cached
+
+    async def store(self, key: str, cached: CachedResponse, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if self.enabled and ttl > 0:
+            await self.backend.set(key, cached, ttl=ttl)
+
+    async def respond(
+        self,
+        request: Request,
+        key: str,
+        build: Callable[[], Awaitable[Tuple[Any, Dict[str, str]]]],
+        ttl: Optional[float] = None,
+    ) -> Response:
+        """
+        Serve `key` from the cache, or call `build` for (content, extra headers),
+        cache the encoded body and serve it. Exceptions from build are not cached.
+        `ttl` shortens the cache's TTL for this entry.
+        """
+        cached = await self.lookup(key)
+        if cached is None:
+            content, headers = await build()
+            cached = self.encode(content, headers)
+            await self.store(key, cached, ttl)
+        return self._response(request, cached)
+
+    async def respond_items(
+        self,
+        request: Request,
+        namespace: str,
+        item_ids: List[Any],
+        load: Callable[[List[Any]], Awaitable[Dict[Any, Any]]],
+        field: str = "items",
+    ) -> Response:
+        """
+        Serve several items as {field: [...], "missing": [...]} in request order.
+        Items come from the same cache entries as single reads; the rest are
+        fetched with one load(ids) call returning {id: content}, and cached.
+        """
+        bodies: Dict[Any, bytes] = {}
+        uncached = []
+        for item_id in dict.fromkeys(item_ids):
+            cached = await self.lookup(self.item_key(namespace, item_id))
+            if cached is not None:
+                bodies[item_id] = cached.body
+            else:
+                uncached.append(item_id)
+
+        if uncached:
+            for item_id, content in (await load(uncached)).items():
+                cached = self.encode(content)
+                await self.store(self.item_key(namespace, item_id), cached)
+                bodies[item_id] = cached.body
+
+        found = b",".join(bodies[item_id] for item_id in item_ids if item_id in bodies)
+        missing = [item_id for item_id in dict.fromkeys(item_ids) if item_id not in bodies]
+        body = b'{"' + field.encode() + b'":[' + found + b'],"missing":' + dumps(missing) + b"}"
+        return self._response(request, CachedResponse(body=body, etag=make_etag(body)))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "not_modified": self.not_modified,
+            "backend": self.backend.stats(),
+        }
+
+
+response_cache = ResponseCache(
+    MemoryCacheBackend(max_size=settings.response_cache_max_entries, ttl=settings.response_cache_ttl_seconds),
+    ttl=settings.response_cache_ttl_seconds,
+    max_age=settings.response_cache_max_age_seconds,
+    write_window=settings.public_read_primary_after_write_seconds,
+)
@@ -0,0 +1,264 @@
+"""
+Hourly and daily rollups of the activity event stream
+
+A background task counts the raw events per business into
+event_rollups_hourly, then recomputes the touched days of
+event_rollups_daily from the hourly buckets. Buckets are written with
+$set from a full recount of their events, so running a window twice (after
+a crash, or from several workers) gives the same result. The current hour
+is recounted on every run until it is complete.
+"""
+import asyncio
+from datetime import datetime, timedelta
+from typing import List, Optional
+from pymongo import UpdateOne
+from config import settings
+from database import Database
+from events import EventStore, event_store
+from indexes import IndexSpec
+from models.event import EVENT_COUNT_FIELDS
+
+HOURLY = "event_rollups_hourly"
+DAILY = "event_rollups_daily"
+STATE_ID = "events"
+BATCH_SIZE = 1000
+
+INDEXES = [
+    IndexSpec(HOURLY, [("business_id", 1), ("bucket", 1)], "hourly activity of a business", required=True,
+              unique=True),
+    IndexSpec(HOURLY, "bucket", "expiry of hourly buckets", name="bucket_ttl",
+              expireAfterSeconds=int(settings.hourly_rollup_retention_days * 86400)),
+    IndexSpec(DAILY, [("business_id", 1), ("bucket", 1)], "daily activity of a business; $merge target",
+              required=True, unique=True),
+]
+
+
+def hour_start(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def day_start(moment: datetime) -> datetime:
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class EventRollup:
+    """
+    Compacts events into rollups every `interval` seconds. Events newer than
+    `lag` seconds are left for the next run so buffered events can land first.
+    """
+
+    def __init__(
+        self,
+        store: EventStore,
+        interval: float = 60.0,
+        lag: float = 30.0,
+        event_retention_days: int = 30,
+        hourly_retention_days: int = 90,
+        chunk: timedelta = timedelta(days=1),
+        db=None,
+    ):
+        self.store = store
+        self.interval = interval
+        self.lag = lag
+        self.event_retention_days = event_retention_days
+        self.hourly_retention_days = hourly_retention_days
+        self.chunk = chunk
+        self._db = db
+        self._task: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self.runs = 0
+        self.hourly_buckets_written = 0
+        self.days_recomputed = 0
+        self.watermark: Optional[datetime] = None
+
+    @property
+    def db(self):
+        return self._db if self._db is not None else Database.get_db()
+
+    async def setup(self):
+        """
+        Bring the TTL of the hourly buckets in line with the retention. The
+        indexes themselves are declared in INDEXES; run this before they are
+        checked so a changed retention is not reported as a conflict.
+        """
+        expire_after = int(self.hourly_retention_days * 86400)
+        ttl = (await self.db[HOURLY].index_information()).get("bucket_ttl")
+        if ttl is not None and ttl.get("expireAfterSeconds") != expire_after:
+            # create_index cannot change the TTL of an existing index
+            await self.db.command("collMod", HOURLY, index={"name": "bucket_ttl", "expireAfterSeconds": expire_after})
+
+    async def _write_hourly(self, start: datetime, end: datetime) -> int:
+        written = 0
+        batch = []
+        async for row in self.store.hourly_counts(start, end):
+            batch.append(UpdateOne(
+                {"business_id": row["business_id"], "bucket": row["bucket"]},
+                {"$set": {field: row[field] for field in EVENT_COUNT_FIELDS.values()}},
+                upsert=True
+            ))
+            if len(batch) >= BATCH_SIZE:
+                await self.db[HOURLY].bulk_write(batch, ordered=False)
+                written += len(batch)
+                batch = []
+        if batch:
+            await self.db[HOURLY].bulk_write(batch, ordered=False)
+            written += len(batch)
+        return written
+
+    async def _write_daily(self, start: datetime, end: datetime) -> int:
+        """Recompute every daily bucket of the days in [start, end) from the hourly ones"""
+        first_day = day_start(start)
+        last_day = day_start(end - timedelta(microseconds=1)) + timedelta(days=1)
+        pipeline = [
+            {"$match": {"bucket": {"$gte": first_day, "$lt": last_day}}},
+            {"$group": {
+                "_id": {
+                    "business_id": "$business_id",
+                    "bucket": {"$dateFromParts": {
+                        "year": {"$year": "$bucket"},
+                        "month": {"$month": "$bucket"},
+                        "day": {"$dayOfMonth": "$bucket"},
+                    }},
+                },
+                **{field: {"$sum": f"${field}"} for field in EVENT_COUNT_FIELDS.values()},
+            }},
+            {"$project": {
+                "_id": 0,
+                "business_id": "$_id.business_id",
+                "bucket": "$_id.bucket",
+                **{field: 1 for field in EVENT_COUNT_FIELDS.values()},
+            }},
+            {"$merge": {
+                "into": DAILY,
+                "on": ["business_id", "bucket"],
+                "whenMatched": "replace",
+                "whenNotMatched": "insert",
+            }},
+        ]
+        await self.db[HOURLY].aggregate(pipeline, allowDiskUse=True).to_list(length=None)
+        return (last_day - first_day).days
+
+    async def run_once(self, now: Optional[datetime] = None) -> int:
+        """Roll up everything up to `now` minus the lag; returns the hourly buckets written"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            now = now or datetime.utcnow()
+            cutoff = now - timedelta(seconds=self.lag)
+            state = await self.db.event_rollup_state.find_one({"_id": STATE_ID})
+            if state is not None:
+                start = state["watermark"]
+            else:
+                start = hour_start(cutoff - timedelta(days=self.event_retention_days))
+
+            written = 0
+            while start < cutoff:
+                end = min(start + self.chunk, cutoff)
+                written += await self._write_hourly(start, end)
+                self.days_recomputed += await self._write_daily(start, end)
+                # The hour containing the cutoff is recounted next time
+                start = hour_start(end)
+                await self.db.event_rollup_state.update_one(
+                    {"_id": STATE_ID},
+                    {"$set": {"watermark": start, "updated_at": datetime.utcnow()}},
+                    upsert=True
+                )
+                if end == cutoff:
+                    break
+            self.watermark = start
+
+            await self.store.expire(now - timedelta(days=self.event_retention_days))
+            self.runs += 1
+            self.hourly_buckets_written += written
+            return written
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as exc:
+                print(f"Event rollup failed: {exc}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        """Start the periodic rollup task (after setup())"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "watermark": self.watermark.isoformat() if self.watermark else None,
+            "hourly_buckets_written": self.hourly_buckets_written,
+            "days_recomputed": self.days_recomputed,
+        }
+
+
+async def read_rollups(db, business_id: int, start: datetime, end: datetime, granularity: str) -> List[dict]:
+    """
+    Buckets of one business in [start, end) at "hour" or "day" granularity,
+    with zeros for buckets without events. Reads one rollup document per
+    bucket through the (business_id, bucket) index.
+    """
+    step = timedelta(hours=1) if granularity == "hour" else timedelta(days=1)
+    first = hour_start(start) if granularity == "hour" else day_start(start)
+    collection = db[HOURLY] if granularity == "hour" else db[DAILY]
+    cursor = collection.find(
+        {"business_id": business_id, "bucket": {"$gte": first, "$lt": end}},
+        {"_id": 0, "bucket": 1, **{field: 1 for field in EVENT_COUNT_FIELDS.values()}},
+    ).sort("bucket", 1)
+    stored = {doc["bucket"]: doc async for doc in cursor}
+    return fill_buckets(stored, first, end, step)
+
+
+async def read_daily_totals(db, business_ids: List[int], start: datetime, end: datetime) -> List[dict]:
+    """
+    Daily buckets in [start, end) summed over several businesses (e.g. an
+    owner's), with zeros for days without events
+    """
+    first = day_start(start)
+    pipeline = [
+        {"$match": {"business_id": {"$in": business_ids}, "bucket": {"$gte": first, "$lt": end}}},
+        {"$group": {"_id": "$bucket", **{field: {"$sum": f"${field}"} for field in EVENT_COUNT_FIELDS.values()}}},
+    ]
+    stored = {doc["_id"]: doc async for doc in db[DAILY].aggregate(pipeline)} if business_ids else {}
+    return fill_buckets(stored, first, end, timedelta(days=1))
+
+
+def fill_buckets(stored: dict, first: datetime, end: datetime, step: timedelta) -> List[dict]:
+    """Every bucket from `first` up to `end` with the counts of `stored` (by bucket start), zero elsewhere"""
+    buckets = []
+    bucket = first
+    while bucket < end:
+        doc = stored.get(bucket, {})
+        buckets.append({
+            "bucket": bucket,
+            **{field: doc.get(field, 0) for field in EVENT_COUNT_FIELDS.values()},
+        })
+        bucket += step
+    return buckets
+
+
+async def rollup_watermark(db) -> Optional[datetime]:
+    """Time up to which events are fully rolled up"""
+    state = await db.event_rollup_state.find_one({"_id": STATE_ID})
+    return state["watermark"] if state else None
+
+
+event_rollup = EventRollup(
+    event_store,
+    interval=settings.event_rollup_interval_seconds,
+    lag=settings.event_rollup_lag_seconds,
+    event_retention_days=settings.event_retention_days,
+    hourly_retention_days=settings.hourly_rollup_retention_days,
+)
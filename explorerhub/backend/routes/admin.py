@@ -0,0 +1,34 @@
+import secrets
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from typing import Literal, Optional
+from config import settings
+from slow_queries import slow_query_tracker
+
+router = APIRouter(prefix="/api/admin", tags=["admin"])
+
+
+async def require_admin_key(x_admin_key: Optional[str] = Header(None)):
+    """Admin endpoints need the X-Admin-Key header; they do not exist without ADMIN_API_KEY"""
+    if not settings.admin_api_key:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_key or not secrets.compare_digest(x_admin_key, settings.admin_api_key):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid admin key")
+
+
+@router.get("/slow-queries", dependencies=[Depends(require_admin_key)])
+async def get_slow_queries(
+    limit: int = Query(20, ge=1, le=200),
+    sort: Literal["total_ms", "max_ms", "count"] = "total_ms"
+):
+    """
+    Query shapes slower than SLOW_QUERY_THRESHOLD_MS, worst first, with the
+    winning plan and documents examined from their last explain
+    """
+    return {"stats": slow_query_tracker.stats(), "queries": slow_query_tracker.report(limit, sort)}
+
+
+@router.delete("/slow-queries", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(require_admin_key)])
+async def reset_slow_queries():
+    """Forget the recorded slow queries"""
+    slow_query_tracker.reset()
+    return None
@@ -1,15 +1,17 @@
 from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from database import get_database
 from models.user import UserCreate, User, Token, UserLogin
 from models.counter import get_next_sequence_value
 from auth import (
-    get_password_hash,
-    verify_password,
+    aget_password_hash,
     create_access_token,
     get_current_active_user,
+    invalidate_principal,
+    user_token_claims,
 )
+from passwords import password_hasher
+from repositories import Repositories, get_repositories
 from config import settings
 from utils import serialize_doc
 
@@ -17,11 +19,10 @@ router = APIRouter(prefix="/api/auth", tags=["authentication"])
 
 
 @router.post("/signup", response_model=dict, status_code=status.HTTP_201_CREATED)
-async def signup(user: UserCreate, db = Depends(get_database)):
+async def signup(user: UserCreate, repos: Repositories = Depends(get_repositories)):
     """Register a new user"""
     # Check if user already exists
-    existing_user = await db.users.find_one({"email": user.email})
-    if existing_user:
+    if await repos.users.email_taken(user.email):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
@@ -36,21 +37,17 @@ async def signup(user: UserCreate, db = Depends(get_database)):
     
     # Create new user
     user_dict = user.model_dump()
-    user_dict["hashed_password"] = get_password_hash(user_dict.pop("password"))
+    user_dict["hashed_password"] = await aget_password_hash(user_dict.pop("password"))
     
     # Get next sequential ID
-    next_id = await get_next_sequence_value("users", db)
+    next_id = await get_next_sequence_value("users", repos.db)
     user_dict["id"] = next_id
     
-    await db.users.insert_one(user_dict)
-    created_user = await db.users.find_one({"id": next_id})
-    
-    # Remove _id field
-    created_user = serialize_doc(created_user)
+    created_user = await repos.users.insert(user_dict)
     
     access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
     access_token = create_access_token(
-        data={"sub": created_user["email"]}, expires_delta=access_token_expires
+        data=user_token_claims(created_user), expires_delta=access_token_expires
     )
     
     return {
@@ -65,23 +62,34 @@ async def signup(user: UserCreate, db = Depends(get_database)):
 
 
 @router.post("/login")
-async def login(user_credentials: UserLogin, db = Depends(get_database)):
+async def login(user_credentials: UserLogin, repos: Repositories = Depends(get_repositories)):
     """Login user and return access token"""
-    user = await db.users.find_one({"email": user_credentials.email})
+    user = await repos.users.by_email(user_credentials.email)
+    
+    valid, new_hash = False, None
+    if user:
+        valid, new_hash = await password_hasher.verify_and_rehash(
+            user_credentials.password, user["hashed_password"]
+        )
     
-    if not user or not verify_password(user_credentials.password, user["hashed_password"]):
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    # Upgrade hashes made with an older cost factor
+    if new_hash:
+        await repos.users.set_password_hash(user["email"], new_hash)
+        invalidate_principal(user["email"])
+    
     # Ensure user has id field
     user = serialize_doc(user)
     
     access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
     access_token = create_access_token(
-        data={"sub": user["email"]}, expires_delta=access_token_expires
+        data=user_token_claims(user), expires_delta=access_token_expires
     )
     
     return {
@@ -1,21 +1,87 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from typing import List, Optional
-from datetime import datetime
-from database import get_database
-from models.business import BusinessCreate, Business, BusinessInDB
+import re
+from pymongo.errors import OperationFailure
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
+from typing import Any, List, Literal, Optional, Tuple, Union
+from datetime import datetime, timedelta, timezone
+from models.business import (
+    BusinessCreate, Business, BusinessSummary, BusinessInDB, BusinessBatch, BusinessBatchRequest, BusinessFacets,
+    derived_fields, empty_rating_histogram,
+)
 from models.counter import get_next_sequence_value
+from models.event import ActivitySeries
+from models.owner_stats import OwnerStats, DailyStats, apply_owner_stats_change, get_owner_stats
 from auth import get_current_active_user
+from config import settings
+from loaders import Loaders, public_loaders
+from repositories import Repositories, get_repositories, public_repositories
 from models.user import UserInDB
-from utils import serialize_doc, serialize_docs
+from view_counter import view_counter
+from events import event_recorder
+from rollups import day_start, read_daily_totals, read_rollups, rollup_watermark
+from response_cache import response_cache
+from serialization import (
+    FastJSONResponse, aggregation_projection, as_response_docs, model_projection, response_shape,
+)
+from utils import encode_cursor, decode_cursor, with_cursor, normalize_text, raise_missing_or_forbidden
 
 router = APIRouter(prefix="/api/businesses", tags=["businesses"])
 
+# Listing order; id breaks ties so cursors are stable
+BUSINESS_LIST_SORT = [("rating", -1), ("id", -1)]
+
+# Values for fields missing from older business documents
+BUSINESS_DEFAULTS = {
+    "rating": 0.0,
+    "views": 0,
+    "review_count": 0,
+    "created_at": datetime.utcnow,
+    "is_active": True,
+}
+
+BUSINESS_PROJECTION = model_projection(Business, exclude=("score", "distance"))
+
+# List cards only need the cover image
+BUSINESS_SUMMARY_PROJECTION = {"images": {"$slice": 1}}
+
+# Code of the error a $text query gets while the collection has no text index
+INDEX_NOT_FOUND = 27
+
+# Largest series /{business_id}/activity returns at once
+MAX_ACTIVITY_BUCKETS = 2000
+
+# Facet -> (fields its filter can be on, value it counts by; None for the rating band)
+BUSINESS_FACETS = {
+    "category": (("category",), "$category"),
+    "city": (("location.city", "city_normalized"), "$location.city"),
+    "price_level": (("price_level",), "$price_level"),
+    "rating": (("rating",), None),
+}
+
+# min_rating values offered by the rating facet, highest first
+RATING_BANDS = [4.5, 4.0, 3.0, 2.0, 1.0]
+
+
+def raise_search_failure(exc: OperationFailure):
+    """A 503 for a text search before the text index exists (it is built in the background at startup)"""
+    if exc.code == INDEX_NOT_FOUND:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="The search index is not available yet; try search_mode=prefix or regex",
+            headers={"Retry-After": "30"},
+        ) from exc
+    raise exc
+
+
+def business_shape(view: str, fields: Optional[str]):
+    """Model, selected fields and projection for view=summary|detail and fields="""
+    return response_shape(view, fields, Business, BusinessSummary, BUSINESS_SUMMARY_PROJECTION)
+
 
 @router.post("/", response_model=Business, status_code=status.HTTP_201_CREATED)
 async def create_business(
     business: BusinessCreate,
     current_user: UserInDB = Depends(get_current_active_user),
-    db = Depends(get_database)
+    repos: Repositories = Depends(get_repositories)
 ):
     """Create a new business (requires authentication)"""
     if current_user.role != "business":
@@ -35,43 +101,55 @@ async def create_business(
     business_dict["owner_id"] = str(user_id)
     
     # Get next sequential ID
-    next_id = await get_next_sequence_value("businesses", db)
+    next_id = await get_next_sequence_value("businesses", repos.db)
     business_dict["id"] = next_id
     
     # Add default fields
     business_dict["rating"] = 0.0
     business_dict["review_count"] = 0
+    business_dict["rating_sum"] = 0
+    business_dict["rating_histogram"] = empty_rating_histogram()
     business_dict["views"] = 0
     business_dict["created_at"] = datetime.utcnow()
     business_dict["updated_at"] = datetime.utcnow()
     business_dict["is_active"] = True
+    business_dict.update(derived_fields(business_dict))
+    if business_dict["geo"] is None:
+        # Documents without a point stay out of the 2dsphere index
+        del business_dict["geo"]
     
-    await db.businesses.insert_one(business_dict)
-    created_business = await db.businesses.find_one({"id": next_id})
-    created_business = serialize_doc(created_business)
+    await repos.businesses.insert(business_dict)
+    await response_cache.invalidate("businesses")
+    await apply_owner_stats_change(repos.db, business_dict["owner_id"], businesses=1)
     
-    return Business(**created_business)
+    # The inserted document is the response; no need to read it back
+    return FastJSONResponse(
+        as_response_docs([business_dict], Business, BUSINESS_DEFAULTS)[0],
+        status_code=status.HTTP_201_CREATED
+    )
 
 
-@router.get("/", response_model=List[Business])
-async def get_businesses(
+def business_filter(
     category: Optional[str] = None,
     city: Optional[str] = None,
     min_rating: Optional[float] = None,
     max_price: Optional[int] = None,
     search: Optional[str] = None,
-    skip: int = 0,
-    limit: int = 20,
-    db = Depends(get_database)
-):
-    """Get businesses with optional filtering"""
+    search_mode: str = "regex",
+    city_mode: str = "regex",
+) -> dict:
+    """Build the MongoDB filter for the public business listing"""
     query = {"is_active": True}
     
     if category:
         query["category"] = category
     
     if city:
-        query["location.city"] = {"$regex": city, "$options": "i"}
+        if city_mode == "prefix":
+            # Anchored prefix on the normalized field so the index can be used
+            query["city_normalized"] = {"$regex": "^" + re.escape(normalize_text(city))}
+        else:
+            query["location.city"] = {"$regex": re.escape(city), "$options": "i"}
     
     if min_rating:
         query["rating"] = {"$gte": min_rating}
@@ -80,44 +158,334 @@ async def get_businesses(
         query["price_level"] = {"$lte": max_price}
     
     if search:
-        query["$or"] = [
-            {"name": {"$regex": search, "$options": "i"}},
-            {"description": {"$regex": search, "$options": "i"}},
-            {"tags": {"$regex": search, "$options": "i"}}
+        if search_mode == "text":
+            query["$text"] = {"$search": search}
+        elif search_mode == "prefix":
+            query["name_normalized"] = {"$regex": "^" + re.escape(normalize_text(search))}
+        else:
+            pattern = re.escape(search)
+            query["$or"] = [
+                {"name": {"$regex": pattern, "$options": "i"}},
+                {"description": {"$regex": pattern, "$options": "i"}},
+                {"tags": {"$regex": pattern, "$options": "i"}}
+            ]
+    
+    return query
+
+
+async def list_businesses(
+    repos: Repositories,
+    category: Optional[str] = None,
+    city: Optional[str] = None,
+    min_rating: Optional[float] = None,
+    max_price: Optional[int] = None,
+    search: Optional[str] = None,
+    search_mode: str = "regex",
+    city_mode: str = "regex",
+    skip: int = 0,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    lat: Optional[float] = None,
+    lng: Optional[float] = None,
+    max_distance_km: float = 10.0,
+    view: str = "detail",
+    fields: Optional[str] = None,
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    Run a business listing query; returns the page, shaped for the requested
+    view or fields, and the next cursor if there may be more
+    """
+    query = business_filter(category, city, min_rating, max_price, search, search_mode, city_mode)
+    model, only, projection = business_shape(view, fields)
+    # The sort keys are needed for the next cursor even if not requested
+    projection = {**projection, **{field: 1 for field, _ in BUSINESS_LIST_SORT}}
+    
+    text_search = bool(search) and search_mode == "text"
+    near = lat is not None and lng is not None
+    
+    if near and text_search:
+        raise HTTPException(status_code=400, detail="Text search cannot be combined with lat/lng")
+    
+    if cursor:
+        # Relevance and distance order have no stable keyset, so those page with skip
+        if text_search or near:
+            raise HTTPException(status_code=400, detail="Cursor pagination is not supported with text or near search")
+        try:
+            after = decode_cursor(cursor, [field for field, _ in BUSINESS_LIST_SORT])
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = with_cursor(query, BUSINESS_LIST_SORT, after)
+        skip = 0
+    
+    if near:
+        businesses = await repos.businesses.near(lng, lat, max_distance_km * 1000, query, projection, skip, limit)
+    elif text_search:
+        try:
+            businesses = await repos.businesses.search(query, projection, [("id", -1)], skip, limit)
+        except OperationFailure as exc:
+            raise_search_failure(exc)
+    else:
+        businesses = await repos.businesses.find(query, projection, BUSINESS_LIST_SORT, skip, limit)
+    
+    next_cursor = None
+    if limit and len(businesses) == limit and not (text_search or near):
+        last = businesses[-1]
+        # A missing field is encoded as null, which is where it sorts
+        next_cursor = encode_cursor({field: last.get(field) for field, _ in BUSINESS_LIST_SORT})
+    
+    return as_response_docs(businesses, model, BUSINESS_DEFAULTS, only), next_cursor
+
+
+@router.get("/", response_model=Union[List[Business], List[BusinessSummary]])
+async def get_businesses(
+    request: Request,
+    category: Optional[str] = None,
+    city: Optional[str] = None,
+    min_rating: Optional[float] = None,
+    max_price: Optional[int] = None,
+    search: Optional[str] = None,
+    search_mode: Literal["text", "prefix", "regex"] = "regex",
+    city_mode: Literal["prefix", "regex"] = "regex",
+    skip: int = 0,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lng: Optional[float] = Query(None, ge=-180, le=180),
+    max_distance_km: float = Query(10.0, gt=0, le=500),
+    view: Literal["summary", "detail"] = "detail",
+    fields: Optional[str] = None,
+    repos: Repositories = Depends(public_repositories("businesses"))
+):
+    """
+    Get businesses with optional filtering.
+    With `lat` and `lng` the results are the businesses within
+    `max_distance_km`, nearest first, with `distance` in meters.
+    `search` matches substrings of the name, description and tags by
+    default (unindexed); search_mode=text uses the text index and sorts by
+    relevance, and search_mode=prefix matches the start of the name.
+    `city` matches substrings of the city; city_mode=prefix matches the
+    start of it on an index (ignoring case and accents).
+    Pass the X-Next-Cursor header of a page as `cursor` to get the next one;
+    `skip` still works but gets slower on deep pages.
+    view=summary returns the lightweight card shape; fields=a,b,c returns
+    only those fields (plus id).
+    Responses are cached briefly and support If-None-Match.
+    """
+    params = {
+        "category": category,
+        "city": city,
+        "min_rating": min_rating,
+        "max_price": max_price,
+        "search": search,
+        "search_mode": search_mode,
+        "city_mode": city_mode,
+        "skip": skip,
+        "limit": limit,
+        "cursor": cursor,
+        "lat": lat,
+        "lng": lng,
+        "max_distance_km": max_distance_km,
+        "view": view,
+        "fields": fields,
+    }
+    
+    async def build():
+        businesses, next_cursor = await list_businesses(repos, **params)
+        return businesses, ({"X-Next-Cursor": next_cursor} if next_cursor else {})
+    
+    key = await response_cache.list_key("businesses", params)
+    return await response_cache.respond(request, key, build)
+
+
+def rating_band() -> dict:
+    """Expression for the highest band a business's rating reaches (0 below all of them)"""
+    expression: Any = 0.0
+    for band in reversed(RATING_BANDS):
+        expression = {"$cond": [{"$gte": ["$rating", band]}, band, expression]}
+    return expression
+
+
+def facet_pipeline(query: dict, filters: dict, sort: dict, projection: dict, limit: int) -> List[dict]:
+    """
+    One $facet aggregation over the documents matching `query`: the total and
+    first page of those matching every filter too, and per facet the counts
+    among those matching the other facets' filters, so the counts of a facet
+    are what choosing each of its values would give
+    """
+    facets = {
+        "total": [{"$match": filters}, {"$count": "count"}],
+        "businesses": [{"$match": filters}, {"$sort": sort}, {"$limit": limit}, {"$project": projection}],
+    }
+    for name, (fields, value) in BUSINESS_FACETS.items():
+        stages = [
+            {"$match": {key: condition for key, condition in filters.items() if key not in fields}},
+            {"$group": {"_id": value or rating_band(), "count": {"$sum": 1}}},
         ]
+        if name in ("category", "city"):
+            stages += [{"$sort": {"count": -1, "_id": 1}}, {"$limit": settings.facet_max_values}]
+        facets[name] = stages
+    return [{"$match": query}, {"$facet": facets}]
+
+
+async def business_facets(
+    repos: Repositories,
+    category: Optional[str] = None,
+    city: Optional[str] = None,
+    min_rating: Optional[float] = None,
+    max_price: Optional[int] = None,
+    search: Optional[str] = None,
+    search_mode: str = "regex",
+    city_mode: str = "regex",
+    limit: int = 20,
+    view: str = "summary",
+) -> Tuple[dict, Optional[str]]:
+    """Facet counts, total and first page of a search; returns them and the next cursor"""
+    query = business_filter(search=search, search_mode=search_mode)
+    filters = business_filter(category, city, min_rating, max_price, city_mode=city_mode)
+    del filters["is_active"]
+    model, only, projection = business_shape(view, None)
+    projection = aggregation_projection({**projection, **{field: 1 for field, _ in BUSINESS_LIST_SORT}})
+    
+    text_search = bool(search) and search_mode == "text"
+    sort = dict(BUSINESS_LIST_SORT)
+    if text_search:
+        projection["score"] = {"$meta": "textScore"}
+        sort = {"score": {"$meta": "textScore"}, "id": -1}
     
-    cursor = db.businesses.find(query).skip(skip).limit(limit).sort("rating", -1)
-    businesses = await cursor.to_list(length=limit)
-    businesses = serialize_docs(businesses)
+    try:
+        result = (await repos.businesses.aggregate(facet_pipeline(query, filters, sort, projection, limit)))[0]
+    except OperationFailure as exc:
+        if text_search:
+            raise_search_failure(exc)
+        raise
+    businesses = result.pop("businesses")
+    total = result.pop("total")
     
-    # Ensure all required fields have default values
-    for business in businesses:
-        business.setdefault("rating", 0.0)
-        business.setdefault("views", 0)
-        business.setdefault("review_count", 0)
-        business.setdefault("created_at", datetime.utcnow())
-        business.setdefault("is_active", True)
+    facets = {}
+    for name, counts in result.items():
+        counts = [{"value": row["_id"], "count": row["count"]} for row in counts if row["_id"] is not None]
+        if name == "price_level":
+            counts.sort(key=lambda row: row["value"])
+        elif name == "rating":
+            # Each band counts the businesses rated at least that (what min_rating would give)
+            per_band = {row["value"]: row["count"] for row in counts}
+            counts, running = [], 0
+            for band in RATING_BANDS:
+                running += per_band.get(band, 0)
+                counts.append({"value": band, "count": running})
+        facets[name] = counts
     
-    return [Business(**b) for b in businesses]
+    next_cursor = None
+    if len(businesses) == limit and not text_search:
+        last = businesses[-1]
+        next_cursor = encode_cursor({field: last.get(field) for field, _ in BUSINESS_LIST_SORT})
+    content = {
+        "total": total[0]["count"] if total else 0,
+        "businesses": as_response_docs(businesses, model, BUSINESS_DEFAULTS, only),
+        "facets": facets,
+    }
+    return content, next_cursor
 
 
-@router.get("/{business_id}", response_model=Business)
-async def get_business(business_id: int, db = Depends(get_database)):
-    """Get a specific business by ID"""
-    business = await db.businesses.find_one({"id": business_id})
-    if not business:
-        raise HTTPException(status_code=404, detail="Business not found")
+@router.get("/facets", response_model=BusinessFacets)
+async def get_business_facets(
+    request: Request,
+    category: Optional[str] = None,
+    city: Optional[str] = None,
+    min_rating: Optional[float] = None,
+    max_price: Optional[int] = None,
+    search: Optional[str] = None,
+    search_mode: Literal["text", "prefix", "regex"] = "regex",
+    city_mode: Literal["prefix", "regex"] = "regex",
+    limit: int = Query(20, ge=1, le=100),
+    view: Literal["summary", "detail"] = "summary",
+    repos: Repositories = Depends(public_repositories("businesses"))
+):
+    """
+    Counts per category, city, price level and rating band for the filters
+    of GET /api/businesses/, with the total and first page of its results,
+    from one aggregation. A facet's counts ignore its own filter: with
+    category=Restaurant the category counts still list every category, as
+    the results choosing each would have. Rating bands count the businesses
+    rated at least the band (the min_rating values). Category and city list
+    the most common values. X-Next-Cursor continues the listing on
+    GET /api/businesses/ (not for text search).
+    Cached briefly per filter set; supports If-None-Match.
+    """
+    params = {
+        "category": category,
+        "city": city,
+        "min_rating": min_rating,
+        "max_price": max_price,
+        "search": search,
+        "search_mode": search_mode,
+        "city_mode": city_mode,
+        "limit": limit,
+        "view": view,
+    }
     
-    business = serialize_doc(business)
+    async def build():
+        content, next_cursor = await business_facets(repos, **params)
+        return content, ({"X-Next-Cursor": next_cursor} if next_cursor else {})
+    
+    key = await response_cache.list_key("businesses", {"facets": 1, **params})
+    return await response_cache.respond(request, key, build, ttl=settings.facet_cache_ttl_seconds)
+
+
+async def businesses_batch_response(request: Request, business_ids: List[int], loaders: Loaders):
+    """Businesses by id in request order, through the item cache and one $in query"""
+    if not business_ids:
+        raise HTTPException(status_code=400, detail="No business ids given")
+    if len(business_ids) > settings.batch_max_ids:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.batch_max_ids} ids per request"
+        )
     
-    # Ensure all required fields have default values
-    business.setdefault("rating", 0.0)
-    business.setdefault("views", 0)
-    business.setdefault("review_count", 0)
-    business.setdefault("created_at", datetime.utcnow())
-    business.setdefault("is_active", True)
+    async def load(missing_ids):
+        loader = loaders.get("businesses", BUSINESS_PROJECTION)
+        docs = await loader.load_many(missing_ids)
+        # Loader results are shared, so shape copies
+        found = [dict(doc) for doc in docs if doc is not None]
+        return {doc["id"]: doc for doc in as_response_docs(found, Business, BUSINESS_DEFAULTS)}
     
-    return Business(**business)
+    return await response_cache.respond_items(request, "businesses", business_ids, load, field="businesses")
+
+
+@router.get("/batch", response_model=BusinessBatch)
+async def get_businesses_batch(request: Request, ids: str, loaders: Loaders = Depends(public_loaders("businesses"))):
+    """
+    Get several businesses at once: ids=1,2,3. Businesses come back in the
+    requested order; ids that do not exist are listed in `missing`.
+    """
+    try:
+        business_ids = [int(value) for value in ids.split(",") if value.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma separated list of integers")
+    return await businesses_batch_response(request, business_ids, loaders)
+
+
+@router.post("/batch", response_model=BusinessBatch)
+async def post_businesses_batch(
+    batch: BusinessBatchRequest,
+    request: Request,
+    loaders: Loaders = Depends(public_loaders("businesses"))
+):
+    """Same as GET /batch with the ids in the body, for long lists"""
+    return await businesses_batch_response(request, batch.ids, loaders)
+
+
+@router.get("/{business_id}", response_model=Business)
+async def get_business(business_id: int, request: Request, loaders: Loaders = Depends(public_loaders("businesses"))):
+    """Get a specific business by ID (cached briefly, supports If-None-Match)"""
+    async def build():
+        business = await loaders.get("businesses", BUSINESS_PROJECTION).load(business_id)
+        if not business:
+            raise HTTPException(status_code=404, detail="Business not found")
+        
+        return as_response_docs([dict(business)], Business, BUSINESS_DEFAULTS)[0], {}
+    
+    return await response_cache.respond(request, response_cache.item_key("businesses", business_id), build)
 
 
 @router.put("/{business_id}", response_model=Business)
@@ -125,113 +493,173 @@ async def update_business(
     business_id: int,
     business_update: BusinessCreate,
     current_user: UserInDB = Depends(get_current_active_user),
-    db = Depends(get_database)
+    repos: Repositories = Depends(get_repositories)
 ):
     """Update a business (only by owner)"""
-    existing_business = await db.businesses.find_one({"id": business_id})
-    if not existing_business:
-        raise HTTPException(status_code=404, detail="Business not found")
-    
-    if existing_business["owner_id"] != str(current_user.id):
-        raise HTTPException(status_code=403, detail="Not authorized to update this business")
-    
     update_data = business_update.model_dump()
-    await db.businesses.update_one(
-        {"id": business_id},
-        {"$set": update_data}
-    )
+    update_data.update(derived_fields(update_data))
+    update_data["updated_at"] = datetime.utcnow()
+    update = {"$set": update_data}
+    if update_data["geo"] is None:
+        del update_data["geo"]
+        update["$unset"] = {"geo": ""}
     
-    updated_business = await db.businesses.find_one({"id": business_id})
-    updated_business = serialize_doc(updated_business)
-    
-    # Ensure all required fields have default values
-    updated_business.setdefault("rating", 0.0)
-    updated_business.setdefault("views", 0)
-    updated_business.setdefault("review_count", 0)
-    updated_business.setdefault("created_at", datetime.utcnow())
-    updated_business.setdefault("is_active", True)
+    updated_business = await repos.businesses.update_owned(
+        business_id, str(current_user.id), update, BUSINESS_PROJECTION
+    )
+    if not updated_business:
+        await raise_missing_or_forbidden(repos.businesses, business_id, "Business", "update")
+    await response_cache.invalidate("businesses", business_id)
     
-    return Business(**updated_business)
+    return FastJSONResponse(as_response_docs([updated_business], Business, BUSINESS_DEFAULTS)[0])
 
 
 @router.delete("/{business_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_business(
     business_id: int,
     current_user: UserInDB = Depends(get_current_active_user),
-    db = Depends(get_database)
+    repos: Repositories = Depends(get_repositories)
 ):
     """Delete a business (soft delete - only by owner)"""
-    existing_business = await db.businesses.find_one({"id": business_id})
-    if not existing_business:
-        raise HTTPException(status_code=404, detail="Business not found")
-    
-    if existing_business["owner_id"] != str(current_user.id):
-        raise HTTPException(status_code=403, detail="Not authorized to delete this business")
-    
-    await db.businesses.update_one(
-        {"id": business_id},
-        {"$set": {"is_active": False}}
-    )
+    if not await repos.businesses.deactivate_owned(business_id, str(current_user.id), datetime.utcnow()):
+        await raise_missing_or_forbidden(repos.businesses, business_id, "Business", "delete")
+    await response_cache.invalidate("businesses", business_id)
     
     return None
 
 
-@router.get("/owner/my-businesses", response_model=List[Business])
+@router.get("/owner/my-businesses", response_model=Union[List[Business], List[BusinessSummary]])
 async def get_my_businesses(
+    view: Literal["summary", "detail"] = "detail",
+    fields: Optional[str] = None,
     current_user: UserInDB = Depends(get_current_active_user),
-    db = Depends(get_database)
+    repos: Repositories = Depends(get_repositories)
 ):
-    """Get all businesses owned by current user"""
+    """Get all businesses owned by current user (view=summary or fields=a,b for less data)"""
     user_id = current_user.id if current_user.id is not None else None
     if user_id is None:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="User ID not found"
         )
-    cursor = db.businesses.find({"owner_id": str(user_id)})
-    businesses = await cursor.to_list(length=100)
-    businesses = serialize_docs(businesses)
-    
-    # Ensure all required fields have default values
-    for business in businesses:
-        business.setdefault("rating", 0.0)
-        business.setdefault("views", 0)
-        business.setdefault("review_count", 0)
-        business.setdefault("created_at", datetime.utcnow())
-        business.setdefault("is_active", True)
+    model, only, projection = business_shape(view, fields)
+    businesses = await repos.businesses.list_owned(str(user_id), projection)
     
-    return [Business(**b) for b in businesses]
+    return FastJSONResponse(as_response_docs(businesses, model, BUSINESS_DEFAULTS, only))
 
 
 @router.post("/{business_id}/view", status_code=status.HTTP_204_NO_CONTENT)
-async def increment_business_view(business_id: int, db = Depends(get_database)):
-    """Increment the view count for a business (public endpoint)"""
-    await db.businesses.update_one({"id": business_id}, {"$inc": {"views": 1}})
+async def increment_business_view(
+    business_id: int,
+    request: Request,
+    repos: Repositories = Depends(get_repositories)
+):
+    """
+    Increment the view count for a business (public endpoint).
+    Views are buffered and written in batches, so counts lag by a few seconds.
+    """
+    # Unknown ids would otherwise fill the event stream and its rollups; a cached
+    # detail response (the usual case right after the page loaded) saves the query.
+    # The check reads the primary: a secondary may not have a new business yet
+    if not await response_cache.has_item("businesses", business_id) and not await repos.businesses.exists(business_id):
+        raise HTTPException(status_code=404, detail="Business not found")
+    # The peer address; behind a proxy uvicorn sets it from X-Forwarded-For only for the
+    # proxies trusted with --forwarded-allow-ips, so clients cannot pick their own
+    client = request.client.host if request.client else None
+    if view_counter.record(business_id, client):
+        event_recorder.record("view", business_id)
     return None
 
 
-@router.get("/owner/analytics")
-async def owner_analytics(current_user: UserInDB = Depends(get_current_active_user), db = Depends(get_database)):
-    """Return simple analytics for an owner's businesses: total, avg rating, total reviews, total views."""
+@router.get("/owner/analytics", response_model=OwnerStats)
+async def owner_analytics(current_user: UserInDB = Depends(get_current_active_user), repos: Repositories = Depends(get_repositories)):
+    """
+    Return simple analytics for an owner's businesses: total, avg rating, total reviews, total views.
+    Served from the owner's materialized stats document.
+    """
     user_id = current_user.id if current_user.id is not None else None
     if user_id is None:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="User ID not found"
         )
-    cursor = db.businesses.find({"owner_id": str(user_id)})
-    businesses = await cursor.to_list(length=1000)
-
-    total = len(businesses)
-    total_reviews = sum(b.get("review_count", 0) for b in businesses)
-    total_views = sum(b.get("views", 0) for b in businesses)
-    avg_rating = 0.0
-    if total > 0:
-        avg_rating = sum(b.get("rating", 0.0) for b in businesses) / total
-
-    return {
-        "total_businesses": total,
-        "average_rating": round(avg_rating, 2),
-        "total_reviews": total_reviews,
-        "total_views": total_views,
-    }
+    return await get_owner_stats(repos.db, str(user_id))
+
+
+@router.get("/owner/analytics/daily", response_model=List[DailyStats])
+async def owner_daily_analytics(
+    days: int = Query(30, ge=1, le=365),
+    business_id: Optional[int] = None,
+    current_user: UserInDB = Depends(get_current_active_user),
+    repos: Repositories = Depends(get_repositories)
+):
+    """
+    Views and reviews per day (UTC) for the last `days` days across the
+    owner's businesses, or for one of them with `business_id`. Served from
+    the daily event rollups, like /{business_id}/activity, so the latest
+    minute or two may not be counted yet.
+    """
+    user_id = current_user.id if current_user.id is not None else None
+    if user_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="User ID not found"
+        )
+    owned = await repos.businesses.list_owned(str(user_id), {"_id": 0, "id": 1}, limit=0)
+    business_ids = [business["id"] for business in owned]
+    if business_id is not None:
+        business_ids = [business_id] if business_id in business_ids else []
+    
+    end = day_start(datetime.utcnow()) + timedelta(days=1)
+    buckets = await read_daily_totals(repos.db, business_ids, end - timedelta(days=days), end)
+    return FastJSONResponse([
+        DailyStats(
+            date=bucket["bucket"].date(), views=bucket["views"], reviews=bucket["reviews"]
+        ).model_dump(mode="json")
+        for bucket in buckets
+    ])
+
+
+@router.get("/{business_id}/activity", response_model=ActivitySeries)
+async def business_activity(
+    business_id: int,
+    granularity: Literal["hour", "day"] = "day",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    current_user: UserInDB = Depends(get_current_active_user),
+    repos: Repositories = Depends(get_repositories)
+):
+    """
+    Views, reviews and trip adds of a business per hour or day (UTC) in
+    [start, end), from the event rollups (only by owner). Defaults to the
+    last 30 days; events after `complete_until` may not be counted yet.
+    """
+    business = await repos.businesses.get(business_id, {"_id": 0, "owner_id": 1})
+    if not business:
+        raise HTTPException(status_code=404, detail="Business not found")
+    
+    if business["owner_id"] != str(current_user.id):
+        raise HTTPException(status_code=403, detail="Not authorized to view this business activity")
+    
+    end = end or datetime.utcnow()
+    start = start or end - timedelta(days=30)
+    # Query datetimes may carry a timezone; rollups are naive UTC
+    if end.tzinfo is not None:
+        end = end.astimezone(timezone.utc).replace(tzinfo=None)
+    if start.tzinfo is not None:
+        start = start.astimezone(timezone.utc).replace(tzinfo=None)
+    step = timedelta(hours=1) if granularity == "hour" else timedelta(days=1)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if (end - start) / step > MAX_ACTIVITY_BUCKETS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Range too large: at most {MAX_ACTIVITY_BUCKETS} buckets per request"
+        )
+    
+    return FastJSONResponse({
+        "business_id": business_id,
+        "granularity": granularity,
+        "complete_until": await rollup_watermark(repos.db),
+        "buckets": await read_rollups(repos.db, business_id, start, end, granularity),
+    })
@@ -1,34 +1,44 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
+from typing import List, Literal, Optional, Union
 from datetime import datetime
-from database import get_database
-from models.review import ReviewCreate, Review, ReviewInDB
+from models.review import ReviewCreate, Review, ReviewInDB, ReviewSummary
+from models.business import empty_rating_histogram
 from models.counter import get_next_sequence_value
+from models.owner_stats import apply_owner_stats_change, rebuild_owner_stats
 from auth import get_current_active_user
+from loaders import Loaders, get_loaders
+from repositories import Repositories, get_public_repositories, get_repositories
 from models.user import UserInDB
-from utils import serialize_doc, serialize_docs
+from response_cache import response_cache
+from events import event_recorder
+from serialization import FastJSONResponse, as_response_docs, model_projection, response_shape
+from utils import encode_cursor, decode_cursor, with_cursor, numeric_id, raise_missing_or_forbidden
 
 router = APIRouter(prefix="/api/reviews", tags=["reviews"])
 
+# Newest first; id breaks ties so cursors are stable
+REVIEW_LIST_SORT = [("created_at", -1), ("id", -1)]
+
+REVIEW_PROJECTION = model_projection(Review)
+
 
 @router.post("/", response_model=Review, status_code=status.HTTP_201_CREATED)
 async def create_review(
     review: ReviewCreate,
     current_user: UserInDB = Depends(get_current_active_user),
-    db = Depends(get_database)
+    repos: Repositories = Depends(get_repositories),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Create a new review"""
+    business_id = numeric_id(review.business_id)
+    
     # Verify business exists
-    business = await db.businesses.find_one({"id": review.business_id})
+    business = await loaders.get("businesses").load(business_id)
     if not business:
         raise HTTPException(status_code=404, detail="Business not found")
     
     # Check if user already reviewed this business
-    existing_review = await db.reviews.find_one({
-        "business_id": review.business_id,
-        "user_id": str(current_user.id)
-    })
-    if existing_review:
+    if await repos.reviews.has_reviewed(business_id, str(current_user.id)):
         raise HTTPException(
             status_code=400,
             detail="You have already reviewed this business"
@@ -36,6 +46,7 @@ async def create_review(
     
     # Create review
     review_dict = review.model_dump()
+    review_dict["business_id"] = business_id
     review_dict["user_id"] = str(current_user.id)
     review_dict["user_name"] = current_user.full_name
     review_dict["helpful_count"] = 0
@@ -43,17 +54,17 @@ async def create_review(
     review_dict["updated_at"] = datetime.utcnow()
     
     # Get next sequential ID
-    next_id = await get_next_sequence_value("reviews", db)
+    next_id = await get_next_sequence_value("reviews", repos.db)
     review_dict["id"] = next_id
     
-    await db.reviews.insert_one(review_dict)
+    await repos.reviews.insert(review_dict)
     
-    # Update business rating
-    await update_business_rating(review.business_id, db)
+    # Update business rating and stats
+    await apply_rating_change(business_id, repos, added=review.rating)
+    event_recorder.record("review", business["id"], review_dict["created_at"])
     
-    created_review = await db.reviews.find_one({"id": next_id})
-    created_review = serialize_doc(created_review)
-    return Review(**created_review)
+    # The inserted document is the response; no need to read it back
+    return FastJSONResponse(as_response_docs([review_dict], Review)[0], status_code=status.HTTP_201_CREATED)
 
 
 @router.get("/business/{business_id}", response_model=List[Review])
@@ -61,28 +72,47 @@ async def get_business_reviews(
     business_id: int,
     skip: int = 0,
     limit: int = 20,
-    db = Depends(get_database)
+    cursor: Optional[str] = None,
+    repos: Repositories = Depends(get_public_repositories)
 ):
-    """Get all reviews for a business"""
-    cursor = db.reviews.find({"business_id": business_id}).sort("created_at", -1).skip(skip).limit(limit)
-    reviews = await cursor.to_list(length=limit)
-    reviews = serialize_docs(reviews)
+    """
+    Get all reviews for a business.
+    Pass the X-Next-Cursor header of a page as `cursor` to get the next one.
+    """
+    query = {"business_id": business_id}
+    if cursor:
+        try:
+            after = decode_cursor(cursor, [field for field, _ in REVIEW_LIST_SORT])
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = with_cursor(query, REVIEW_LIST_SORT, after)
+        skip = 0
+    
+    reviews = await repos.reviews.find(query, REVIEW_PROJECTION, REVIEW_LIST_SORT, skip, limit)
     
-    return [Review(**r) for r in reviews]
+    headers = {}
+    if limit and len(reviews) == limit:
+        last = reviews[-1]
+        headers["X-Next-Cursor"] = encode_cursor(
+            {field: last[field] for field, _ in REVIEW_LIST_SORT}
+        )
+    
+    return FastJSONResponse(as_response_docs(reviews, Review), headers=headers)
 
 
-@router.get("/user/my-reviews", response_model=List[Review])
+@router.get("/user/my-reviews", response_model=Union[List[Review], List[ReviewSummary]])
 async def get_my_reviews(
+    view: Literal["summary", "detail"] = "detail",
+    fields: Optional[str] = None,
     current_user: UserInDB = Depends(get_current_active_user),
-    db = Depends(get_database)
+    repos: Repositories = Depends(get_repositories)
 ):
-    """Get all reviews by current user"""
+    """Get all reviews by current user (view=summary or fields=a,b for less data)"""
+    model, only, projection = response_shape(view, fields, Review, ReviewSummary)
     user_id = str(current_user.id) if hasattr(current_user, 'id') else str(current_user._id)
-    cursor = db.reviews.find({"user_id": user_id}).sort("created_at", -1)
-    reviews = await cursor.to_list(length=100)
-    reviews = serialize_docs(reviews)
+    reviews = await repos.reviews.list_owned(user_id, projection, [("created_at", -1)])
     
-    return [Review(**r) for r in reviews]
+    return FastJSONResponse(as_response_docs(reviews, model, only=only))
 
 
 @router.put("/{review_id}", response_model=Review)
@@ -90,51 +120,50 @@ async def update_review(
     review_id: int,
     review_update: ReviewCreate,
     current_user: UserInDB = Depends(get_current_active_user),
-    db = Depends(get_database)
+    repos: Repositories = Depends(get_repositories)
 ):
     """Update a review (only by author)"""
-    existing_review = await db.reviews.find_one({"id": review_id})
-    if not existing_review:
-        raise HTTPException(status_code=404, detail="Review not found")
-    
-    if existing_review["user_id"] != str(current_user.id):
-        raise HTTPException(status_code=403, detail="Not authorized to update this review")
-    
     update_data = review_update.model_dump()
+    # A review stays on its business: moving it would leave the rating counters of both wrong
+    # and get around the one review per business check
+    del update_data["business_id"]
     update_data["updated_at"] = datetime.utcnow()
     
-    await db.reviews.update_one(
-        {"id": review_id},
-        {"$set": update_data}
+    # The pre-image gives the old rating; the response is the pre-image plus the $set
+    existing_review = await repos.reviews.update_owned(
+        review_id, str(current_user.id), {"$set": update_data}, REVIEW_PROJECTION, return_before=True
     )
+    if not existing_review:
+        await raise_missing_or_forbidden(repos.reviews, review_id, "Review", "update")
     
     # Update business rating
-    await update_business_rating(existing_review["business_id"], db)
+    if existing_review["rating"] != review_update.rating:
+        await apply_rating_change(
+            existing_review["business_id"], repos,
+            added=review_update.rating, removed=existing_review["rating"]
+        )
     
-    updated_review = await db.reviews.find_one({"id": review_id})
-    updated_review = serialize_doc(updated_review)
-    return Review(**updated_review)
+    updated_review = {**existing_review, **update_data}
+    return FastJSONResponse(as_response_docs([updated_review], Review)[0])
 
 
 @router.delete("/{review_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_review(
     review_id: int,
     current_user: UserInDB = Depends(get_current_active_user),
-    db = Depends(get_database)
+    repos: Repositories = Depends(get_repositories)
 ):
     """Delete a review (only by author)"""
-    existing_review = await db.reviews.find_one({"id": review_id})
+    existing_review = await repos.reviews.pop_owned(
+        review_id, str(current_user.id), {"_id": 0, "business_id": 1, "rating": 1}
+    )
     if not existing_review:
-        raise HTTPException(status_code=404, detail="Review not found")
-    
-    if existing_review["user_id"] != str(current_user.id):
-        raise HTTPException(status_code=403, detail="Not authorized to delete this review")
+        await raise_missing_or_forbidden(repos.reviews, review_id, "Review", "delete")
     
     business_id = existing_review["business_id"]
-    await db.reviews.delete_one({"id": review_id})
     
-    # Update business rating
-    await update_business_rating(business_id, db)
+    # Update business rating and stats
+    await apply_rating_change(business_id, repos, removed=existing_review["rating"])
     
     return None
 
@@ -143,43 +172,135 @@ async def delete_review(
 async def mark_review_helpful(
     review_id: int,
     current_user: UserInDB = Depends(get_current_active_user),
-    db = Depends(get_database)
+    repos: Repositories = Depends(get_repositories)
 ):
     """Mark a review as helpful"""
-    result = await db.reviews.update_one(
-        {"id": review_id},
-        {"$inc": {"helpful_count": 1}}
-    )
-    
-    if result.modified_count == 0:
+    if not await repos.reviews.mark_helpful(review_id):
         raise HTTPException(status_code=404, detail="Review not found")
     
     return {"message": "Review marked as helpful"}
 
 
-async def update_business_rating(business_id: int, db):
-    """Helper function to recalculate business rating"""
+def rating_change_pipeline(added: Optional[int] = None, removed: Optional[int] = None) -> list:
+    """
+    Update pipeline that adjusts rating_sum, review_count and the per-star
+    histogram for one added and/or removed review, then derives the average.
+    Businesses created before rating_sum existed start from rating * count
+    (apply_rating_change then recomputes them from their reviews).
+    """
+    sum_delta = (added or 0) - (removed or 0)
+    count_delta = (1 if added else 0) - (1 if removed else 0)
+    changes = {
+        "rating_sum": {"$add": [
+            {"$ifNull": ["$rating_sum", {"$multiply": [
+                {"$ifNull": ["$rating", 0]}, {"$ifNull": ["$review_count", 0]}
+            ]}]},
+            sum_delta
+        ]},
+        "review_count": {"$add": [{"$ifNull": ["$review_count", 0]}, count_delta]},
+    }
+    star_deltas = {}
+    if added:
+        star_deltas[added] = star_deltas.get(added, 0) + 1
+    if removed:
+        star_deltas[removed] = star_deltas.get(removed, 0) - 1
+    for star, delta in star_deltas.items():
+        if delta:
+            field = f"rating_histogram.{star}"
+            changes[field] = {"$add": [{"$ifNull": [f"${field}", 0]}, delta]}
+    
+    return [
+        {"$set": changes},
+        {"$set": {"rating": {"$cond": [
+            {"$gt": ["$review_count", 0]},
+            {"$round": [{"$divide": ["$rating_sum", "$review_count"]}, 1]},
+            0.0
+        ]}}},
+    ]
+
+
+def rating_after(business: dict, added: Optional[int] = None, removed: Optional[int] = None) -> float:
+    """The rating rating_change_pipeline computes from the business document before the change"""
+    count = business.get("review_count", 0)
+    rating_sum = business.get("rating_sum")
+    if rating_sum is None:
+        rating_sum = business.get("rating", 0) * count
+    count += (1 if added else 0) - (1 if removed else 0)
+    rating_sum += (added or 0) - (removed or 0)
+    return round(rating_sum / count, 1) if count > 0 else 0.0
+
+
+async def apply_rating_change(business_id: int, repos: Repositories, added: Optional[int] = None,
+                              removed: Optional[int] = None):
+    """
+    Helper function to update a business rating in place for one review change.
+    Also adjusts the owner's stats; returns the business as it was before.
+    A business from before rating_sum existed only has the rounded average,
+    so its fields are recomputed from its reviews instead, once.
+    """
+    business = await repos.businesses.update(
+        business_id,
+        rating_change_pipeline(added, removed),
+        {"_id": 0, "id": 1, "owner_id": 1, "rating": 1, "rating_sum": 1, "review_count": 1},
+        return_before=True
+    )
+    if business is not None and business.get("rating_sum") is None:
+        await update_business_rating(business_id, repos)
+        return business
+    await response_cache.invalidate("businesses", business_id)
+    if business is not None:
+        await apply_owner_stats_change(
+            repos.db, business.get("owner_id"),
+            rating_total=rating_after(business, added, removed) - business.get("rating", 0.0),
+            reviews=(1 if added else 0) - (1 if removed else 0),
+        )
+    return business
+
+
+def rating_totals_group() -> dict:
+    """$group stage computing rating totals per business from its reviews"""
+    group = {
+        "_id": "$business_id",
+        "rating_sum": {"$sum": "$rating"},
+        "count": {"$sum": 1},
+    }
+    for star in range(1, 6):
+        group[f"star_{star}"] = {"$sum": {"$cond": [{"$eq": ["$rating", star]}, 1, 0]}}
+    return {"$group": group}
+
+
+def rating_fields(totals: Optional[dict]) -> dict:
+    """Business fields for the totals produced by rating_totals_group"""
+    if not totals or not totals["count"]:
+        return {
+            "rating": 0.0,
+            "review_count": 0,
+            "rating_sum": 0,
+            "rating_histogram": empty_rating_histogram(),
+        }
+    return {
+        "rating": round(totals["rating_sum"] / totals["count"], 1),
+        "review_count": totals["count"],
+        "rating_sum": totals["rating_sum"],
+        "rating_histogram": {str(star): totals[f"star_{star}"] for star in range(1, 6)},
+    }
+
+
+async def update_business_rating(business_id: int, repos: Repositories):
+    """Helper function to recalculate business rating from all its reviews (slow, repairs drift)"""
     pipeline = [
         {"$match": {"business_id": business_id}},
-        {"$group": {
-            "_id": "$business_id",
-            "avg_rating": {"$avg": "$rating"},
-            "count": {"$sum": 1}
-        }}
+        rating_totals_group(),
     ]
     
-    result = await db.reviews.aggregate(pipeline).to_list(length=1)
+    result = await repos.reviews.aggregate(pipeline, length=1)
     
-    if result:
-        await db.businesses.update_one(
-            {"id": business_id},
-            {"$set": {
-                "rating": round(result[0]["avg_rating"], 1),
-                "review_count": result[0]["count"]
-            }}
-        )
-    else:
-        await db.businesses.update_one(
-            {"id": business_id},
-            {"$set": {"rating": 0.0, "review_count": 0}}
-        )
+    business = await repos.businesses.update(
+        business_id,
+        {"$set": rating_fields(result[0] if result else None)},
+        {"_id": 0, "owner_id": 1},
+        return_before=True
+    )
+    await response_cache.invalidate("businesses", business_id)
+    if business is not None and business.get("owner_id") is not None:
+        await rebuild_owner_stats(repos.db, business["owner_id"])
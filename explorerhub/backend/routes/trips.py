@@ -1,62 +1,151 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
+from typing import Dict, List, Literal, Optional, Union
 from datetime import datetime
-from database import get_database
-from models.trip import TripCreate, Trip, TripInDB, TripActivity
+from models.trip import TripCreate, Trip, TripInDB, TripActivity, TripSummary, ExpandedTrip
 from models.counter import get_next_sequence_value
 from auth import get_current_active_user
+from loaders import Loaders, get_loaders
+from repositories import Repositories, get_repositories
 from models.user import UserInDB
-from utils import serialize_doc, serialize_docs
+from events import event_recorder
+from serialization import FastJSONResponse, as_response_docs, model_projection, response_shape
+from utils import numeric_id, raise_missing_or_forbidden
 
 router = APIRouter(prefix="/api/trips", tags=["trips"])
 
+TRIP_PROJECTION = model_projection(Trip)
+
+# Summaries count activities on the server instead of sending them
+TRIP_SUMMARY_PROJECTION = {"activity_count": {"$size": {"$ifNull": ["$activities", []]}}}
+
+# Business fields loaded for expand=businesses
+BUSINESS_CARD_PROJECTION = {
+    "_id": 0, "id": 1, "name": 1, "images": {"$slice": 1},
+    "rating": 1, "location.city": 1, "price_level": 1,
+}
+
+
+def business_card(business: dict) -> dict:
+    images = business.get("images") or []
+    return {
+        "id": business["id"],
+        "name": business.get("name", ""),
+        "image": images[0] if images else None,
+        "rating": business.get("rating", 0.0),
+        "city": (business.get("location") or {}).get("city"),
+        "price_level": business.get("price_level"),
+    }
+
+
+async def refresh_business_names(repos: Repositories, user_id: str, names: Dict[str, str]):
+    """Rewrite stale business_name copies in a user's trips (business id -> current name)"""
+    try:
+        await repos.trips.rename_business(user_id, names)
+    except Exception as exc:
+        # Harmless: the next expanded read tries again
+        print(f"Business name refresh failed: {exc}")
+
+
+async def expand_businesses(
+    trips: List[dict],
+    loaders: Loaders,
+    background_tasks: BackgroundTasks,
+    repos: Repositories,
+    user_id: str,
+):
+    """
+    Attach a business card to every activity of the trips, loading all the
+    businesses with one $in query. Stale business_name copies are corrected
+    in the response and rewritten in the database after it is sent.
+    """
+    activities = [activity for trip in trips for activity in trip.get("activities") or []]
+    business_ids = list(dict.fromkeys(numeric_id(activity["business_id"]) for activity in activities))
+    if not business_ids:
+        return
+    loader = loaders.get("businesses", BUSINESS_CARD_PROJECTION)
+    businesses = dict(zip(business_ids, await loader.load_many(business_ids)))
+    
+    stale_names = {}
+    for activity in activities:
+        business = businesses.get(numeric_id(activity["business_id"]))
+        activity["business"] = business_card(business) if business else None
+        if business and business.get("name") and activity.get("business_name") != business["name"]:
+            activity["business_name"] = business["name"]
+            stale_names[activity["business_id"]] = business["name"]
+    if stale_names:
+        background_tasks.add_task(refresh_business_names, repos, user_id, stale_names)
+
+
+async def update_own_trip(repos: Repositories, trip_id: int, current_user: UserInDB, update: dict, action: str):
+    """
+    Apply an update to one of the user's trips and respond with the result,
+    in a single find_one_and_update whose filter carries the ownership check
+    """
+    updated_trip = await repos.trips.update_owned(trip_id, str(current_user.id), update, TRIP_PROJECTION)
+    if not updated_trip:
+        await raise_missing_or_forbidden(repos.trips, trip_id, "Trip", action)
+    return FastJSONResponse(as_response_docs([updated_trip], Trip)[0])
+
 
 @router.post("/", response_model=Trip, status_code=status.HTTP_201_CREATED)
 async def create_trip(
     trip: TripCreate,
     current_user: UserInDB = Depends(get_current_active_user),
-    db = Depends(get_database)
+    repos: Repositories = Depends(get_repositories)
 ):
     """Create a new trip"""
-    trip_dict = trip.model_dump()
+    # BSON has no date type; dates are stored as ISO strings
+    trip_dict = trip.model_dump(mode="json")
     trip_dict["user_id"] = str(current_user.id)
     trip_dict["activities"] = []
     trip_dict["created_at"] = datetime.utcnow()
     trip_dict["updated_at"] = datetime.utcnow()
     
     # Get next sequential ID
-    next_id = await get_next_sequence_value("trips", db)
+    next_id = await get_next_sequence_value("trips", repos.db)
     trip_dict["id"] = next_id
     
-    await db.trips.insert_one(trip_dict)
-    created_trip = await db.trips.find_one({"id": next_id})
-    created_trip = serialize_doc(created_trip)
+    await repos.trips.insert(trip_dict)
     
-    return Trip(**created_trip)
+    # The inserted document is the response; no need to read it back
+    return FastJSONResponse(as_response_docs([trip_dict], Trip)[0], status_code=status.HTTP_201_CREATED)
 
 
-@router.get("/", response_model=List[Trip])
+@router.get("/", response_model=Union[List[ExpandedTrip], List[TripSummary]])
 async def get_my_trips(
+    background_tasks: BackgroundTasks,
+    view: Literal["summary", "detail"] = "detail",
+    fields: Optional[str] = None,
+    expand: Optional[Literal["businesses"]] = None,
     current_user: UserInDB = Depends(get_current_active_user),
-    db = Depends(get_database)
+    repos: Repositories = Depends(get_repositories),
+    loaders: Loaders = Depends(get_loaders)
 ):
-    """Get all trips for current user"""
+    """
+    Get all trips for current user (view=summary or fields=a,b for less data).
+    expand=businesses adds the business card to every activity.
+    """
+    model, only, projection = response_shape(view, fields, Trip, TripSummary, TRIP_SUMMARY_PROJECTION)
     user_id = str(current_user.id) if hasattr(current_user, 'id') else str(current_user._id)
-    cursor = db.trips.find({"user_id": user_id}).sort("start_date", -1)
-    trips = await cursor.to_list(length=100)
-    trips = serialize_docs(trips)
+    trips = await repos.trips.list_owned(user_id, projection, [("start_date", -1)])
     
-    return [Trip(**t) for t in trips]
+    trips = as_response_docs(trips, model, only=only)
+    if expand == "businesses":
+        await expand_businesses(trips, loaders, background_tasks, repos, user_id)
+    return FastJSONResponse(trips)
 
 
-@router.get("/{trip_id}", response_model=Trip)
+@router.get("/{trip_id}", response_model=ExpandedTrip)
 async def get_trip(
     trip_id: int,
+    background_tasks: BackgroundTasks,
+    expand: Optional[Literal["businesses"]] = None,
     current_user: UserInDB = Depends(get_current_active_user),
-    db = Depends(get_database)
+    repos: Repositories = Depends(get_repositories),
+    loaders: Loaders = Depends(get_loaders)
 ):
-    """Get a specific trip"""
-    trip = await db.trips.find_one({"id": trip_id})
+    """Get a specific trip (expand=businesses adds the business card to every activity)"""
+    trip = await repos.trips.get(trip_id, TRIP_PROJECTION)
     if not trip:
         raise HTTPException(status_code=404, detail="Trip not found")
     
@@ -64,8 +153,10 @@ async def get_trip(
     if trip["user_id"] != user_id:
         raise HTTPException(status_code=403, detail="Not authorized to view this trip")
     
-    trip = serialize_doc(trip)
-    return Trip(**trip)
+    trip = as_response_docs([trip], Trip)[0]
+    if expand == "businesses":
+        await expand_businesses([trip], loaders, background_tasks, repos, user_id)
+    return FastJSONResponse(trip)
 
 
 @router.put("/{trip_id}", response_model=Trip)
@@ -73,44 +164,24 @@ async def update_trip(
     trip_id: int,
     trip_update: TripCreate,
     current_user: UserInDB = Depends(get_current_active_user),
-    db = Depends(get_database)
+    repos: Repositories = Depends(get_repositories)
 ):
     """Update a trip"""
-    existing_trip = await db.trips.find_one({"id": trip_id})
-    if not existing_trip:
-        raise HTTPException(status_code=404, detail="Trip not found")
-    
-    if existing_trip["user_id"] != str(current_user.id):
-        raise HTTPException(status_code=403, detail="Not authorized to update this trip")
-    
-    update_data = trip_update.model_dump()
+    update_data = trip_update.model_dump(mode="json")
     update_data["updated_at"] = datetime.utcnow()
     
-    await db.trips.update_one(
-        {"id": trip_id},
-        {"$set": update_data}
-    )
-    
-    updated_trip = await db.trips.find_one({"id": trip_id})
-    updated_trip = serialize_doc(updated_trip)
-    return Trip(**updated_trip)
+    return await update_own_trip(repos, trip_id, current_user, {"$set": update_data}, "update")
 
 
 @router.delete("/{trip_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_trip(
     trip_id: int,
     current_user: UserInDB = Depends(get_current_active_user),
-    db = Depends(get_database)
+    repos: Repositories = Depends(get_repositories)
 ):
     """Delete a trip"""
-    existing_trip = await db.trips.find_one({"id": trip_id})
-    if not existing_trip:
-        raise HTTPException(status_code=404, detail="Trip not found")
-    
-    if existing_trip["user_id"] != str(current_user.id):
-        raise HTTPException(status_code=403, detail="Not authorized to delete this trip")
-    
-    await db.trips.delete_one({"id": trip_id})
+    if not await repos.trips.delete_owned(trip_id, str(current_user.id)):
+        await raise_missing_or_forbidden(repos.trips, trip_id, "Trip", "delete")
     return None
 
 
@@ -119,32 +190,21 @@ async def add_activity_to_trip(
     trip_id: int,
     activity: TripActivity,
     current_user: UserInDB = Depends(get_current_active_user),
-    db = Depends(get_database)
+    repos: Repositories = Depends(get_repositories),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Add an activity to a trip"""
-    trip = await db.trips.find_one({"id": trip_id})
-    if not trip:
-        raise HTTPException(status_code=404, detail="Trip not found")
-    
-    if trip["user_id"] != str(current_user.id):
-        raise HTTPException(status_code=403, detail="Not authorized to modify this trip")
-    
     # Verify business exists
-    business = await db.businesses.find_one({"id": activity.business_id})
+    business = await loaders.get("businesses").load(numeric_id(activity.business_id))
     if not business:
         raise HTTPException(status_code=404, detail="Business not found")
     
-    await db.trips.update_one(
-        {"id": trip_id},
-        {
-            "$push": {"activities": activity.model_dump()},
-            "$set": {"updated_at": datetime.utcnow()}
-        }
-    )
-    
-    updated_trip = await db.trips.find_one({"id": trip_id})
-    updated_trip = serialize_doc(updated_trip)
-    return Trip(**updated_trip)
+    response = await update_own_trip(repos, trip_id, current_user, {
+        "$push": {"activities": activity.model_dump(mode="json")},
+        "$set": {"updated_at": datetime.utcnow()}
+    }, "modify")
+    event_recorder.record("trip_add", business["id"])
+    return response
 
 
 @router.delete("/{trip_id}/activities/{business_id}", response_model=Trip)
@@ -152,24 +212,11 @@ async def remove_activity_from_trip(
     trip_id: int,
     business_id: int,
     current_user: UserInDB = Depends(get_current_active_user),
-    db = Depends(get_database)
+    repos: Repositories = Depends(get_repositories)
 ):
     """Remove an activity from a trip"""
-    trip = await db.trips.find_one({"id": trip_id})
-    if not trip:
-        raise HTTPException(status_code=404, detail="Trip not found")
-    
-    if trip["user_id"] != str(current_user.id):
-        raise HTTPException(status_code=403, detail="Not authorized to modify this trip")
-    
-    await db.trips.update_one(
-        {"id": trip_id},
-        {
-            "$pull": {"activities": {"business_id": business_id}},
-            "$set": {"updated_at": datetime.utcnow()}
-        }
-    )
-    
-    updated_trip = await db.trips.find_one({"id": trip_id})
-    updated_trip = serialize_doc(updated_trip)
-    return Trip(**updated_trip)
+    # Activities store the business id as a string
+    return await update_own_trip(repos, trip_id, current_user, {
+        "$pull": {"activities": {"business_id": {"$in": [business_id, str(business_id)]}}},
+        "$set": {"updated_at": datetime.utcnow()}
+    }, "modify")
@@ -0,0 +1,61 @@
+"""
+Migration script to backfill the GeoJSON `geo` point from
+location.latitude/longitude on existing business documents
+"""
+import asyncio
+import sys
+import os
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import settings
+from indexes import IndexManager
+from models.business import geo_point
+
+BATCH_SIZE = 1000
+
+
+async def backfill_geo_points():
+    """Set geo on businesses with coordinates and remove it from the rest"""
+    client = AsyncIOMotorClient(settings.mongodb_url)
+    db = client[settings.database_name]
+    
+    cursor = db.businesses.find({}, {"location": 1, "geo": 1})
+    batch = []
+    updated_count = 0
+    
+    async for business in cursor:
+        point = geo_point(business.get("location"))
+        if point is not None:
+            batch.append(UpdateOne({"_id": business["_id"]}, {"$set": {"geo": point}}))
+        elif "geo" in business:
+            batch.append(UpdateOne({"_id": business["_id"]}, {"$unset": {"geo": ""}}))
+        
+        if len(batch) >= BATCH_SIZE:
+            result = await db.businesses.bulk_write(batch, ordered=False)
+            updated_count += result.modified_count
+            batch = []
+    
+    if batch:
+        result = await db.businesses.bulk_write(batch, ordered=False)
+        updated_count += result.modified_count
+    
+    # The 2dsphere index is declared in models/business.py
+    manager = IndexManager()
+    await manager.check(db)
+    await manager.build(db, [
+        spec for spec in manager.missing
+        if spec.collection_name == "businesses" and any(direction == "2dsphere" for _, direction in spec.keys)
+    ])
+    for name, error in manager.errors.items():
+        print(f"✗ {name}: {error}")
+    
+    print(f"\nBackfill completed! Updated {updated_count} businesses.")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(backfill_geo_points())
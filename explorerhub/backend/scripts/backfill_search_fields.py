@@ -0,0 +1,45 @@
+"""
+Migration script to backfill the normalized search fields
+(name_normalized, city_normalized) on existing business documents
+"""
+import asyncio
+import sys
+import os
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import settings
+from models.business import search_fields
+
+BATCH_SIZE = 1000
+
+
+async def backfill_search_fields():
+    """Set name_normalized and city_normalized on every business"""
+    client = AsyncIOMotorClient(settings.mongodb_url)
+    db = client[settings.database_name]
+    
+    cursor = db.businesses.find({}, {"name": 1, "location.city": 1})
+    batch = []
+    updated_count = 0
+    
+    async for business in cursor:
+        batch.append(UpdateOne({"_id": business["_id"]}, {"$set": search_fields(business)}))
+        if len(batch) >= BATCH_SIZE:
+            result = await db.businesses.bulk_write(batch, ordered=False)
+            updated_count += result.modified_count
+            batch = []
+    
+    if batch:
+        result = await db.businesses.bulk_write(batch, ordered=False)
+        updated_count += result.modified_count
+    
+    print(f"\nBackfill completed! Updated {updated_count} businesses.")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(backfill_search_fields())
@@ -0,0 +1,76 @@
+"""
+Create the indexes declared in the models and rollups.py (see indexes.py)
+
+    python scripts/create_indexes.py            # build the missing indexes
+    python scripts/create_indexes.py --check    # exit 1 if a required index is missing or differs
+    python scripts/create_indexes.py --report   # index use, and unused, redundant or undeclared indexes
+
+Builds run one index at a time. An index that exists under the declared name
+with other keys or options is left alone and reported: drop it to have it
+rebuilt.
+"""
+import argparse
+import asyncio
+import sys
+import os
+import time
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from config import settings
+from indexes import IndexManager
+
+
+def print_specs(title: str, specs):
+    if specs:
+        print(f"{title}:")
+        for spec in specs:
+            flag = "required" if spec.required else "optional"
+            print(f"  {spec!r:<50} {flag:<9} {spec.purpose}")
+
+
+async def create_indexes(args) -> int:
+    """Diff the declared indexes against the database and build or report"""
+    client = AsyncIOMotorClient(settings.mongodb_url)
+    db = client[settings.database_name]
+    manager = IndexManager()
+    try:
+        report = await manager.check(db)
+        print(f"{len(report['present'])} declared indexes present, {len(report['missing'])} missing, "
+              f"{len(report['conflicts'])} in conflict")
+        print_specs("Missing", report["missing"])
+        print_specs("In conflict (same name, other keys or options)", report["conflicts"])
+
+        if args.report:
+            rows = await manager.usage(db)
+            print(f"\n{'index':<50} {'ops':>10}  notes")
+            for row in rows:
+                ops = "-" if row["ops"] is None else row["ops"]
+                print(f"{row['collection'] + '.' + row['name']:<50} {ops:>10}  {', '.join(row['notes'])}")
+            if report["undeclared"]:
+                print("\nUndeclared (not in any INDEXES list):")
+                for index in report["undeclared"]:
+                    print(f"  {index['collection']}.{index['name']} {index['key']}")
+
+        if args.check or args.report:
+            blocking = [spec for spec in report["missing"] + report["conflicts"] if spec.required]
+            return 1 if args.check and blocking else 0
+
+        if report["missing"]:
+            start = time.perf_counter()
+            built = await manager.build(db, report["missing"])
+            print(f"✓ Built {built} indexes in {time.perf_counter() - start:.1f}s")
+        for name, error in manager.errors.items():
+            print(f"✗ {name}: {error}")
+        return 1 if manager.errors else 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check", action="store_true", help="only compare; exit 1 on missing required indexes")
+    parser.add_argument("--report", action="store_true", help="show index use ($indexStats) and undeclared indexes")
+    sys.exit(asyncio.run(create_indexes(parser.parse_args())))
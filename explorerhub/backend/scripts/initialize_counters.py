@@ -1,42 +1,49 @@
 """
 Migration script to initialize counters for sequential IDs
 Run this script once before using the new ID system
+
+Each counter is raised to the highest id already in its collection, so
+new documents never reuse an existing id.
 """
-import asyncio
 import sys
 import os
 
-# Add parent directory to path to import config
+# Add parent directory to path to import modules
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from motor.motor_asyncio import AsyncIOMotorClient
-from config import settings
-
-
-async def initialize_counters():
-    """Initialize counters for all collections"""
-    client = AsyncIOMotorClient(settings.mongodb_url)
-    db = client[settings.database_name]
-    
-    collections = ["users", "businesses", "reviews", "trips"]
-    
-    for collection_name in collections:
-        # Check if counter already exists
-        existing_counter = await db.counters.find_one({"collection_name": collection_name})
-        
-        if existing_counter:
-            print(f"Counter for {collection_name} already exists with value: {existing_counter['sequence_value']}")
-        else:
-            # Initialize counter starting at 1
-            await db.counters.insert_one({
-                "collection_name": collection_name,
-                "sequence_value": 0
-            })
-            print(f"Initialized counter for {collection_name} at 0")
-    
-    client.close()
-    print("\nCounter initialization complete!")
+from migrations import Migration, migration_main
+
+COLLECTIONS = ["users", "businesses", "reviews", "trips"]
+
+
+class InitializeCounters(Migration):
+    name = "initialize_counters"
+    description = "Create the counters of " + ", ".join(COLLECTIONS)
+
+    async def finish(self, db, dry_run: bool) -> int:
+        writes = 0
+        for collection_name in COLLECTIONS:
+            # Only numeric ids compare with 0; ids from before the counters are ignored
+            latest = await db[collection_name].find_one(
+                {"id": {"$gte": 0}}, {"_id": 0, "id": 1}, sort=[("id", -1)]
+            )
+            last_id = latest["id"] if latest else 0
+            existing_counter = await db.counters.find_one({"collection_name": collection_name})
+            if existing_counter and existing_counter["sequence_value"] >= last_id:
+                print(f"Counter for {collection_name} already exists with value: {existing_counter['sequence_value']}")
+                continue
+            writes += 1
+            if dry_run:
+                print(f"Would set counter for {collection_name} to {last_id}")
+                continue
+            await db.counters.update_one(
+                {"collection_name": collection_name},
+                {"$max": {"sequence_value": last_id}},
+                upsert=True
+            )
+            print(f"Initialized counter for {collection_name} at {last_id}")
+        return writes
 
 
 if __name__ == "__main__":
-    asyncio.run(initialize_counters())
+    migration_main(InitializeCounters())
@@ -1,52 +1,42 @@
 """
 Migration script to add missing fields to existing business documents
+
+    python scripts/migrate_businesses.py --dry-run
+    python scripts/migrate_businesses.py --ops-per-second 500
 """
-import asyncio
 from datetime import datetime
 import sys
 import os
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
 
 # Add parent directory to path to import modules
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from config import settings
-
-
-async def migrate_businesses():
-    """Add missing required fields to existing business documents"""
-    client = AsyncIOMotorClient(settings.mongodb_url)
-    db = client[settings.database_name]
-    
-    # Find all businesses that are missing the required fields
-    businesses = await db.businesses.find({}).to_list(length=None)
-    
-    updated_count = 0
-    for business in businesses:
-        update_fields = {}
-        
-        if "rating" not in business:
-            update_fields["rating"] = 0.0
-        if "views" not in business:
-            update_fields["views"] = 0
-        if "review_count" not in business:
-            update_fields["review_count"] = 0
+from migrations import Migration, migration_main
+
+DEFAULTS = {
+    "rating": 0.0,
+    "views": 0,
+    "review_count": 0,
+    "is_active": True,
+}
+
+
+class AddBusinessDefaults(Migration):
+    name = "business_defaults"
+    description = "Add missing required fields to existing business documents"
+    collection_name = "businesses"
+    query = {"$or": [{field: {"$exists": False}} for field in [*DEFAULTS, "created_at"]]}
+    projection = {field: 1 for field in [*DEFAULTS, "created_at"]}
+
+    def transform(self, business: dict):
+        update_fields = {field: value for field, value in DEFAULTS.items() if field not in business}
         if "created_at" not in business:
             update_fields["created_at"] = datetime.utcnow()
-        if "is_active" not in business:
-            update_fields["is_active"] = True
-        
-        if update_fields:
-            await db.businesses.update_one(
-                {"_id": business["_id"]},
-                {"$set": update_fields}
-            )
-            updated_count += 1
-            print(f"Updated business: {business.get('name', 'Unknown')} (ID: {business.get('id', 'N/A')})")
-    
-    print(f"\nMigration completed! Updated {updated_count} businesses.")
-    client.close()
+        if not update_fields:
+            return None
+        return UpdateOne({"_id": business["_id"]}, {"$set": update_fields})
 
 
 if __name__ == "__main__":
-    asyncio.run(migrate_businesses())
+    migration_main(AddBusinessDefaults())
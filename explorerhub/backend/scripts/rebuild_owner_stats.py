@@ -0,0 +1,61 @@
+"""
+Rebuild the owner_stats documents from the businesses collection. Run it
+once after upgrading, or to repair drift in the incrementally maintained
+totals.
+"""
+import asyncio
+import sys
+import os
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReplaceOne
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import settings
+from models.owner_stats import owner_stats_pipeline, owner_stats_document
+
+BATCH_SIZE = 1000
+
+
+async def write_batches(collection, operations):
+    """bulk_write an async iterable of operations in batches; returns the number written"""
+    written = 0
+    batch = []
+    async for operation in operations:
+        batch.append(operation)
+        if len(batch) >= BATCH_SIZE:
+            await collection.bulk_write(batch, ordered=False)
+            written += len(batch)
+            batch = []
+    if batch:
+        await collection.bulk_write(batch, ordered=False)
+        written += len(batch)
+    return written
+
+
+async def rebuild_owner_stats(db):
+    """Replace every owner's stats document with freshly computed totals"""
+    async def operations():
+        async for totals in db.businesses.aggregate(owner_stats_pipeline(), allowDiskUse=True):
+            if totals["_id"] is None:
+                continue
+            doc = owner_stats_document(totals["_id"], totals)
+            yield ReplaceOne({"owner_id": totals["_id"]}, doc, upsert=True)
+
+    written = await write_batches(db.owner_stats, operations())
+    print(f"✓ Rebuilt stats for {written} owners")
+
+
+async def main():
+    client = AsyncIOMotorClient(settings.mongodb_url)
+    db = client[settings.database_name]
+
+    await rebuild_owner_stats(db)
+
+    print("\nOwner stats rebuild completed!")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+"""
+Recompute rating, review_count, rating_sum and rating_histogram for every
+business from its reviews. Run it to repair drift in the incrementally
+maintained rating fields. Businesses from before the incremental fields are
+recomputed on their next review change anyway; running it once after
+upgrading fills them all in at once.
+"""
+import asyncio
+import sys
+import os
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import settings
+from routes.reviews import rating_totals_group, rating_fields
+
+BATCH_SIZE = 1000
+
+
+async def reconcile_ratings():
+    """Rewrite the rating fields of all businesses in bulk"""
+    client = AsyncIOMotorClient(settings.mongodb_url)
+    db = client[settings.database_name]
+    
+    batch = []
+    updated_count = 0
+    reviewed = set()
+    
+    async def write(batch):
+        nonlocal updated_count
+        if batch:
+            result = await db.businesses.bulk_write(batch, ordered=False)
+            updated_count += result.modified_count
+    
+    cursor = db.reviews.aggregate([rating_totals_group()], allowDiskUse=True)
+    async for totals in cursor:
+        reviewed.add(totals["_id"])
+        batch.append(UpdateOne({"id": totals["_id"]}, {"$set": rating_fields(totals)}))
+        if len(batch) >= BATCH_SIZE:
+            await write(batch)
+            batch = []
+    await write(batch)
+    
+    # Businesses without any review, a batch at a time in _id order
+    # (one $nin over every reviewed id would not fit in a command at scale)
+    last_id = None
+    while True:
+        query = {} if last_id is None else {"_id": {"$gt": last_id}}
+        page = await db.businesses.find(query, {"id": 1}).sort("_id", 1).to_list(length=BATCH_SIZE)
+        if not page:
+            break
+        last_id = page[-1]["_id"]
+        unreviewed = [doc["_id"] for doc in page if doc.get("id") not in reviewed]
+        if unreviewed:
+            result = await db.businesses.update_many(
+                {"_id": {"$in": unreviewed}},
+                {"$set": rating_fields(None)}
+            )
+            updated_count += result.modified_count
+    
+    print(f"\nReconciliation completed! Updated {updated_count} businesses.")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(reconcile_ratings())
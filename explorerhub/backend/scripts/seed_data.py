@@ -0,0 +1,88 @@
+"""
+Seed the database with generated data, from a few users to millions of documents
+
+    python scripts/seed_data.py --drop
+    python scripts/seed_data.py --drop --users 200000 --businesses 1000000 --reviews 10000000 --workers 8
+
+Users are user<id>@example.com with the password given by --password (the
+first --owners users are business owners). Documents are generated by
+datagen.py and written in unordered insert_many batches by --workers
+concurrent inserts. Ids come from blocks reserved on the counters, so the
+app's sequences continue after them and seeding again adds to the data.
+--drop clears the collections first and builds the indexes after the load,
+which is much faster than inserting into indexed collections.
+"""
+import argparse
+import asyncio
+import sys
+import os
+import time
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from config import settings
+import datagen
+from passwords import password_hasher
+from repositories import Repositories
+
+SEEDED_COLLECTIONS = ["users", "businesses", "reviews", "trips", "counters", "owner_stats"]
+
+
+async def seed_database(args):
+    """Seed database with generated data"""
+    client = AsyncIOMotorClient(settings.mongodb_url)
+    db = client[settings.database_name]
+    scale = datagen.Scale(
+        args.users, args.owners if args.owners is not None else max(1, args.users // 20), args.businesses,
+        args.reviews, args.trips, args.activities, args.zipf, args.seed,
+    )
+    counts = scale.counts()
+    print(f"Seeding {settings.database_name}: " + ", ".join(f"{count} {name}" for name, count in counts.items()))
+
+    if args.drop:
+        for name in SEEDED_COLLECTIONS:
+            await db.drop_collection(name)
+        print("✓ Cleared existing data")
+
+    # One hash for every user: hashing is deliberately slow
+    password_hash = await password_hasher.hash(args.password)
+
+    progress = datagen.Progress(counts, args.progress_interval)
+    first_ids = await datagen.seed(db, scale, password_hash, args.batch_size, args.workers, progress)
+    print(progress.line())
+    total = sum(progress.inserted.values())
+    print(f"✓ Inserted {total} documents in {progress.elapsed:.1f}s ({progress.rate():,.0f} docs/s)")
+    for name, count in counts.items():
+        if count:
+            print(f"  {name}: ids {first_ids[name]}..{first_ids[name] + count - 1}")
+
+    start = time.perf_counter()
+    await Repositories(db).ensure_indexes()
+    print(f"✓ Built the declared indexes in {time.perf_counter() - start:.1f}s")
+
+    if counts["users"]:
+        owner = first_ids["users"]
+        print(f"\nBusiness owner: user{owner}@example.com / {args.password}")
+        if scale.users > scale.owners:
+            print(f"Client:         user{owner + scale.owners}@example.com / {args.password}")
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--owners", type=int, help="users with the business role (default: 1 in 20)")
+    parser.add_argument("--businesses", type=int, default=200)
+    parser.add_argument("--reviews", type=int, default=2000, help="total reviews, Zipf-distributed over businesses")
+    parser.add_argument("--trips", type=int, default=1, help="trips per user")
+    parser.add_argument("--activities", type=int, default=6, help="activities per trip")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent of business popularity")
+    parser.add_argument("--seed", type=int, default=42, help="random seed")
+    parser.add_argument("--password", default="password123", help="password of every user")
+    parser.add_argument("--batch-size", type=int, default=1000, help="documents per insert_many")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent inserts")
+    parser.add_argument("--progress-interval", type=float, default=5.0, help="seconds between progress lines")
+    parser.add_argument("--drop", action="store_true", help="clear the collections first")
+    asyncio.run(seed_database(parser.parse_args()))
@@ -0,0 +1,85 @@
+"""
+Print the slow query report of a running server (GET /api/admin/slow-queries)
+
+    python scripts/slow_query_report.py --url http://localhost:8000 --limit 10
+    python scripts/slow_query_report.py --reset
+
+The admin key defaults to ADMIN_API_KEY from the environment or .env.
+"""
+import argparse
+import json
+import sys
+import os
+import urllib.error
+import urllib.request
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def admin_request(url: str, key: str, method: str = "GET"):
+    request = urllib.request.Request(url, method=method, headers={"X-Admin-Key": key})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            body = response.read()
+    except urllib.error.HTTPError as exc:
+        sys.exit(f"{method} {url} failed: {exc.code} {exc.read().decode(errors='replace')}")
+    except urllib.error.URLError as exc:
+        sys.exit(f"Cannot reach {url}: {exc.reason}")
+    return json.loads(body) if body else None
+
+
+def compact(value) -> str:
+    return json.dumps(value, separators=(",", ":")) if value is not None else ""
+
+
+def print_report(report: dict):
+    stats = report["stats"]
+    print(f"Slow query threshold {stats['threshold_ms']} ms: {stats['slow']} slow commands in "
+          f"{stats['shapes']} shapes, {stats['explains']} explained")
+    for rank, query in enumerate(report["queries"], 1):
+        print(f"\n{rank}. {query['collection']}.{query['command']}  total={query['total_ms']}ms  "
+              f"count={query['count']}  avg={query['avg_ms']}ms  max={query['max_ms']}ms  "
+              f"returned={query['returned']}")
+        print(f"   shape: {compact(query['shape'])}")
+        if query.get("sort"):
+            print(f"   sort:  {compact(query['sort'])}")
+        explain = query.get("explain")
+        if explain and explain.get("error"):
+            print(f"   explain failed: {explain['error']}")
+        elif explain:
+            print(f"   plan:  {explain['plan']}  docs_examined={explain['docs_examined']}  "
+                  f"keys_examined={explain['keys_examined']}  returned={explain['returned']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000", help="server base URL")
+    parser.add_argument("--key", help="admin key (default: ADMIN_API_KEY)")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--sort", choices=["total_ms", "max_ms", "count"], default="total_ms")
+    parser.add_argument("--json", action="store_true", help="print the raw report")
+    parser.add_argument("--reset", action="store_true", help="clear the recorded slow queries")
+    args = parser.parse_args()
+
+    key = args.key
+    if key is None:
+        from config import settings
+        key = settings.admin_api_key
+    if not key:
+        sys.exit("No admin key: pass --key or set ADMIN_API_KEY")
+
+    url = f"{args.url.rstrip('/')}/api/admin/slow-queries"
+    if args.reset:
+        admin_request(url, key, "DELETE")
+        print("Slow query log cleared.")
+        return
+    report = admin_request(f"{url}?limit={args.limit}&sort={args.sort}", key)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
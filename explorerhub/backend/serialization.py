@@ -0,0 +1,118 @@
+"""
+Fast path for turning MongoDB documents into JSON responses.
+Documents from our own collections are trusted, so read endpoints project
+just the response fields, fill in defaults and encode with orjson instead of
+copying, validating and re-encoding every document.
+"""
+import copy
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Type
+import orjson
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+
+def _default(obj: Any):
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """Encode content (dicts, lists, models, datetimes) as JSON bytes"""
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response encoded with orjson"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def model_projection(model: Type[BaseModel], exclude: Iterable[str] = ()) -> Dict[str, Any]:
+    """MongoDB projection returning only the fields of a response model"""
+    projection = {"_id": 0}
+    for name in model.model_fields:
+        if name not in exclude:
+            projection[name] = 1
+    return projection
+
+
+def aggregation_projection(projection: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The $project equivalent of a find projection: find's {"$slice": n} is not
+    an aggregation expression, so it becomes {"$slice": ["$field", n]}
+    """
+    return {
+        name: {"$slice": [f"${name}", value["$slice"]]}
+        if isinstance(value, dict) and isinstance(value.get("$slice"), int) else value
+        for name, value in projection.items()
+    }
+
+
+def response_shape(
+    view: str,
+    fields: Optional[str],
+    detail: Type[BaseModel],
+    summary: Type[BaseModel],
+    summary_projection: Optional[Dict[str, Any]] = None,
+) -> Tuple[Type[BaseModel], Optional[List[str]], Dict[str, Any]]:
+    """
+    Resolve the view=summary|detail and fields= (comma separated sparse
+    fieldset of the detail model) query parameters into the model to shape
+    documents with, the selected field names (None for all) and the projection.
+    """
+    if fields:
+        names = [name.strip() for name in fields.split(",") if name.strip()]
+        unknown = [name for name in names if name not in detail.model_fields]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+        if "id" not in names:
+            names.insert(0, "id")
+        projection = {"_id": 0, **{name: 1 for name in names}}
+        return detail, names, projection
+    if view == "summary":
+        return summary, None, {**model_projection(summary), **(summary_projection or {})}
+    return detail, None, model_projection(detail)
+
+
+def as_response_docs(
+    docs: List[Dict[str, Any]],
+    model: Type[BaseModel],
+    defaults: Optional[Dict[str, Any]] = None,
+    only: Optional[List[str]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Shape projected documents like the response model without validating them:
+    missing fields get the value from `defaults` (callables are called) or the
+    model default, and anything outside the model (or outside `only`) is dropped.
+    """
+    defaults = defaults or {}
+    fields = model.model_fields
+    if only is not None:
+        fields = {name: fields[name] for name in only}
+    missing_values = {}
+    for doc in docs:
+        doc.pop("_id", None)
+        for name in [key for key in doc if key not in fields]:
+            del doc[name]
+        for name, field in fields.items():
+            if name in doc:
+                continue
+            if name not in missing_values:
+                if name in defaults:
+                    value = defaults[name]
+                elif not field.is_required():
+                    value = field.get_default(call_default_factory=True)
+                else:
+                    value = None
+                missing_values[name] = value
+            value = missing_values[name]
+            if callable(value):
+                value = value()
+            elif isinstance(value, (list, dict)):
+                # Each document gets its own copy of a mutable default
+                value = copy.deepcopy(value)
+            doc[name] = value
+    return docs
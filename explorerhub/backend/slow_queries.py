@@ -0,0 +1,294 @@
+"""
+Slow query log: database reads and writes slower than a threshold, grouped
+by query shape, with an explain("executionStats") captured per shape
+"""
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from pymongo import monitoring
+from config import settings
+
+TRACKED_COMMANDS = frozenset({"find", "aggregate", "count", "distinct", "findAndModify", "update", "delete"})
+# Explaining these never writes
+EXPLAINABLE_COMMANDS = frozenset({"find", "aggregate", "count", "distinct"})
+# Driver and session fields that explain does not accept inside the explained command
+DRIVER_FIELDS = frozenset({"lsid", "txnNumber", "$db", "$clusterTime", "$readPreference", "readConcern", "writeConcern"})
+
+
+def value_shape(value: Any) -> Any:
+    """A condition with its values replaced by "?", keeping the operators"""
+    if isinstance(value, dict) and any(key.startswith("$") for key in value):
+        return {
+            key: filter_shape(item) if key == "$elemMatch" and isinstance(item, dict) else value_shape(item)
+            for key, item in value.items()
+        }
+    return "?"
+
+
+def filter_shape(query: Optional[dict]) -> dict:
+    """A filter with its values stripped, e.g. {"category": "?", "rating": {"$gte": "?"}}"""
+    shape = {}
+    for key, value in (query or {}).items():
+        if key in ("$and", "$or", "$nor") and isinstance(value, list):
+            shape[key] = [filter_shape(item) for item in value]
+        else:
+            shape[key] = value_shape(value)
+    return shape
+
+
+def pipeline_shape(pipeline: List[dict]) -> List[Any]:
+    """Stage names, with the filter shape of $match and $geoNear.query"""
+    shape = []
+    for stage in pipeline:
+        name = next(iter(stage), "")
+        body = stage.get(name)
+        if name == "$match":
+            shape.append({name: filter_shape(body)})
+        elif name == "$geoNear":
+            shape.append({name: {"query": filter_shape(body.get("query")), "key": body.get("key")}})
+        elif name == "$sort":
+            shape.append({name: body})
+        else:
+            shape.append(name)
+    return shape
+
+
+def command_shape(command_name: str, command: dict) -> Tuple[Any, Optional[dict]]:
+    """(query shape, sort) of a command"""
+    if command_name == "find":
+        return filter_shape(command.get("filter")), command.get("sort")
+    if command_name == "aggregate":
+        return pipeline_shape(command.get("pipeline", [])), None
+    if command_name in ("count", "distinct"):
+        return filter_shape(command.get("query")), None
+    if command_name == "findAndModify":
+        return filter_shape(command.get("query")), command.get("sort")
+    if command_name in ("update", "delete"):
+        statements = command.get("updates" if command_name == "update" else "deletes") or [{}]
+        return filter_shape(statements[0].get("q")), None
+    return {}, None
+
+
+def find_key(document: Any, key: str) -> Optional[Any]:
+    """First value of key anywhere in a nested explain output"""
+    if isinstance(document, dict):
+        if key in document:
+            return document[key]
+        values = document.values()
+    elif isinstance(document, list):
+        values = document
+    else:
+        return None
+    for value in values:
+        found = find_key(value, key)
+        if found is not None:
+            return found
+    return None
+
+
+def plan_summary(plan: Any) -> str:
+    """Winning plan as nested stages, e.g. "FETCH > IXSCAN category_1" or "COLLSCAN" """
+    stages = []
+    while isinstance(plan, dict) and plan.get("stage"):
+        stage = plan["stage"]
+        if plan.get("indexName"):
+            stage += f" {plan['indexName']}"
+        stages.append(stage)
+        plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0]
+    return " > ".join(stages)
+
+
+def explain_summary(explain: dict) -> dict:
+    stats = find_key(explain, "executionStats") or {}
+    return {
+        "plan": plan_summary(find_key(explain, "winningPlan")),
+        "docs_examined": stats.get("totalDocsExamined"),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "returned": stats.get("nReturned"),
+        "execution_ms": stats.get("executionTimeMillis"),
+    }
+
+
+def returned_documents(command_name: str, reply: dict) -> int:
+    cursor = reply.get("cursor")
+    if cursor is not None:
+        return len(cursor.get("firstBatch") or ())
+    n = reply.get("n")
+    return n if isinstance(n, int) else 0
+
+
+class SlowQueryTracker(monitoring.CommandListener):
+    """
+    Groups commands slower than threshold_ms by (collection, command, shape)
+    and keeps count, total and max duration per group, at most max_shapes
+    groups (the one with the least total time is dropped first).
+    For read commands the first slow occurrence of a shape, and then at most
+    one every explain_interval seconds, is explained with executionStats on
+    the event loop given to start(), so the report shows the plan and the
+    documents examined. Events arrive on the driver's threads, hence the lock.
+    """
+
+    def __init__(self, threshold_ms: float = 100.0, explain: bool = True, explain_interval: float = 300.0,
+                 max_shapes: int = 200):
+        self.threshold_ms = threshold_ms
+        self.explain = explain
+        self.explain_interval = explain_interval
+        self.max_shapes = max_shapes
+        self._lock = threading.Lock()
+        self._started: Dict[Tuple, Tuple[Any, dict]] = {}
+        self._shapes: Dict[Tuple[str, str, str], dict] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._db = None
+        self._explaining = False
+        self.slow = 0
+        self.explains = 0
+        self.explain_errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_ms > 0
+
+    def start(self, db):
+        """Explain on the running loop with db (explain needs a database handle)"""
+        self._loop = asyncio.get_running_loop()
+        self._db = db
+
+    def stop(self):
+        self._loop = None
+        self._db = None
+
+    def started(self, event):
+        if event.command_name not in TRACKED_COMMANDS or not self.enabled:
+            return
+        with self._lock:
+            self._started[(event.connection_id, event.request_id)] = (
+                event.command.get(event.command_name), event.command
+            )
+
+    def succeeded(self, event):
+        self._finished(event, event.reply)
+
+    def failed(self, event):
+        self._finished(event, None)
+
+    def _finished(self, event, reply: Optional[dict]):
+        with self._lock:
+            started = self._started.pop((event.connection_id, event.request_id), None)
+        if started is None:
+            return
+        duration_ms = event.duration_micros / 1000
+        if duration_ms < self.threshold_ms:
+            return
+        collection, command = started
+        self.record(
+            collection if isinstance(collection, str) else "", event.command_name, command, duration_ms,
+            returned_documents(event.command_name, reply) if reply else 0
+        )
+
+    def record(self, collection: str, command_name: str, command: dict, duration_ms: float, returned: int = 0):
+        """Count one slow command under its shape, and schedule an explain if one is due"""
+        shape, sort = command_shape(command_name, command)
+        # Another sort may need another index, so it is part of the shape
+        key = (collection, command_name, json.dumps([shape, sort], sort_keys=True, default=str))
+        now = time.time()
+        with self._lock:
+            self.slow += 1
+            entry = self._shapes.get(key)
+            if entry is None:
+                if len(self._shapes) >= self.max_shapes:
+                    del self._shapes[min(self._shapes, key=lambda name: self._shapes[name]["total_ms"])]
+                entry = self._shapes[key] = {
+                    "collection": collection,
+                    "command": command_name,
+                    "shape": shape,
+                    "sort": sort,
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "returned": 0,
+                    "first_seen": now,
+                    "explain": None,
+                    "explained_at": 0.0,
+                }
+            entry["count"] += 1
+            entry["total_ms"] += duration_ms
+            entry["max_ms"] = max(entry["max_ms"], duration_ms)
+            entry["last_ms"] = duration_ms
+            entry["last_seen"] = now
+            entry["returned"] += returned
+            explain_due = (
+                self.explain and self._loop is not None and not self._explaining
+                and command_name in EXPLAINABLE_COMMANDS
+                and now - entry["explained_at"] >= self.explain_interval
+                and not any(stage in ("$out", "$merge") for stage in (
+                    next(iter(item), "") for item in command.get("pipeline", [])
+                ))
+            )
+            if explain_due:
+                # One explain at a time, and claimed now so the shape is not explained twice
+                entry["explained_at"] = now
+                self._explaining = True
+        if explain_due:
+            explained = {name: value for name, value in command.items() if name not in DRIVER_FIELDS}
+            asyncio.run_coroutine_threadsafe(self._explain(key, explained), self._loop)
+
+    async def _explain(self, key: Tuple[str, str, str], command: dict):
+        try:
+            if self._db is None:
+                return
+            try:
+                explain = await self._db.command({"explain": command, "verbosity": "executionStats"})
+            except Exception as exc:
+                summary = {"error": str(exc)}
+                self.explain_errors += 1
+            else:
+                summary = explain_summary(explain)
+                self.explains += 1
+            with self._lock:
+                entry = self._shapes.get(key)
+                if entry is not None:
+                    entry["explain"] = summary
+        finally:
+            self._explaining = False
+
+    def report(self, limit: int = 20, sort: str = "total_ms") -> List[dict]:
+        """The slowest shapes, by total_ms, max_ms or count"""
+        with self._lock:
+            entries = [dict(entry) for entry in self._shapes.values()]
+        entries.sort(key=lambda entry: entry[sort], reverse=True)
+        report = []
+        for entry in entries[:limit]:
+            entry["avg_ms"] = round(entry["total_ms"] / entry["count"], 2)
+            entry["total_ms"] = round(entry["total_ms"], 2)
+            entry["max_ms"] = round(entry["max_ms"], 2)
+            entry["last_ms"] = round(entry["last_ms"], 2)
+            entry["first_seen"] = datetime.utcfromtimestamp(entry["first_seen"]).isoformat()
+            entry["last_seen"] = datetime.utcfromtimestamp(entry["last_seen"]).isoformat()
+            del entry["explained_at"]
+            report.append(entry)
+        return report
+
+    def reset(self):
+        with self._lock:
+            self._shapes.clear()
+            self.slow = 0
+
+    def stats(self) -> dict:
+        return {
+            "threshold_ms": self.threshold_ms,
+            "slow": self.slow,
+            "shapes": len(self._shapes),
+            "explains": self.explains,
+            "explain_errors": self.explain_errors,
+        }
+
+
+slow_query_tracker = SlowQueryTracker(
+    threshold_ms=settings.slow_query_threshold_ms,
+    explain=settings.slow_query_explain,
+    explain_interval=settings.slow_query_explain_interval_seconds,
+    max_shapes=settings.slow_query_max_shapes,
+)
@@ -1,7 +1,12 @@
 """
 Utility functions for the backend
 """
-from typing import Dict, List, Any
+import base64
+import json
+import unicodedata
+from datetime import datetime
+from typing import Dict, List, Any, Tuple
+from fastapi import HTTPException
 
 
 def serialize_doc(doc: Dict[str, Any]) -> Dict[str, Any]:
@@ -43,3 +48,101 @@ def ensure_id(doc: Dict[str, Any]) -> Dict[str, Any]:
     if doc and "_id" in doc:
         del doc["_id"]
     return doc
+
+
+def normalize_text(value: str) -> str:
+    """
+    Lowercase and strip accents so text can be prefix-matched on an index
+    """
+    if not value:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", value)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower().strip()
+
+
+# Types a decoded cursor value may have (besides None)
+CURSOR_VALUE_TYPES = (str, int, float, datetime)
+
+
+def _cursor_default(value: Any):
+    if isinstance(value, datetime):
+        return {"$dt": value.isoformat()}
+    raise TypeError(f"Cannot encode {type(value).__name__} in a cursor")
+
+
+def _cursor_hook(obj: Dict[str, Any]):
+    if set(obj) == {"$dt"}:
+        return datetime.fromisoformat(obj["$dt"])
+    return obj
+
+
+def encode_cursor(values: Dict[str, Any]) -> str:
+    """
+    Encode the sort key of the last item of a page as an opaque token
+    """
+    raw = json.dumps(values, default=_cursor_default, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str, fields: List[str]) -> Dict[str, Any]:
+    """
+    Decode a cursor token, raising ValueError if it is malformed
+    or does not carry the expected sort fields
+    """
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()), object_hook=_cursor_hook)
+    except (ValueError, TypeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+    if not isinstance(values, dict) or set(values) != set(fields):
+        raise ValueError("Invalid cursor")
+    # Values go into the filter as they are, so anything but a plain value could inject an operator
+    if not all(value is None or isinstance(value, CURSOR_VALUE_TYPES) for value in values.values()):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def keyset_filter(sort: List[Tuple[str, int]], after: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the filter matching documents that come after `after`
+    in the given sort, e.g. [("rating", -1), ("id", -1)].
+    A missing field sorts like null, before every value: descending, the
+    documents without it come after the others.
+    """
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        prefix = {prev: after[prev] for prev, _ in sort[:i]}
+        value = after[field]
+        if value is None:
+            if direction > 0:
+                clauses.append({**prefix, field: {"$ne": None}})
+            continue
+        clauses.append({**prefix, field: {"$lt" if direction < 0 else "$gt": value}})
+        if direction < 0:
+            clauses.append({**prefix, field: None})
+    return {"$or": clauses}
+
+
+def with_cursor(query: Dict[str, Any], sort: List[Tuple[str, int]], after: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Restrict a query to the documents after a cursor position
+    """
+    return {"$and": [query, keyset_filter(sort, after)]}
+
+
+def numeric_id(value: Any) -> Any:
+    """Sequential ids arrive as strings from some clients; documents store integers"""
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    return value
+
+
+async def raise_missing_or_forbidden(repository, item_id: Any, name: str, action: str):
+    """
+    For a write filtered by id and owner that matched nothing: 404 when the
+    document does not exist, 403 when it belongs to someone else. Only runs
+    on the failure path, so successful writes stay one round trip.
+    """
+    if await repository.exists(item_id):
+        raise HTTPException(status_code=403, detail=f"Not authorized to {action} this {name.lower()}")
+    raise HTTPException(status_code=404, detail=f"{name} not found")
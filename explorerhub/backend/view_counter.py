@@ -0,0 +1,120 @@
+"""
+Write-behind buffering for business view counts
+"""
+import asyncio
+from collections import defaultdict
+from typing import Dict, Optional
+from pymongo import UpdateOne
+from cache import TTLCache
+from config import settings
+from database import Database
+from models.owner_stats import apply_view_counts
+
+
+class ViewCounter:
+    """
+    Collects view increments per business in memory and writes them as one
+    bulk_write of $inc operations, every `flush_interval` seconds or as soon
+    as `max_pending` businesses have pending views. Each flush also adds the
+    counts to the owners' stats. A crash loses at most the
+    views recorded since the last flush.
+    """
+
+    def __init__(self, flush_interval: float = 5.0, max_pending: int = 1000, dedup_window: float = 0.0):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # (client, business id) pairs seen recently; a window of 0 disables dedup
+        self._recent = TTLCache(max_size=100000 if dedup_window > 0 else 0, ttl=dedup_window)
+        self._pending: Dict[int, int] = defaultdict(int)
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._size_flush: Optional[asyncio.Task] = None
+        self.recorded = 0
+        self.deduplicated = 0
+        self.flushes = 0
+        self.writes = 0
+
+    def record(self, business_id: int, client_key: Optional[str] = None) -> bool:
+        """Count a view; returns False when it was a repeat inside the dedup window"""
+        if client_key is not None and self._recent.enabled:
+            key = (client_key, business_id)
+            if self._recent.get(key) is not None:
+                self.deduplicated += 1
+                return False
+            self._recent.set(key, True)
+
+        self._pending[business_id] += 1
+        self.recorded += 1
+
+        if len(self._pending) >= self.max_pending and (self._size_flush is None or self._size_flush.done()):
+            self._size_flush = asyncio.ensure_future(self.flush())
+        return True
+
+    async def flush(self, db=None) -> int:
+        """Write pending counts; returns the number of businesses updated"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            pending, self._pending = self._pending, defaultdict(int)
+            operations = [
+                UpdateOne({"id": business_id}, {"$inc": {"views": count}})
+                for business_id, count in pending.items()
+            ]
+            db = db if db is not None else Database.get_db()
+            try:
+                await db.businesses.bulk_write(operations, ordered=False)
+            except Exception as exc:
+                # Put the counts back so the next flush retries them
+                for business_id, count in pending.items():
+                    self._pending[business_id] += count
+                print(f"View counter flush failed: {exc}")
+                return 0
+            self.flushes += 1
+            self.writes += len(operations)
+            try:
+                await apply_view_counts(db, pending)
+            except Exception as exc:
+                # The businesses already have the views; rebuilding owner stats repairs the totals
+                print(f"View counter stats update failed: {exc}")
+            return len(operations)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        """Start the periodic flush task"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the periodic task and write whatever is still pending"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "recorded": self.recorded,
+            "deduplicated": self.deduplicated,
+            "pending_businesses": len(self._pending),
+            "flushes": self.flushes,
+            "writes": self.writes,
+            "writes_saved": self.recorded - self.writes,
+        }
+
+
+view_counter = ViewCounter(
+    flush_interval=settings.view_flush_interval_seconds,
+    max_pending=settings.view_flush_max_pending,
+    dedup_window=settings.view_dedup_window_seconds,
+)